@@ -26,16 +26,16 @@ for p in gpx.walk(only_points=True):
     context.add_object(marker)
     break
 
-# render png via pillow
-image = context.render_pillow(800, 500)
-image.save("running.pillow.png")
-
-# render png via cairo
+# render png via pillow and cairo and svg from a single layout pass
+formats = ["pillow", "svg"]
 if staticmaps.cairo_is_supported():
-    cairo_image = context.render_cairo(800, 500)
-    cairo_image.write_to_png("running.cairo.png")
+    formats.append("cairo")
+images = context.render_many(800, 500, formats)
+
+images["pillow"].save("running.pillow.png")
+
+if "cairo" in images:
+    images["cairo"].write_to_png("running.cairo.png")
 
-# render svg
-svg_image = context.render_svg(800, 500)
 with open("running.svg", "w", encoding="utf-8") as f:
-    svg_image.write(f, pretty=True)
+    images["svg"].write(f, pretty=True)
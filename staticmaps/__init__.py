@@ -3,6 +3,8 @@
 
 # flake8: noqa
 from .area import Area
+from .async_tile_downloader import AsyncTileDownloader
+from .batch import BatchRenderer, BatchResult, context_from_spec, read_jobs, render_spec
 from .cairo_renderer import CairoRenderer, cairo_is_supported
 from .circle import Circle
 from .color import (
@@ -21,15 +23,32 @@ from .color import (
     TRANSPARENT,
 )
 from .context import Context
-from .coordinates import create_latlng, parse_latlng, parse_latlngs, parse_latlngs2rect
+from .coordinates import (
+    create_latlng,
+    latlngrect_from_radians,
+    latlngs_to_radians,
+    parse_latlng,
+    parse_latlngs,
+    parse_latlngs2rect,
+)
 from .image_marker import ImageMarker
 from .line import Line
 from .marker import Marker
+from .mbtiles_cache import MBTilesCache
+from .memory_cache import MemoryCache
 from .meta import GITHUB_URL, LIB_NAME, VERSION
 from .object import Object, PixelBoundsT
 from .pillow_renderer import PillowRenderer
-from .svg_renderer import SvgRenderer
-from .tile_downloader import TileDownloader
+from .rate_limiter import RateLimiter
+from .render_cache import RenderCache, stable_hash
+from .simplify import simplify_polyline
+from .single_flight import SingleFlight
+from .svg_renderer import CachedDrawing, StreamingSvgRenderer, SvgRenderer
+from .tile_cache import FileTileCache, TileCache, TileDataT, TileMetadata
+from .tile_downloader import TileDownloader, default_cache_dir
+from .tile_failures import CircuitBreaker, FailureCache
+from .tile_fetcher import TileFetcher, TileStatusError
+from .tile_pack import TilePack, TilePackCache, file_cache_tiles, write_tile_pack
 from .tile_provider import (
     TileProvider,
     default_tile_providers,
@@ -42,4 +61,5 @@ from .tile_provider import (
     tile_provider_CartoDarkNoLabels,
     tile_provider_None,
 )
+from .tile_seeder import SeedStats, TileSeeder, count_seed_tiles, seed_tile_keys
 from .transformer import Transformer
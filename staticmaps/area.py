@@ -5,10 +5,10 @@ import typing
 
 from PIL import Image as PIL_Image  # type: ignore
 from PIL import ImageDraw as PIL_ImageDraw  # type: ignore
-import s2sphere  # type: ignore
 
 from .cairo_renderer import CairoRenderer
 from .color import Color, RED, TRANSPARENT
+from .coordinates import LatLngsT
 from .line import Line
 from .pillow_renderer import PillowRenderer
 from .svg_renderer import SvgRenderer
@@ -18,13 +18,13 @@ class Area(Line):
     """Render an area using different renderers
 
     :param master: A line object
+    :param latlngs: coordinates of the area, either as LatLng objects or as flat sequence of latitude/longitude values
+        in degrees (lat0, lng0, lat1, lng1, ...), e.g. an array('d')
     """
 
-    def __init__(
-        self, latlngs: typing.List[s2sphere.LatLng], fill_color: Color = RED, color: Color = TRANSPARENT, width: int = 0
-    ) -> None:
+    def __init__(self, latlngs: LatLngsT, fill_color: Color = RED, color: Color = TRANSPARENT, width: int = 0) -> None:
         Line.__init__(self, latlngs, color, width)
-        if latlngs is None or len(latlngs) < 3:
+        if self.number_of_points() < 3:
             raise ValueError("Trying to create area with less than 3 coordinates")
 
         self._fill_color = fill_color
@@ -37,20 +37,30 @@ class Area(Line):
         """
         return self._fill_color
 
+    def content_key(self) -> typing.Optional[typing.Tuple[typing.Any, ...]]:
+        """Return everything that determines how the area is drawn
+
+        :return: content key, None for subclasses that do not provide their own key
+        :rtype: typing.Optional[typing.Tuple[typing.Any, ...]]
+        """
+        if self.__class__ is not Area:
+            return None
+        return "Area", self._coords.tobytes(), self.color().int_rgba(), self.width(), self._fill_color.int_rgba()
+
     def render_pillow(self, renderer: PillowRenderer) -> None:
         """Render area using PILLOW
 
         :param renderer: pillow renderer
         :type renderer: PillowRenderer
         """
-        xys = [
-            (x + renderer.offset_x(), y)
-            for (x, y) in [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
-        ]
-        overlay = PIL_Image.new("RGBA", renderer.image().size, (255, 255, 255, 0))
-        draw = PIL_ImageDraw.Draw(overlay)
-        draw.polygon(xys, fill=self.fill_color().int_rgba())
-        renderer.alpha_compose(overlay)
+        xys = [(x + renderer.offset_x(), y) for (x, y) in self.renderer_pixel_coordinates(renderer)]
+        rect = renderer.clipped_pixel_rect(xys)
+        if rect is not None:
+            left, top, right, bottom = rect
+            overlay = PIL_Image.new("RGBA", (right - left, bottom - top), (255, 255, 255, 0))
+            draw = PIL_ImageDraw.Draw(overlay)
+            draw.polygon([(x - left, y - top) for x, y in xys], fill=self.fill_color().int_rgba())
+            renderer.alpha_compose(overlay, (left, top))
         if self.width() > 0:
             renderer.draw().line(xys, fill=self.color().int_rgba(), width=self.width())
 
@@ -60,7 +70,7 @@ class Area(Line):
         :param renderer: svg renderer
         :type renderer: SvgRenderer
         """
-        xys = [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
+        xys = self.renderer_pixel_coordinates(renderer)
 
         polygon = renderer.drawing().polygon(
             xys,
@@ -85,7 +95,7 @@ class Area(Line):
         :param renderer: cairo renderer
         :type renderer: CairoRenderer
         """
-        xys = [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
+        xys = self.renderer_pixel_coordinates(renderer)
 
         renderer.context().set_source_rgba(*self.fill_color().float_rgba())
         renderer.context().new_path()
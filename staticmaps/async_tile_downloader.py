@@ -0,0 +1,50 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import asyncio
+import typing
+
+from .tile_cache import TileDataT
+from .tile_downloader import TileDownloader
+from .tile_provider import TileProvider
+
+
+class AsyncTileDownloader:
+    """An asynchronous tile downloader class
+
+    By default, tiles are fetched by a (blocking) TileDownloader that runs in the event loop's default executor.
+    Subclasses may override 'get' to fetch tiles with an asynchronous HTTP client instead.
+    """
+
+    def __init__(self, downloader: typing.Optional[TileDownloader] = None) -> None:
+        self._downloader = downloader if downloader is not None else TileDownloader()
+
+    def set_user_agent(self, user_agent: str) -> None:
+        """Set the user agent for the downloader
+
+        :param user_agent: user agent
+        :type user_agent: str
+        """
+        self._downloader.set_user_agent(user_agent)
+
+    async def get(
+        self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int
+    ) -> typing.Optional[TileDataT]:
+        """Get tiles
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param cache_dir: cache directory for tiles
+        :type cache_dir: str
+        :param zoom: zoom for static map
+        :type zoom: int
+        :param x: x value of center for the static map
+        :type x: int
+        :param y: y value of center for the static map
+        :type y: int
+        :return: tiles
+        :rtype: typing.Optional[TileDataT]
+        :raises RuntimeError: raises a runtime error if the the server response status is not 200
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self._downloader.get, provider, cache_dir, zoom, x, y)
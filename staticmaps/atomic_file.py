@@ -0,0 +1,37 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import contextlib
+import os
+import typing
+import uuid
+
+
+@contextlib.contextmanager
+def atomic_open(
+    file_name: str, mode: str = "wb", encoding: typing.Optional[str] = None
+) -> typing.Iterator[typing.IO[typing.Any]]:
+    """Open a temporary file next to file_name for writing, which replaces file_name when the block is left
+
+    Readers never see a partially written file (and memory maps of the old file stay valid); if the block raises an
+    exception, file_name is left unchanged.
+
+    :param file_name: name of the file to write
+    :type file_name: str
+    :param mode: writing mode, "wb" or "w"
+    :type mode: str
+    :param encoding: encoding for text mode
+    :type encoding: typing.Optional[str]
+    :return: file object of the temporary file
+    :rtype: typing.Iterator[typing.IO[typing.Any]]
+    """
+    directory, base_name = os.path.split(file_name)
+    temp_name = os.path.join(directory, f".{base_name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(temp_name, mode.replace("w", "x"), encoding=encoding) as f:
+            yield f
+        os.replace(temp_name, file_name)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(temp_name)
+        raise
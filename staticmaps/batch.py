@@ -0,0 +1,327 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import collections
+import concurrent.futures
+import json
+import os
+import time
+import typing
+
+from .area import Area
+from .cairo_renderer import cairo_is_supported
+from .color import parse_color
+from .context import Context
+from .coordinates import parse_latlng, parse_latlngs, parse_latlngs2rect
+from .line import Line
+from .marker import Marker
+from .memory_cache import MemoryCache
+from .tile_downloader import TileDownloader
+from .tile_provider import default_tile_providers, tile_provider_OSM
+
+JobSpecT = typing.Dict[str, typing.Any]
+DownloaderFactoryT = typing.Callable[[], TileDownloader]
+
+JOB_KEYS = {
+    "width",
+    "height",
+    "filename",
+    "renderer",
+    "center",
+    "zoom",
+    "background",
+    "marker",
+    "line",
+    "area",
+    "bounds",
+    "tiles",
+    "tiles_api_key",
+}
+
+# per-process state of the batch workers (tile downloader with warm memory cache, cache directory)
+_worker_state: typing.Dict[str, typing.Any] = {}
+
+
+class BatchResult:
+    """The result of rendering a single job of a batch
+
+    :param index: position of the job in the batch
+    :param file_name: output file name of the job
+    :param error: error message if the job failed
+    :param seconds: time spent rendering the job
+    """
+
+    def __init__(self, index: int, file_name: str, error: typing.Optional[str] = None, seconds: float = 0.0) -> None:
+        self._index = index
+        self._file_name = file_name
+        self._error = error
+        self._seconds = seconds
+
+    def index(self) -> int:
+        """Return the position of the job in the batch
+
+        :return: job index
+        :rtype: int
+        """
+        return self._index
+
+    def file_name(self) -> str:
+        """Return the output file name of the job
+
+        :return: file name
+        :rtype: str
+        """
+        return self._file_name
+
+    def error(self) -> typing.Optional[str]:
+        """Return the error message of a failed job
+
+        :return: error message, None if the job succeeded
+        :rtype: typing.Optional[str]
+        """
+        return self._error
+
+    def ok(self) -> bool:
+        """Return whether the job succeeded
+
+        :return: True if the output file has been written
+        :rtype: bool
+        """
+        return self._error is None
+
+    def seconds(self) -> float:
+        """Return the time spent rendering the job
+
+        :return: time in seconds
+        :rtype: float
+        """
+        return self._seconds
+
+
+def read_jobs(lines: typing.Iterable[str]) -> typing.Iterator[JobSpecT]:
+    """Parse job specs from JSON lines (one JSON object per line, empty lines are skipped)
+
+    :param lines: lines of a jobs file
+    :type lines: typing.Iterable[str]
+    :return: job specs
+    :rtype: typing.Iterator[JobSpecT]
+    :raises ValueError: raises value error if a line is not a JSON object
+    """
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            spec = json.loads(line)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Cannot parse job in line {number}: {e}") from e
+        if not isinstance(spec, dict):
+            raise ValueError(f"Cannot parse job in line {number}: not a JSON object")
+        yield spec
+
+
+def context_from_spec(spec: JobSpecT) -> Context:
+    """Create a context from a job spec
+
+    The keys of the spec correspond to the command line options of 'createstaticmap' ("center", "zoom", "background",
+    "marker", "line", "area", "bounds", "tiles", "tiles_api_key"); coordinates use the same string format, lines and
+    areas may also be given as flat lists of latitude/longitude values.
+
+    :param spec: job spec
+    :type spec: JobSpecT
+    :return: context
+    :rtype: Context
+    :raises ValueError: raises value error for unknown keys or bad values
+    """
+    unknown = set(spec.keys()) - JOB_KEYS
+    if unknown:
+        raise ValueError(f"Unknown job keys: {', '.join(sorted(unknown))}")
+
+    context = Context()
+    tiles = spec.get("tiles", tile_provider_OSM.name())
+    if tiles not in default_tile_providers:
+        raise ValueError(f"Unknown tile provider: {tiles}")
+    context.set_tile_provider(default_tile_providers[tiles], spec.get("tiles_api_key"))
+    if spec.get("center") is not None:
+        context.set_center(parse_latlng(spec["center"]))
+    if spec.get("zoom") is not None:
+        context.set_zoom(int(spec["zoom"]))
+    if spec.get("background") is not None:
+        context.set_background_color(parse_color(spec["background"]))
+    for coords in _as_list(spec.get("area")):
+        context.add_object(Area(parse_latlngs(coords) if isinstance(coords, str) else coords))
+    for coords in _as_list(spec.get("line")):
+        context.add_object(Line(parse_latlngs(coords) if isinstance(coords, str) else coords))
+    for coords in _as_list(spec.get("marker")):
+        context.add_object(Marker(parse_latlng(coords)))
+    if spec.get("bounds") is not None:
+        context.add_bounds(parse_latlngs2rect(spec["bounds"]))
+    return context
+
+
+def render_spec(spec: JobSpecT, context: typing.Optional[Context] = None) -> str:
+    """Render a job spec and write the resulting image
+
+    The renderer ("pillow", "cairo" or "svg") is taken from the "renderer" key or guessed from the file name
+    (".png" => "cairo" like the command line tool, or "pillow" if cairo is not available; ".svg" => "svg").
+
+    :param spec: job spec
+    :type spec: JobSpecT
+    :param context: context created from the spec (optional)
+    :type context: typing.Optional[Context]
+    :return: name of the written file
+    :rtype: str
+    :raises ValueError: raises value error for bad specs
+    :raises RuntimeError: raises runtime error if the map cannot be rendered
+    """
+    for key in ("width", "height", "filename"):
+        if key not in spec:
+            raise ValueError(f'Job is missing "{key}"')
+    width = int(spec["width"])
+    height = int(spec["height"])
+    file_name = str(spec["filename"])
+    renderer = spec.get("renderer")
+    if renderer is None:
+        png_renderer = "cairo" if cairo_is_supported() else "pillow"
+        renderer = {".png": png_renderer, ".svg": "svg"}.get(os.path.splitext(file_name)[1].lower())
+        if renderer is None:
+            raise ValueError(f"Cannot guess the renderer from the given file name: {file_name}")
+    if context is None:
+        context = context_from_spec(spec)
+
+    image = context.render_many(width, height, [renderer])[renderer]
+    if renderer == "pillow":
+        image.save(file_name)
+    elif renderer == "cairo":
+        image.write_to_png(file_name)
+    else:
+        with open(file_name, "w", encoding="utf-8") as f:
+            image.write(f, pretty=True)
+    return file_name
+
+
+class BatchRenderer:
+    """Render a stream of job specs (see context_from_spec and render_spec) using a pool of worker processes
+
+    Each worker process keeps its own tile downloader with an in-memory tile cache, so tiles shared by consecutive
+    jobs are only read once per worker.
+
+    :param workers: number of worker processes (default: number of CPUs); 1 renders in the calling process
+    :param downloader_factory: callable creating the tile downloader of a worker (must be picklable)
+    """
+
+    def __init__(
+        self, workers: typing.Optional[int] = None, downloader_factory: DownloaderFactoryT = TileDownloader
+    ) -> None:
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError(f"Bad number of batch workers: {workers}")
+        self._workers = workers
+        self._downloader_factory = downloader_factory
+        self._cache_dir: typing.Optional[str] = None
+        self._memory_cache_bytes = 64 * 1024 * 1024
+
+    def workers(self) -> int:
+        """Return the number of worker processes
+
+        :return: number of workers
+        :rtype: int
+        """
+        return self._workers
+
+    def set_cache_dir(self, directory: str) -> None:
+        """Set the tile cache directory used by all jobs
+
+        :param directory: cache directory
+        :type directory: str
+        """
+        self._cache_dir = directory
+
+    def set_memory_cache_bytes(self, max_bytes: int) -> None:
+        """Set the size of the in-memory tile cache of each worker
+
+        :param max_bytes: maximum size in bytes (0 = no memory cache)
+        :type max_bytes: int
+        :raises ValueError: raises value error for a negative size
+        """
+        if max_bytes < 0:
+            raise ValueError(f"Bad memory cache size: {max_bytes}")
+        self._memory_cache_bytes = max_bytes
+
+    def render(self, specs: typing.Iterable[JobSpecT], ordered: bool = True) -> typing.Iterator[BatchResult]:
+        """Render all job specs, yielding a result for each job as soon as it is available
+
+        Failing jobs do not stop the batch; their results carry the error message. Only a bounded number of jobs is
+        submitted to the workers at any time, so 'specs' may be a lazy stream of arbitrary length.
+
+        :param specs: job specs
+        :type specs: typing.Iterable[JobSpecT]
+        :param ordered: yield the results in the order of the jobs (otherwise in order of completion)
+        :type ordered: bool
+        :return: results
+        :rtype: typing.Iterator[BatchResult]
+        """
+        init_args = (self._downloader_factory, self._cache_dir, self._memory_cache_bytes)
+        if self._workers == 1:
+            _init_worker(*init_args)
+            for index, spec in enumerate(specs):
+                yield _render_job(index, spec)
+            return
+
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._workers, initializer=_init_worker, initargs=init_args
+        ) as executor:
+            jobs = enumerate(specs)
+            pending: typing.Deque[concurrent.futures.Future] = collections.deque()
+            max_pending = 4 * self._workers
+            while True:
+                for index, spec in jobs:
+                    pending.append(executor.submit(_render_job, index, spec))
+                    if len(pending) >= max_pending:
+                        break
+                if not pending:
+                    return
+                if ordered:
+                    yield pending.popleft().result()
+                    continue
+                done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+
+
+def _as_list(value: typing.Any) -> typing.List[typing.Any]:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        # a flat list of numbers is a single line/area
+        if value and all(isinstance(v, (int, float)) for v in value):
+            return [value]
+        return value
+    return [value]
+
+
+def _init_worker(
+    downloader_factory: DownloaderFactoryT, cache_dir: typing.Optional[str], memory_cache_bytes: int
+) -> None:
+    downloader = downloader_factory()
+    if memory_cache_bytes > 0:
+        downloader.set_memory_cache(MemoryCache(memory_cache_bytes, len))
+    _worker_state["downloader"] = downloader
+    _worker_state["cache_dir"] = cache_dir
+
+
+def _render_job(index: int, spec: JobSpecT) -> BatchResult:
+    start = time.perf_counter()
+    file_name = str(spec.get("filename", ""))
+    try:
+        context = context_from_spec(spec)
+        context.set_tile_downloader(_worker_state["downloader"])
+        if _worker_state["cache_dir"] is not None:
+            context.set_cache_dir(_worker_state["cache_dir"])
+        render_spec(spec, context)
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        # a failing job must not stop the batch
+        return BatchResult(index, file_name, str(e), time.perf_counter() - start)
+    return BatchResult(index, file_name, None, time.perf_counter() - start)
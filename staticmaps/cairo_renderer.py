@@ -2,7 +2,6 @@
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
 import io
-import math
 import sys
 import typing
 
@@ -14,7 +13,9 @@ except ImportError:
 from PIL import Image as PIL_Image  # type: ignore
 
 from .color import Color, BLACK, WHITE
-from .renderer import Renderer
+from .memory_cache import MemoryCache
+from .renderer import MosaicKeyT, Renderer, image_key
+from .tile_cache import TileDataT
 from .transformer import Transformer
 
 if typing.TYPE_CHECKING:
@@ -39,6 +40,12 @@ cairo_ImageSurface = typing.Any  # pylint: disable=invalid-name
 class CairoRenderer(Renderer):
     """An image renderer using cairo that extends a generic renderer class"""
 
+    _image_cache: typing.Optional[MemoryCache[bytes, cairo_ImageSurface]] = MemoryCache(
+        32 * 1024 * 1024, lambda surface: surface.get_stride() * surface.get_height()
+    )
+    _mosaic_cache: typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, cairo_ImageSurface]]] = None
+    _mosaic_max_age = 3600.0
+
     def __init__(self, transformer: Transformer) -> None:
         Renderer.__init__(self, transformer)
 
@@ -64,22 +71,74 @@ class CairoRenderer(Renderer):
         """
         return self._context
 
-    @staticmethod
-    def create_image(image_data: bytes) -> cairo_ImageSurface:
+    @classmethod
+    def set_image_cache(cls, cache: typing.Optional[MemoryCache[bytes, cairo_ImageSurface]]) -> None:
+        """Set the cache of decoded images (tiles, image markers) shared by all cairo renderers
+
+        The cache is keyed by a digest of the encoded image data (see image_key); cached surfaces must not be
+        modified.
+
+        :param cache: cache of decoded images, None to disable caching
+        :type cache: typing.Optional[MemoryCache[bytes, cairo.ImageSurface]]
+        """
+        cls._image_cache = cache
+
+    @classmethod
+    def image_cache(cls) -> typing.Optional[MemoryCache[bytes, cairo_ImageSurface]]:
+        """Return the cache of decoded images
+
+        :return: cache of decoded images
+        :rtype: typing.Optional[MemoryCache[bytes, cairo.ImageSurface]]
+        """
+        return cls._image_cache
+
+    @classmethod
+    def create_image(cls, image_data: TileDataT) -> cairo_ImageSurface:
         """Create a cairo image
 
         :param image_data: Image data
-        :type image_data: bytes
+        :type image_data: bytes, memoryview
 
         :return: cairo image surface
         :rtype: cairo.ImageSurface
         """
+        cache = cls._image_cache
+        if cache is None:
+            return cls._decode_image(image_data)
+        key = image_key(image_data)
+        surface = cache.get(key)
+        if surface is None:
+            surface = cls._decode_image(image_data)
+            cache.put(key, surface)
+        return surface
+
+    @classmethod
+    def _decode_image(cls, image_data: TileDataT) -> cairo_ImageSurface:
         image = PIL_Image.open(io.BytesIO(image_data))
         if image.format == "PNG":
             return cairo.ImageSurface.create_from_png(io.BytesIO(image_data))
+        return cls.create_surface(image)
+
+    @staticmethod
+    def create_surface(image: PIL_Image.Image) -> cairo_ImageSurface:
+        """Create a cairo image surface from a pillow image without re-encoding the image
+
+        :param image: pillow image
+        :type image: PIL.Image
+
+        :return: cairo image surface
+        :rtype: cairo.ImageSurface
+        """
+        if image.mode != "RGBA":
+            image = image.convert("RGBA")
+        width, height = image.size
+        stride = cairo.ImageSurface.format_stride_for_width(cairo.FORMAT_ARGB32, width)
+        if sys.byteorder == "little" and stride == 4 * width:
+            # FORMAT_ARGB32 stores premultiplied pixels as native-endian 32bit words, i.e. as B, G, R, A bytes.
+            data = bytearray(image.tobytes("raw", "BGRa"))
+            return cairo.ImageSurface.create_for_data(data, cairo.FORMAT_ARGB32, width, height, stride)
         png_bytes = io.BytesIO()
         image.save(png_bytes, format="PNG")
-        png_bytes.flush()
         png_bytes.seek(0)
         return cairo.ImageSurface.create_from_png(png_bytes)
 
@@ -89,11 +148,10 @@ class CairoRenderer(Renderer):
         :param objects: objects of static map
         :type objects: typing.List["Object"]
         """
-        x_count = math.ceil(self._trans.image_width() / (2 * self._trans.world_width()))
         for obj in objects:
-            for p in range(-x_count, x_count + 1):
+            for offset_x in self.visible_world_offsets(obj):
                 self._context.save()
-                self._context.translate(p * self._trans.world_width(), 0)
+                self._context.translate(offset_x, 0)
                 obj.render_cairo(self)
                 self._context.restore()
 
@@ -109,32 +167,90 @@ class CairoRenderer(Renderer):
         self._context.rectangle(0, 0, *self._trans.image_size())
         self._context.fill()
 
-    def render_tiles(self, download: typing.Callable[[int, int, int], typing.Optional[bytes]]) -> None:
+    def render_tiles(self, download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]) -> bool:
         """Render background of static map
 
         :param download: url of tiles provider
-        :type download: typing.Callable[[int, int, int], typing.Optional[bytes]]
+        :type download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]
+        :return: True if no tile failed to download
+        :rtype: bool
+        """
+        complete = True
+        for xx, yy, x, y in self._trans.tiles():
+            try:
+                tile_img = self.fetch_tile(download, x, y)
+                if tile_img is None:
+                    continue
+                self._context.save()
+                self._context.translate(
+                    xx * self._trans.tile_size() + self._trans.tile_offset_x(),
+                    yy * self._trans.tile_size() + self._trans.tile_offset_y(),
+                )
+                self._context.set_source_surface(tile_img)
+                self._context.paint()
+                self._context.restore()
+            except RuntimeError:
+                complete = False
+        return complete
+
+    @classmethod
+    def set_mosaic_cache(
+        cls,
+        cache: typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, cairo_ImageSurface]]],
+        max_age: float = 3600.0,
+    ) -> None:
+        """Set the cache of stitched basemaps shared by all cairo renderers (see Renderer.render_basemap)
+
+        The cache holds pairs of the creation time and the basemap (see Renderer.cached_mosaic). Cached basemaps do not
+        follow the cache ttl and Cache-Control max-age of the tiles; each one is stitched again max_age seconds after it
+        was cached, so updated tiles show up after at most max_age seconds (plus the tile ttl).
+
+        :param cache: cache of basemaps, None to disable caching (default)
+        :type cache: typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, cairo.ImageSurface]]]
+        :param max_age: maximum age of cached basemaps in seconds, math.inf to keep them until they are evicted
+        :type max_age: float
+        :raises ValueError: raises value error for a non-positive max age
         """
-        for yy in range(0, self._trans.tiles_y()):
-            y = self._trans.first_tile_y() + yy
-            if y < 0 or y >= self._trans.number_of_tiles():
-                continue
-            for xx in range(0, self._trans.tiles_x()):
-                x = (self._trans.first_tile_x() + xx) % self._trans.number_of_tiles()
-                try:
-                    tile_img = self.fetch_tile(download, x, y)
-                    if tile_img is None:
-                        continue
-                    self._context.save()
-                    self._context.translate(
-                        xx * self._trans.tile_size() + self._trans.tile_offset_x(),
-                        yy * self._trans.tile_size() + self._trans.tile_offset_y(),
-                    )
-                    self._context.set_source_surface(tile_img)
-                    self._context.paint()
-                    self._context.restore()
-                except RuntimeError:
-                    pass
+        if max_age <= 0:
+            raise ValueError(f"Bad mosaic max age: {max_age}")
+        cls._mosaic_cache = cache
+        cls._mosaic_max_age = max_age
+
+    @classmethod
+    def mosaic_cache(cls) -> typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, cairo_ImageSurface]]]:
+        return cls._mosaic_cache
+
+    @classmethod
+    def mosaic_max_age(cls) -> float:
+        return cls._mosaic_max_age
+
+    def load_mosaic(self, mosaic: cairo_ImageSurface) -> None:
+        self._context.save()
+        self._context.set_operator(cairo.OPERATOR_SOURCE)
+        self._context.set_source_surface(mosaic)
+        self._context.paint()
+        self._context.restore()
+
+    def save_mosaic(self) -> cairo_ImageSurface:
+        mosaic = cairo.ImageSurface(cairo.FORMAT_ARGB32, *self._trans.image_size())
+        context = cairo.Context(mosaic)
+        context.set_operator(cairo.OPERATOR_SOURCE)
+        context.set_source_surface(self._surface)
+        context.paint()
+        return mosaic
+
+    def result(self) -> cairo_ImageSurface:
+        return self._surface
+
+    @staticmethod
+    def encode_result(result: cairo_ImageSurface) -> bytes:
+        buffer = io.BytesIO()
+        result.write_to_png(buffer)
+        return buffer.getvalue()
+
+    @staticmethod
+    def decode_result(data: bytes) -> cairo_ImageSurface:
+        return cairo.ImageSurface.create_from_png(io.BytesIO(data))
 
     def render_attribution(self, attribution: typing.Optional[str]) -> None:
         """Render attribution from given tiles provider
@@ -164,14 +280,14 @@ class CairoRenderer(Renderer):
         self._context.stroke()
 
     def fetch_tile(
-        self, download: typing.Callable[[int, int, int], typing.Optional[bytes]], x: int, y: int
+        self, download: typing.Callable[[int, int, int], typing.Optional[TileDataT]], x: int, y: int
     ) -> typing.Optional[cairo_ImageSurface]:
         """Fetch tiles from given tiles provider
 
         :param download: callable
         :param x: width
         :param y: height
-        :type download: typing.Callable[[int, int, int], typing.Optional[bytes]]
+        :type download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]
         :type x: int
         :type y: int
 
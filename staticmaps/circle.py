@@ -1,6 +1,7 @@
 # py-staticmaps
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
+from array import array
 import typing
 
 from geographiclib.geodesic import Geodesic  # type: ignore
@@ -25,7 +26,27 @@ class Circle(Area):
         color: Color = TRANSPARENT,
         width: int = 0,
     ) -> None:
-        Area.__init__(self, list(Circle.compute_circle(center, radius_km)), fill_color, color, width)
+        Area.__init__(self, Circle.compute_circle_coordinates(center, radius_km), fill_color, color, width)
+        self._center = center
+        self._radius_km = radius_km
+
+    def content_key(self) -> typing.Optional[typing.Tuple[typing.Any, ...]]:
+        """Return everything that determines how the circle is drawn
+
+        :return: content key, None for subclasses that do not provide their own key
+        :rtype: typing.Optional[typing.Tuple[typing.Any, ...]]
+        """
+        if self.__class__ is not Circle:
+            return None
+        return (
+            "Circle",
+            self._center.lat().radians,
+            self._center.lng().radians,
+            self._radius_km,
+            self.color().int_rgba(),
+            self.width(),
+            self.fill_color().int_rgba(),
+        )
 
     @staticmethod
     def compute_circle(center: s2sphere.LatLng, radius_km: float) -> typing.Iterator[s2sphere.LatLng]:
@@ -39,7 +60,23 @@ class Circle(Area):
         :return: circle
         :rtype: typing.Iterator[s2sphere.LatLng]
         """
-        first = None
+        coords = Circle.compute_circle_coordinates(center, radius_km)
+        for i in range(0, len(coords), 2):
+            yield create_latlng(coords[i], coords[i + 1])
+
+    @staticmethod
+    def compute_circle_coordinates(center: s2sphere.LatLng, radius_km: float) -> "array[float]":
+        """Compute a circle with given center and radius as flat array of latitude/longitude values in degrees
+
+        :param center: Center of the circle
+        :param radius_km: Radius of the circle
+        :type center: s2sphere.LatLng
+        :type radius_km: float
+
+        :return: circle (lat0, lng0, lat1, lng1, ...)
+        :rtype: array[float]
+        """
+        coords = array("d")
         delta_angle = 0.1
         angle = 0.0
         geod = Geodesic.WGS84
@@ -51,10 +88,8 @@ class Circle(Area):
                 radius_km * 1000.0,
                 Geodesic.LONGITUDE | Geodesic.LATITUDE | Geodesic.LONG_UNROLL,
             )
-            latlng = create_latlng(d["lat2"], d["lon2"])
-            if first is None:
-                first = latlng
-            yield latlng
+            coords.extend((d["lat2"], d["lon2"]))
             angle = angle + delta_angle
-        if first:
-            yield first
+        if coords:
+            coords.extend(coords[0:2])
+        return coords
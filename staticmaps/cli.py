@@ -6,6 +6,8 @@
 import argparse
 import enum
 import os
+import sys
+import typing
 
 import staticmaps
 
@@ -27,6 +29,57 @@ def determine_file_format(file_format: FileFormat, file_name: str) -> FileFormat
     raise RuntimeError("Cannot guess the image type from the given file name: {file_name}")
 
 
+def run_batch(jobs_file: str, workers: typing.Optional[int], ordered: bool) -> bool:
+    renderer = staticmaps.BatchRenderer(workers)
+    with open(jobs_file, "r", encoding="utf-8") if jobs_file != "-" else sys.stdin as f:
+        failed = 0
+        for result in renderer.render(staticmaps.read_jobs(f), ordered):
+            if result.ok():
+                print(f"wrote result image to {result.file_name()}")
+            else:
+                failed += 1
+                print(f"failed to render job {result.index()} ({result.file_name()}): {result.error()}")
+    return failed == 0
+
+
+def parse_zoom_range(s: str) -> typing.Tuple[int, int]:
+    a = s.split("-")
+    if len(a) == 1:
+        return int(a[0]), int(a[0])
+    if len(a) == 2:
+        return int(a[0]), int(a[1])
+    raise argparse.ArgumentTypeError(f"Cannot parse zoom range: {s}")
+
+
+def run_seed(args: argparse.Namespace) -> bool:
+    provider = staticmaps.default_tile_providers[args.tiles]
+    if args.tiles_api_key:
+        provider.set_api_key(args.tiles_api_key)
+    cache_dir = args.cache_dir if args.cache_dir is not None else staticmaps.default_cache_dir()
+    seeder = staticmaps.TileSeeder(staticmaps.TileDownloader(), provider, cache_dir)
+    if args.workers is not None:
+        seeder.set_workers(args.workers)
+    seeder.set_rate_limit(args.rate)
+
+    last_report = [0.0]
+
+    def report(stats: staticmaps.SeedStats) -> None:
+        if stats.processed() < stats.total() and stats.elapsed() - last_report[0] < 1.0:
+            return
+        last_report[0] = stats.elapsed()
+        print(
+            f"{stats.processed()}/{stats.total()} tiles"
+            f" ({stats.cached()} cached, {stats.downloaded()} downloaded, {stats.failed()} failed),"
+            f" {stats.tiles_per_second():.1f} tiles/s, {stats.bytes_per_second() / 1024:.1f} KiB/s"
+        )
+
+    seeder.set_progress_callback(report)
+    min_zoom, max_zoom = args.seed
+    stats = seeder.seed(staticmaps.parse_latlngs2rect(args.bounds), min_zoom, max_zoom)
+    print(f"seeded {stats.total()} tiles in {stats.elapsed():.1f}s")
+    return stats.failed() == 0
+
+
 def main() -> None:
     args_parser = argparse.ArgumentParser(prog="createstaticmap")
     args_parser.add_argument(
@@ -43,13 +96,11 @@ def main() -> None:
         "--width",
         metavar="WIDTH",
         type=int,
-        required=True,
     )
     args_parser.add_argument(
         "--height",
         metavar="HEIGHT",
         type=int,
-        required=True,
     )
     args_parser.add_argument(
         "--background",
@@ -100,38 +151,81 @@ def main() -> None:
         choices=FileFormat,
         default=FileFormat.GUESS,
     )
+    args_parser.add_argument(
+        "--batch",
+        metavar="JOBS",
+        type=str,
+        help="render all maps of a JSON lines file (one job per line, '-' for stdin) using a pool of processes; "
+        "PNG files are rendered with cairo, or with pillow if cairo is not available",
+    )
+    args_parser.add_argument(
+        "--workers",
+        metavar="N",
+        type=int,
+        default=None,
+        help="number of worker processes for --batch (default: number of CPUs) or download threads for --seed",
+    )
+    args_parser.add_argument(
+        "--seed",
+        metavar="MINZOOM-MAXZOOM",
+        type=parse_zoom_range,
+        help="download all tiles covering --bounds in the zoom range into the tile cache",
+    )
+    args_parser.add_argument(
+        "--rate",
+        metavar="TILES_PER_SECOND",
+        type=float,
+        help="maximum number of tile downloads per second for --seed",
+    )
+    args_parser.add_argument(
+        "--cache-dir",
+        dest="cache_dir",
+        metavar="DIR",
+        type=str,
+        help="tile cache directory for --seed",
+    )
+    args_parser.add_argument(
+        "--unordered",
+        action="store_true",
+        help="report --batch results in order of completion",
+    )
     args_parser.add_argument(
         "filename",
         metavar="FILE",
         type=str,
-        nargs=1,
+        nargs="?",
     )
 
     args = args_parser.parse_args()
 
-    context = staticmaps.Context()
-
-    context.set_tile_provider(staticmaps.default_tile_providers[args.tiles], args.tiles_api_key)
-
-    if args.center is not None:
-        context.set_center(staticmaps.parse_latlng(args.center))
-    if args.zoom is not None:
-        context.set_zoom(args.zoom)
-    if args.background is not None:
-        context.set_background_color(staticmaps.parse_color(args.background))
-    if args.area:
-        for coords in args.area:
-            context.add_object(staticmaps.Area(staticmaps.parse_latlngs(coords)))
-    if args.line:
-        for coords in args.line:
-            context.add_object(staticmaps.Line(staticmaps.parse_latlngs(coords)))
-    if args.marker:
-        for coords in args.marker:
-            context.add_object(staticmaps.Marker(staticmaps.parse_latlng(coords)))
-    if args.bounds is not None:
-        context.add_bounds(staticmaps.parse_latlngs2rect(args.bounds))
-
-    file_name = args.filename[0]
+    if args.batch is not None:
+        if not run_batch(args.batch, args.workers, not args.unordered):
+            sys.exit(1)
+        return
+    if args.seed is not None:
+        if args.bounds is None:
+            args_parser.error("--seed requires --bounds")
+        if not run_seed(args):
+            sys.exit(1)
+        return
+    if args.width is None or args.height is None or args.filename is None:
+        args_parser.error("the following arguments are required: --width, --height, FILE")
+
+    context = staticmaps.context_from_spec(
+        {
+            "tiles": args.tiles,
+            "tiles_api_key": args.tiles_api_key,
+            "center": args.center,
+            "zoom": args.zoom,
+            "background": args.background,
+            "area": args.area,
+            "line": args.line,
+            "marker": args.marker,
+            "bounds": args.bounds,
+        }
+    )
+
+    file_name = args.filename
     if determine_file_format(args.file_format, file_name) == FileFormat.PNG:
         image = context.render_cairo(args.width, args.height)
         image.write_to_png(file_name)
@@ -1,28 +1,34 @@
 # py-staticmaps
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
-import math
-import os
+# pylint: disable=too-many-lines
+
+import asyncio
 import typing
 
-import appdirs  # type: ignore
 import s2sphere  # type: ignore
 import svgwrite  # type: ignore
 from PIL import Image as PIL_Image  # type: ignore
 
+from .async_tile_downloader import AsyncTileDownloader
 from .cairo_renderer import CairoRenderer, cairo_is_supported
 from .color import Color
-from .meta import LIB_NAME
+from .layout import adjust_center, center_of_bounds, clamp_zoom, zoom_for_bounds
+from .meta import VERSION
 from .object import Object, PixelBoundsT
 from .pillow_renderer import PillowRenderer
-from .svg_renderer import SvgRenderer
-from .tile_downloader import TileDownloader
+from .render_cache import ContentKeyT, RenderCache, provider_key, rect_key, stable_hash
+from .renderer import Renderer, mosaic_key
+from .svg_renderer import StreamingSvgRenderer, SvgRenderer
+from .tile_cache import TileDataT
+from .tile_downloader import TileDownloader, default_cache_dir
 from .tile_provider import TileProvider, tile_provider_OSM
+from .tile_prefetcher import CachedTilesT, DownloadT, prefetch_tiles, prefetch_tiles_async, tile_keys
 from .transformer import Transformer
 
 
 class Context:
-    # pylint: disable=too-many-instance-attributes
+    # pylint: disable=too-many-instance-attributes,too-many-public-methods
     def __init__(self) -> None:
         self._background_color: typing.Optional[Color] = None
         self._objects: typing.List[Object] = []
@@ -32,7 +38,12 @@ class Context:
         self._zoom: typing.Optional[int] = None
         self._tile_provider = tile_provider_OSM
         self._tile_downloader = TileDownloader()
-        self._cache_dir = os.path.join(appdirs.user_cache_dir(LIB_NAME), "tiles")
+        self._async_tile_downloader: typing.Optional[AsyncTileDownloader] = None
+        self._tile_fetch_workers = 8
+        self._simplification_tolerance = 0.0
+        self._cache_dir = default_cache_dir()
+        self._layouts: typing.Dict[typing.Tuple[int, int], Transformer] = {}
+        self._render_cache: typing.Optional[RenderCache] = None
 
     def set_zoom(self, zoom: int) -> None:
         """Set zoom for static map
@@ -44,6 +55,7 @@ class Context:
         if zoom < 0 or zoom > 30:
             raise ValueError(f"Bad zoom value: {zoom}")
         self._zoom = zoom
+        self._layouts.clear()
 
     def set_center(self, latlng: s2sphere.LatLng) -> None:
         """Set center for static map
@@ -52,6 +64,7 @@ class Context:
         :type latlng: s2sphere.LatLng
         """
         self._center = latlng
+        self._layouts.clear()
 
     def set_background_color(self, color: Color) -> None:
         """Set background color for static map
@@ -77,6 +90,61 @@ class Context:
         """
         self._tile_downloader = downloader
 
+    def set_async_tile_downloader(self, downloader: AsyncTileDownloader) -> None:
+        """Set the tile downloader used by the asynchronous render methods
+
+        If no asynchronous tile downloader is set, the (blocking) tile downloader is run in the event loop's default
+        executor.
+
+        :param downloader: asynchronous tile downloader
+        :type downloader: AsyncTileDownloader
+        """
+        self._async_tile_downloader = downloader
+
+    def set_render_cache(self, cache: typing.Optional[RenderCache]) -> None:
+        """Set the cache of rendered maps consulted by render_cairo, render_pillow, render_svg, their async variants and
+        render_many
+
+        Maps with the same content hash (see content_hash) are then only rendered once; maps with missing tiles are not
+        cached. A cache can be shared by several contexts, e.g. by all requests of a web service.
+
+        :param cache: cache of rendered maps, None to disable caching (default)
+        :type cache: typing.Optional[RenderCache]
+        """
+        self._render_cache = cache
+
+    def render_cache(self) -> typing.Optional[RenderCache]:
+        """Return the cache of rendered maps
+
+        :return: cache of rendered maps, None if caching is disabled
+        :rtype: typing.Optional[RenderCache]
+        """
+        return self._render_cache
+
+    def set_tile_fetch_workers(self, workers: int) -> None:
+        """Set the maximum number of tiles that are fetched concurrently
+
+        :param workers: number of worker threads used for fetching tiles
+        :type workers: int
+        :raises ValueError: raises value error for a worker count < 1
+        """
+        if workers < 1:
+            raise ValueError(f"Bad number of tile fetch workers: {workers}")
+        self._tile_fetch_workers = workers
+
+    def set_simplification_tolerance(self, tolerance: float) -> None:
+        """Set the tolerance for simplifying lines and areas when rendering
+
+        Points that are closer than 'tolerance' pixels to the simplified line are dropped.
+
+        :param tolerance: tolerance in pixels (0 = no simplification)
+        :type tolerance: float
+        :raises ValueError: raises a value error for a negative tolerance
+        """
+        if tolerance < 0:
+            raise ValueError(f"Bad simplification tolerance: {tolerance}")
+        self._simplification_tolerance = tolerance
+
     def set_tile_provider(self, provider: TileProvider, api_key: typing.Optional[str] = None) -> None:
         """Set tile provider
 
@@ -88,6 +156,7 @@ class Context:
         self._tile_provider = provider
         if api_key:
             self._tile_provider.set_api_key(api_key)
+        self._layouts.clear()
 
     def add_object(self, obj: Object) -> None:
         """Add object for the static map (e.g. line, area, marker)
@@ -96,6 +165,7 @@ class Context:
         :type obj: Object
         """
         self._objects.append(obj)
+        self._layouts.clear()
 
     def add_bounds(
         self,
@@ -110,6 +180,7 @@ class Context:
         :type extra_pixel_bounds: int, tuple
         """
         self._bounds = latlngrect
+        self._layouts.clear()
         if extra_pixel_bounds:
             if isinstance(extra_pixel_bounds, tuple):
                 self._extra_pixel_bounds = extra_pixel_bounds
@@ -121,6 +192,64 @@ class Context:
                     extra_pixel_bounds,
                 )
 
+    def transformer(self, width: int, height: int) -> Transformer:
+        """Return the layout (center, zoom, projection) of a static map of the given size
+
+        The layout is computed once per size and reused until the context is modified (objects, bounds, center, zoom
+        or tile provider); it can be passed to any of the renderers.
+
+        :param width: width of static map
+        :type width: int
+        :param height: height of static map
+        :type height: int
+        :return: transformer describing the layout of the static map
+        :rtype: Transformer
+        :raises RuntimeError: raises runtime error if map has no center and zoom
+        """
+        trans = self._layouts.get((width, height))
+        if trans is None:
+            center, zoom = self.determine_center_zoom(width, height)
+            if center is None or zoom is None:
+                raise RuntimeError("Cannot render map without center/zoom.")
+            trans = Transformer(width, height, zoom, center, self._tile_provider.tile_size())
+            self._layouts[(width, height)] = trans
+        return trans
+
+    def content_hash(self, width: int, height: int) -> typing.Optional[str]:
+        """Return a stable hash of everything that determines the static map of the given size
+
+        The hash covers the objects (see Object.content_key), the tile provider, center, zoom, bounds, background color,
+        simplification tolerance and the size; it is the same in every process, so it can be used as key of persistent
+        caches.
+
+        :param width: width of static map
+        :type width: int
+        :param height: height of static map
+        :type height: int
+        :return: hex digest, None if an object does not provide a content key
+        :rtype: typing.Optional[str]
+        """
+        key = self._content_key(width, height)
+        return None if key is None else stable_hash(key)
+
+    def _content_key(self, width: int, height: int) -> typing.Optional[ContentKeyT]:
+        objects = tuple(obj.content_key() for obj in self._objects)
+        if any(key is None for key in objects):
+            return None
+        return (
+            VERSION,
+            width,
+            height,
+            provider_key(self._tile_provider),
+            None if self._center is None else (self._center.lat().radians, self._center.lng().radians),
+            self._zoom,
+            None if self._bounds is None else rect_key(self._bounds),
+            self._extra_pixel_bounds,
+            None if self._background_color is None else self._background_color.int_rgba(),
+            self._simplification_tolerance,
+            objects,
+        )
+
     def render_cairo(self, width: int, height: int) -> typing.Any:
         """Render area using cairo
 
@@ -136,19 +265,7 @@ class Context:
         if not cairo_is_supported():
             raise RuntimeError('You need to install the "cairo" module to enable "render_cairo".')
 
-        center, zoom = self.determine_center_zoom(width, height)
-        if center is None or zoom is None:
-            raise RuntimeError("Cannot render map without center/zoom.")
-
-        trans = Transformer(width, height, zoom, center, self._tile_provider.tile_size())
-
-        renderer = CairoRenderer(trans)
-        renderer.render_background(self._background_color)
-        renderer.render_tiles(self._fetch_tile)
-        renderer.render_objects(self._objects)
-        renderer.render_attribution(self._tile_provider.attribution())
-
-        return renderer.image_surface()
+        return self._render_cached(width, height, "cairo", CairoRenderer)
 
     def render_pillow(self, width: int, height: int) -> PIL_Image.Image:
         """Render context using PILLOW
@@ -161,19 +278,7 @@ class Context:
         :rtype: PIL_Image
         :raises RuntimeError: raises runtime error if map has no center and zoom
         """
-        center, zoom = self.determine_center_zoom(width, height)
-        if center is None or zoom is None:
-            raise RuntimeError("Cannot render map without center/zoom.")
-
-        trans = Transformer(width, height, zoom, center, self._tile_provider.tile_size())
-
-        renderer = PillowRenderer(trans)
-        renderer.render_background(self._background_color)
-        renderer.render_tiles(self._fetch_tile)
-        renderer.render_objects(self._objects)
-        renderer.render_attribution(self._tile_provider.attribution())
-
-        return renderer.image()
+        return self._render_cached(width, height, "pillow", PillowRenderer)
 
     def render_svg(self, width: int, height: int) -> svgwrite.Drawing:
         """Render context using svgwrite
@@ -186,19 +291,165 @@ class Context:
         :rtype: svgwrite.Drawing
         :raises RuntimeError: raises runtime error if map has no center and zoom
         """
-        center, zoom = self.determine_center_zoom(width, height)
-        if center is None or zoom is None:
-            raise RuntimeError("Cannot render map without center/zoom.")
+        return self._render_cached(width, height, "svg", SvgRenderer)
+
+    def write_svg(self, width: int, height: int, fileobj: typing.IO[str]) -> None:
+        """Render context as svg document, writing the elements to a file-like object as soon as they are rendered
 
-        trans = Transformer(width, height, zoom, center, self._tile_provider.tile_size())
+        The output is the same as render_svg(width, height).write(fileobj), but the document is never held in memory
+        (see StreamingSvgRenderer), which keeps large maps with many objects cheap.
 
-        renderer = SvgRenderer(trans)
-        renderer.render_background(self._background_color)
-        renderer.render_tiles(self._fetch_tile)
+        :param width: width of static map
+        :type width: int
+        :param height: height of static map
+        :type height: int
+        :param fileobj: text file-like object receiving the svg document
+        :type fileobj: typing.IO[str]
+        :raises RuntimeError: raises runtime error if map has no center and zoom
+        """
+        trans = self.transformer(width, height)
+        renderer = StreamingSvgRenderer(trans, fileobj)
+        self._render(renderer, self._prefetch_tiles(trans, [SvgRenderer]))
+        renderer.finish()
+
+    def render_many(self, width: int, height: int, formats: typing.Sequence[str]) -> typing.Dict[str, typing.Any]:
+        """Render context with several renderers from a single layout pass
+
+        The layout, the fetched tiles and the projected geometry are shared by all renderers; formats found in the
+        render cache (see set_render_cache) are not rendered again.
+
+        :param width: width of static map
+        :type width: int
+        :param height: height of static map
+        :type height: int
+        :param formats: renderers to use ("pillow", "cairo", "svg")
+        :type formats: typing.Sequence[str]
+        :return: rendered images (pillow image, cairo image surface, svg drawing) by format
+        :rtype: typing.Dict[str, typing.Any]
+        :raises ValueError: raises value error for unknown formats
+        :raises RuntimeError: raises runtime error if cairo is requested but not available
+        :raises RuntimeError: raises runtime error if map has no center and zoom
+        """
+        renderers: typing.Dict[str, typing.Type[Renderer]]
+        renderers = {"cairo": CairoRenderer, "pillow": PillowRenderer, "svg": SvgRenderer}
+        for f in formats:
+            if f not in renderers:
+                raise ValueError(f"Unknown render format: {f}")
+        if "cairo" in formats and not cairo_is_supported():
+            raise RuntimeError('You need to install the "cairo" module to enable "render_cairo".')
+
+        keys = {}
+        results = {}
+        for f in formats:
+            keys[f], result = self._cached_result(width, height, f, renderers[f])
+            if result is not None:
+                results[f] = result
+        missing = [f for f in formats if f not in results]
+        if missing:
+            trans = self.transformer(width, height)
+            download = self._prefetch_tiles(trans, [renderers[f] for f in missing])
+            # the renderers share the projected geometry, it is dropped when they are done
+            projections: typing.Dict[int, typing.Any] = {}
+            for f in missing:
+                results[f] = self._render_result(renderers[f], trans, download, keys[f], projections)
+        return {f: results[f] for f in formats}
+
+    async def render_cairo_async(self, width: int, height: int) -> typing.Any:
+        """Render area using cairo; tiles are fetched concurrently on the event loop
+
+        :param width: width of static map
+        :type width: int
+        :param height: height of static map
+        :type height: int
+        :return: cairo image
+        :rtype: cairo.ImageSurface
+        :raises RuntimeError: raises runtime error if cairo is not available
+        :raises RuntimeError: raises runtime error if map has no center and zoom
+        """
+        if not cairo_is_supported():
+            raise RuntimeError('You need to install the "cairo" module to enable "render_cairo_async".')
+
+        return await self._render_async(width, height, "cairo", CairoRenderer)
+
+    async def render_pillow_async(self, width: int, height: int) -> PIL_Image.Image:
+        """Render context using PILLOW; tiles are fetched concurrently on the event loop
+
+        :param width: width of static map
+        :type width: int
+        :param height: height of static map
+        :type height: int
+        :return: pillow image
+        :rtype: PIL_Image
+        :raises RuntimeError: raises runtime error if map has no center and zoom
+        """
+        return await self._render_async(width, height, "pillow", PillowRenderer)
+
+    async def render_svg_async(self, width: int, height: int) -> svgwrite.Drawing:
+        """Render context using svgwrite; tiles are fetched concurrently on the event loop
+
+        :param width: width of static map
+        :type width: int
+        :param height: height of static map
+        :type height: int
+        :return: svg drawing
+        :rtype: svgwrite.Drawing
+        :raises RuntimeError: raises runtime error if map has no center and zoom
+        """
+        return await self._render_async(width, height, "svg", SvgRenderer)
+
+    def _render_cached(self, width: int, height: int, name: str, renderer_class: typing.Type[Renderer]) -> typing.Any:
+        key, result = self._cached_result(width, height, name, renderer_class)
+        if result is None:
+            trans = self.transformer(width, height)
+            result = self._render_result(renderer_class, trans, self._prefetch_tiles(trans, [renderer_class]), key)
+        return result
+
+    async def _render_async(
+        self, width: int, height: int, name: str, renderer_class: typing.Type[Renderer]
+    ) -> typing.Any:
+        loop = asyncio.get_running_loop()
+        # the lookup may read a result file, so it runs in the executor like the rendering
+        key, result = await loop.run_in_executor(None, self._cached_result, width, height, name, renderer_class)
+        if result is not None:
+            return result
+        trans = await loop.run_in_executor(None, self.transformer, width, height)
+        download = await self._prefetch_tiles_async(trans, [renderer_class])
+        return await loop.run_in_executor(None, self._render_result, renderer_class, trans, download, key)
+
+    def _render_result(
+        self,
+        kind: typing.Type[Renderer],
+        trans: Transformer,
+        download: DownloadT,
+        key: typing.Optional[str] = None,
+        projections: typing.Optional[typing.Dict[int, typing.Any]] = None,
+    ) -> typing.Any:
+        renderer = kind(trans)
+        if projections is not None:
+            renderer.set_projections(projections)
+        complete = self._render(renderer, download)
+        result = renderer.result()
+        if key is not None and complete and self._render_cache is not None:
+            self._render_cache.store(key, renderer, result)
+        return result
+
+    def _cached_result(
+        self, width: int, height: int, name: str, kind: typing.Type[Renderer]
+    ) -> typing.Tuple[typing.Optional[str], typing.Any]:
+        if self._render_cache is None:
+            return None, None
+        content_hash = self.content_hash(width, height)
+        if content_hash is None:
+            return None, None
+        key = f"{content_hash}.{name}"
+        return key, self._render_cache.lookup(key, kind)
+
+    def _render(self, renderer: Renderer, download: DownloadT) -> bool:
+        renderer.set_simplification_tolerance(self._simplification_tolerance)
+        complete = renderer.render_basemap(self._background_color, download, self._tile_provider)
         renderer.render_objects(self._objects)
         renderer.render_attribution(self._tile_provider.attribution())
-
-        return renderer.drawing()
+        return complete
 
     def object_bounds(self) -> typing.Optional[s2sphere.LatLngRect]:
         """return maximum bounds of all objects
@@ -260,7 +511,7 @@ class Context:
         """
         if self._center is not None:
             if self._zoom is not None:
-                return self._center, self._clamp_zoom(self._zoom)
+                return self._center, clamp_zoom(self._zoom, self._tile_provider)
             b = self.object_bounds()
             return self._center, self._determine_zoom(width, height, b, self._center)
 
@@ -268,13 +519,14 @@ class Context:
         if b is None:
             return None, None
 
-        c = self._determine_center(b)
+        c = center_of_bounds(b)
         z = self._zoom
         if z is None:
             z = self._determine_zoom(width, height, b, c)
         if z is None:
             return None, None
-        return self._adjust_center(width, height, c, z), z
+        trans = Transformer(width, height, z, c, self._tile_provider.tile_size())
+        return adjust_center(trans, c, self._objects), z
 
     def _determine_zoom(
         self, width: int, height: int, b: typing.Optional[s2sphere.LatLngRect], c: s2sphere.LatLng
@@ -284,82 +536,39 @@ class Context:
         else:
             b = b.union(s2sphere.LatLngRect(c, c))
         assert b
-        if b.is_point():
-            return self._clamp_zoom(15)
-
-        pixel_margin = self.extra_pixel_bounds()
-
-        w = (width - pixel_margin[0] - pixel_margin[2]) / self._tile_provider.tile_size()
-        h = (height - pixel_margin[1] - pixel_margin[3]) / self._tile_provider.tile_size()
-        # margins are bigger than target image size => ignore them
-        if w <= 0 or h <= 0:
-            w = width / self._tile_provider.tile_size()
-            h = height / self._tile_provider.tile_size()
-
-        min_y = (1.0 - math.log(math.tan(b.lat_lo().radians) + (1.0 / math.cos(b.lat_lo().radians)))) / (2 * math.pi)
-        max_y = (1.0 - math.log(math.tan(b.lat_hi().radians) + (1.0 / math.cos(b.lat_hi().radians)))) / (2 * math.pi)
-        dx = (b.lng_hi().degrees - b.lng_lo().degrees) / 360.0
-        if dx < 0:
-            dx += math.ceil(math.fabs(dx))
-        if dx > 1:
-            dx -= math.floor(dx)
-        dy = math.fabs(max_y - min_y)
-
-        for zoom in range(1, self._tile_provider.max_zoom()):
-            tiles = 2**zoom
-            if (dx * tiles > w) or (dy * tiles > h):
-                return self._clamp_zoom(zoom - 1)
-        return self._clamp_zoom(15)
-
-    @staticmethod
-    def _determine_center(b: s2sphere.LatLngRect) -> s2sphere.LatLng:
-        y1 = math.log((1 + math.sin(b.lat_lo().radians)) / (1 - math.sin(b.lat_lo().radians))) / 2
-        y2 = math.log((1 + math.sin(b.lat_hi().radians)) / (1 - math.sin(b.lat_hi().radians))) / 2
-        lat = math.atan(math.sinh((y1 + y2) / 2)) * 180 / math.pi
-        lng = b.get_center().lng().degrees
-        return s2sphere.LatLng.from_degrees(lat, lng)
-
-    def _adjust_center(self, width: int, height: int, center: s2sphere.LatLng, zoom: int) -> s2sphere.LatLng:
-        if len(self._objects) == 0:
-            return center
-
-        trans = Transformer(width, height, zoom, center, self._tile_provider.tile_size())
-
-        min_x = None
-        max_x = None
-        min_y = None
-        max_y = None
-        for obj in self._objects:
-            l, t, r, b = obj.pixel_rect(trans)
-            if min_x is None:
-                min_x = l
-                max_x = r
-                min_y = t
-                max_y = b
-            else:
-                min_x = min(min_x, l)
-                max_x = max(max_x, r)
-                min_y = min(min_y, t)
-                max_y = max(max_y, b)
-        assert min_x is not None
-        assert max_x is not None
-        assert min_y is not None
-        assert max_y is not None
-
-        # margins are bigger than the image => ignore
-        if (max_x - min_x) > width or (max_y - min_y) > height:
-            return center
-
-        return trans.pixel2ll((max_x + min_x) * 0.5, (max_y + min_y) * 0.5)
-
-    def _fetch_tile(self, z: int, x: int, y: int) -> typing.Optional[bytes]:
+        return zoom_for_bounds(width, height, b, self.extra_pixel_bounds(), self._tile_provider)
+
+    def _fetch_tile(self, z: int, x: int, y: int) -> typing.Optional[TileDataT]:
         return self._tile_downloader.get(self._tile_provider, self._cache_dir, z, x, y)
 
-    def _clamp_zoom(self, zoom: typing.Optional[int]) -> typing.Optional[int]:
-        if zoom is None:
-            return None
-        if zoom < 0:
-            return 0
-        if zoom > self._tile_provider.max_zoom():
-            return self._tile_provider.max_zoom()
-        return zoom
+    def _basemap_cached(self, trans: Transformer, renderers: typing.Sequence[typing.Type[Renderer]]) -> bool:
+        for renderer in renderers:
+            if renderer.cached_mosaic(mosaic_key(trans, self._tile_provider, self._background_color)) is None:
+                return False
+        return True
+
+    def _prefetch_tiles(self, trans: Transformer, renderers: typing.Sequence[typing.Type[Renderer]]) -> DownloadT:
+        if self._basemap_cached(trans, renderers):
+            # the tiles are only needed if a cached basemap is evicted before it is used
+            return self._fetch_tile
+        return prefetch_tiles(trans, self._fetch_tile, self._tile_fetch_workers, self._cached_tiles(trans))
+
+    async def _prefetch_tiles_async(
+        self, trans: Transformer, renderers: typing.Sequence[typing.Type[Renderer]]
+    ) -> DownloadT:
+        if self._basemap_cached(trans, renderers):
+            return self._fetch_tile
+        downloader = self._async_tile_downloader
+        if downloader is None:
+            downloader = AsyncTileDownloader(self._tile_downloader)
+
+        async def fetch(z: int, x: int, y: int) -> typing.Optional[TileDataT]:
+            assert downloader is not None
+            return await downloader.get(self._tile_provider, self._cache_dir, z, x, y)
+
+        loop = asyncio.get_running_loop()
+        cached = await loop.run_in_executor(None, self._cached_tiles, trans)
+        return await prefetch_tiles_async(trans, fetch, self._fetch_tile, self._tile_fetch_workers, cached)
+
+    def _cached_tiles(self, trans: Transformer) -> CachedTilesT:
+        return self._tile_downloader.get_cached(self._tile_provider, self._cache_dir, tile_keys(trans))
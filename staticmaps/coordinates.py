@@ -1,10 +1,14 @@
 # py-staticmaps
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
+from array import array
+import math
 import typing
 
 import s2sphere  # type: ignore
 
+LatLngsT = typing.Union[typing.Sequence[s2sphere.LatLng], typing.Sequence[float]]  # pylint: disable=invalid-name
+
 
 def create_latlng(lat: float, lng: float) -> s2sphere.LatLng:
     """Create a LatLng object from float values
@@ -19,6 +23,59 @@ def create_latlng(lat: float, lng: float) -> s2sphere.LatLng:
     return s2sphere.LatLng.from_degrees(lat, lng)
 
 
+def latlngs_to_radians(latlngs: LatLngsT) -> "array[float]":
+    """Convert a sequence of LatLng objects or a flat sequence of latitude/longitude values in degrees
+    (lat0, lng0, lat1, lng1, ...) into a flat array of latitude/longitude values in radians
+
+    :param latlngs: sequence of LatLng objects or flat sequence of latitude/longitude values in degrees
+    :type latlngs: LatLngsT
+    :return: flat array of latitude/longitude values in radians
+    :rtype: array[float]
+    :raises ValueError: raises a value error if a flat sequence has an odd number of values
+    """
+    if len(latlngs) > 0 and isinstance(latlngs[0], s2sphere.LatLng):
+        latlng_objects = typing.cast(typing.Sequence[s2sphere.LatLng], latlngs)
+        return array("d", [v for latlng in latlng_objects for v in (latlng.lat().radians, latlng.lng().radians)])
+    if len(latlngs) % 2 != 0:
+        raise ValueError("Flat coordinate sequences must consist of latitude/longitude pairs")
+    return array("d", map(math.radians, latlngs))
+
+
+def latlngrect_from_radians(coords: typing.Sequence[float]) -> s2sphere.LatLngRect:
+    """Compute the bounding rectangle of a flat sequence of latitude/longitude values in radians
+    (lat0, lng0, lat1, lng1, ...)
+
+    Longitudes are normalized to [-pi, pi]; the longitude interval is the smallest one containing all points, i.e. the
+    circle is cut at the largest gap between the longitudes. If that interval crosses the antimeridian, the resulting
+    rectangle does too (i.e. lng_lo > lng_hi).
+
+    :param coords: flat sequence of latitude/longitude values in radians
+    :type coords: typing.Sequence[float]
+    :return: bounding rectangle (empty for an empty sequence)
+    :rtype: s2sphere.LatLngRect
+    """
+    if len(coords) < 2:
+        return s2sphere.LatLngRect()
+    lats = coords[0::2]
+    lngs = coords[1::2]
+    lat_lo = max(-math.pi / 2, min(lats))
+    lat_hi = min(math.pi / 2, max(lats))
+    lng_lo = min(lngs)
+    lng_hi = max(lngs)
+    if lng_lo < -math.pi or lng_hi > math.pi:
+        lngs = [math.remainder(lng, 2 * math.pi) for lng in lngs]
+        lng_lo = min(lngs)
+        lng_hi = max(lngs)
+    if lng_hi - lng_lo > math.pi:
+        # the gap across the antimeridian is smaller than pi, so a gap between two of the longitudes may be larger
+        ordered = sorted(lngs)
+        gap, index = max((ordered[i + 1] - ordered[i], i) for i in range(len(ordered) - 1))
+        if gap > 2 * math.pi - (lng_hi - lng_lo):
+            lng_lo = ordered[index + 1]
+            lng_hi = ordered[index]
+    return s2sphere.LatLngRect(s2sphere.LineInterval(lat_lo, lat_hi), s2sphere.SphereInterval(lng_lo, lng_hi))
+
+
 def parse_latlng(s: str) -> s2sphere.LatLng:
     """Parse a string with comma separated latitude,longitude values and create a LatLng object from float values
 
@@ -100,6 +100,23 @@ class ImageMarker(Object):
             max(0, self.height() - self._origin_y),
         )
 
+    def content_key(self) -> typing.Optional[typing.Tuple[typing.Any, ...]]:
+        """Return everything that determines how the image marker is drawn
+
+        :return: content key, None for subclasses that do not provide their own key
+        :rtype: typing.Optional[typing.Tuple[typing.Any, ...]]
+        """
+        if self.__class__ is not ImageMarker:
+            return None
+        return (
+            "ImageMarker",
+            self._latlng.lat().radians,
+            self._latlng.lng().radians,
+            self.image_data(),
+            self._origin_x,
+            self._origin_y,
+        )
+
     def render_pillow(self, renderer: PillowRenderer) -> None:
         """Render marker using PILLOW
 
@@ -108,16 +125,15 @@ class ImageMarker(Object):
         """
         x, y = renderer.transformer().ll2pixel(self.latlng())
         image = renderer.create_image(self.image_data())
-        overlay = PIL_Image.new("RGBA", renderer.image().size, (255, 255, 255, 0))
-        overlay.paste(
-            image,
+        overlay = PIL_Image.new("RGBA", image.size, (255, 255, 255, 0))
+        overlay.paste(image, (0, 0), mask=image)
+        renderer.alpha_compose(
+            overlay,
             (
                 int(x - self.origin_x() + renderer.offset_x()),
                 int(y - self.origin_y()),
             ),
-            mask=image,
         )
-        renderer.alpha_compose(overlay)
 
     def render_svg(self, renderer: SvgRenderer) -> None:
         """Render marker using svgwrite
@@ -0,0 +1,133 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import math
+import typing
+
+import s2sphere  # type: ignore
+
+from .object import Object, PixelBoundsT
+from .tile_provider import TileProvider
+from .transformer import Transformer
+
+
+def clamp_zoom(zoom: typing.Optional[int], provider: TileProvider) -> typing.Optional[int]:
+    """Clamp a zoom level to the zoom range of a tile provider
+
+    :param zoom: zoom level
+    :type zoom: typing.Optional[int]
+    :param provider: tile provider
+    :type provider: TileProvider
+    :return: clamped zoom level (None if zoom is None)
+    :rtype: typing.Optional[int]
+    """
+    if zoom is None:
+        return None
+    if zoom < 0:
+        return 0
+    if zoom > provider.max_zoom():
+        return provider.max_zoom()
+    return zoom
+
+
+def zoom_for_bounds(
+    width: int, height: int, b: s2sphere.LatLngRect, pixel_margin: PixelBoundsT, provider: TileProvider
+) -> typing.Optional[int]:
+    """Return the largest zoom level at which the bounds fit into an image of the given size
+
+    :param width: width of static map
+    :type width: int
+    :param height: height of static map
+    :type height: int
+    :param b: bounds to fit into the image
+    :type b: s2sphere.LatLngRect
+    :param pixel_margin: extra pixel bounds (left, top, right, bottom) to keep free
+    :type pixel_margin: PixelBoundsT
+    :param provider: tile provider
+    :type provider: TileProvider
+    :return: zoom level
+    :rtype: typing.Optional[int]
+    """
+    if b.is_point():
+        return clamp_zoom(15, provider)
+
+    w = (width - pixel_margin[0] - pixel_margin[2]) / provider.tile_size()
+    h = (height - pixel_margin[1] - pixel_margin[3]) / provider.tile_size()
+    # margins are bigger than target image size => ignore them
+    if w <= 0 or h <= 0:
+        w = width / provider.tile_size()
+        h = height / provider.tile_size()
+
+    min_y = (1.0 - math.log(math.tan(b.lat_lo().radians) + (1.0 / math.cos(b.lat_lo().radians)))) / (2 * math.pi)
+    max_y = (1.0 - math.log(math.tan(b.lat_hi().radians) + (1.0 / math.cos(b.lat_hi().radians)))) / (2 * math.pi)
+    dx = (b.lng_hi().degrees - b.lng_lo().degrees) / 360.0
+    if dx < 0:
+        dx += math.ceil(math.fabs(dx))
+    if dx > 1:
+        dx -= math.floor(dx)
+    dy = math.fabs(max_y - min_y)
+
+    for zoom in range(1, provider.max_zoom()):
+        tiles = 2**zoom
+        if (dx * tiles > w) or (dy * tiles > h):
+            return clamp_zoom(zoom - 1, provider)
+    return clamp_zoom(15, provider)
+
+
+def center_of_bounds(b: s2sphere.LatLngRect) -> s2sphere.LatLng:
+    """Return the center of the bounds in mercator projection
+
+    :param b: bounds
+    :type b: s2sphere.LatLngRect
+    :return: center
+    :rtype: s2sphere.LatLng
+    """
+    y1 = math.log((1 + math.sin(b.lat_lo().radians)) / (1 - math.sin(b.lat_lo().radians))) / 2
+    y2 = math.log((1 + math.sin(b.lat_hi().radians)) / (1 - math.sin(b.lat_hi().radians))) / 2
+    lat = math.atan(math.sinh((y1 + y2) / 2)) * 180 / math.pi
+    lng = b.get_center().lng().degrees
+    return s2sphere.LatLng.from_degrees(lat, lng)
+
+
+def adjust_center(trans: Transformer, center: s2sphere.LatLng, objects: typing.List[Object]) -> s2sphere.LatLng:
+    """Return the center that centers the pixel rectangles of all objects in the image
+
+    :param trans: transformer for the preliminary center and final zoom
+    :type trans: Transformer
+    :param center: preliminary center
+    :type center: s2sphere.LatLng
+    :param objects: map objects
+    :type objects: typing.List[Object]
+    :return: adjusted center
+    :rtype: s2sphere.LatLng
+    """
+    if len(objects) == 0:
+        return center
+
+    min_x = None
+    max_x = None
+    min_y = None
+    max_y = None
+    for obj in objects:
+        l, t, r, b = obj.pixel_rect(trans)
+        if min_x is None:
+            min_x = l
+            max_x = r
+            min_y = t
+            max_y = b
+        else:
+            min_x = min(min_x, l)
+            max_x = max(max_x, r)
+            min_y = min(min_y, t)
+            max_y = max(max_y, b)
+    assert min_x is not None
+    assert max_x is not None
+    assert min_y is not None
+    assert max_y is not None
+
+    # margins are bigger than the image => ignore
+    width, height = trans.image_size()
+    if (max_x - min_x) > width or (max_y - min_y) > height:
+        return center
+
+    return trans.pixel2ll((max_x + min_x) * 0.5, (max_y + min_y) * 0.5)
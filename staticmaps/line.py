@@ -1,6 +1,7 @@
 # py-staticmaps
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
+from array import array
 import math
 import typing
 
@@ -8,25 +9,39 @@ from geographiclib.geodesic import Geodesic  # type: ignore
 import s2sphere  # type: ignore
 
 from .color import Color, RED
-from .coordinates import create_latlng
+from .coordinates import LatLngsT, latlngrect_from_radians, latlngs_to_radians
 from .object import Object, PixelBoundsT
 from .cairo_renderer import CairoRenderer
 from .pillow_renderer import PillowRenderer
+from .renderer import Renderer
+from .simplify import PointT, simplify_polyline
 from .svg_renderer import SvgRenderer
+from .transformer import Transformer
 
 
 class Line(Object):
-    def __init__(self, latlngs: typing.List[s2sphere.LatLng], color: Color = RED, width: int = 2) -> None:
+    """Render a (geodesic) line using different renderers
+
+    :param latlngs: coordinates of the line, either as LatLng objects or as flat sequence of latitude/longitude values
+        in degrees (lat0, lng0, lat1, lng1, ...), e.g. an array('d')
+    """
+
+    def __init__(self, latlngs: LatLngsT, color: Color = RED, width: int = 2) -> None:
         Object.__init__(self)
-        if latlngs is None or len(latlngs) < 2:
+        if latlngs is None:
+            raise ValueError("Trying to create line with less than 2 coordinates")
+        coords = latlngs_to_radians(latlngs)
+        if len(coords) < 4:
             raise ValueError("Trying to create line with less than 2 coordinates")
         if width < 0:
             raise ValueError(f"'width' must be >= 0: {width}")
 
-        self._latlngs = latlngs
+        self._coords = coords
         self._color = color
         self._width = width
-        self._interpolation_cache: typing.Optional[typing.List[s2sphere.LatLng]] = None
+        self._interpolation_radians: typing.Optional["array[float]"] = None
+        self._bounds: typing.Optional[s2sphere.LatLngRect] = None
+        self._simplification_cache: typing.Dict[typing.Tuple[int, int, float], typing.List[PointT]] = {}
 
     def color(self) -> Color:
         """Return color of the line
@@ -50,10 +65,9 @@ class Line(Object):
         :return: bounds of line
         :rtype: s2sphere.LatLngRect
         """
-        b = s2sphere.LatLngRect()
-        for latlng in self.interpolate():
-            b = b.union(s2sphere.LatLngRect.from_point(latlng.normalized()))
-        return b
+        if self._bounds is None:
+            self._bounds = latlngrect_from_radians(self.interpolate_radians())
+        return self._bounds
 
     def extra_pixel_bounds(self) -> PixelBoundsT:
         """Return extra pixel bounds from line
@@ -63,45 +77,118 @@ class Line(Object):
         """
         return self._width, self._width, self._width, self._width
 
+    def content_key(self) -> typing.Optional[typing.Tuple[typing.Any, ...]]:
+        """Return everything that determines how the line is drawn
+
+        :return: content key, None for subclasses that do not provide their own key
+        :rtype: typing.Optional[typing.Tuple[typing.Any, ...]]
+        """
+        if self.__class__ is not Line:
+            return None
+        return "Line", self._coords.tobytes(), self._color.int_rgba(), self._width
+
+    def number_of_points(self) -> int:
+        """Return the number of (not interpolated) points of the line
+
+        :return: number of points
+        :rtype: int
+        """
+        return len(self._coords) // 2
+
     def interpolate(self) -> typing.List[s2sphere.LatLng]:
         """Interpolate bounds
 
         :return: list of LatLng
         :rtype: typing.List[s2sphere.LatLng]
         """
-        if self._interpolation_cache is not None:
-            return self._interpolation_cache
-        assert len(self._latlngs) >= 2
-        self._interpolation_cache = []
+        coords = self.interpolate_radians()
+        return [s2sphere.LatLng(coords[i], coords[i + 1]) for i in range(0, len(coords), 2)]
+
+    def interpolate_radians(self) -> "array[float]":
+        """Return the interpolated line as flat array of latitude/longitude values in radians
+
+        :return: array (lat0, lng0, lat1, lng1, ...)
+        :rtype: array[float]
+        """
+        if self._interpolation_radians is not None:
+            return self._interpolation_radians
+        coords = self._coords
+        assert len(coords) >= 4
+        interpolated = array("d", coords[0:2])
         threshold = 2 * math.pi / 360
-        last = self._latlngs[0]
-        self._interpolation_cache.append(last)
-        geod = Geodesic.WGS84
-        for current in self._latlngs[1:]:
+        last_lat, last_lng = coords[0], coords[1]
+        for i in range(2, len(coords), 2):
+            lat, lng = coords[i], coords[i + 1]
             # don't perform geodesic interpolation if the longitudinal distance is < threshold = 1°
-            dlng = current.lng().radians - last.lng().radians
+            dlng = lng - last_lng
             while dlng < 0:
                 dlng += 2 * math.pi
             while dlng >= math.pi:
                 dlng -= 2 * math.pi
             if abs(dlng) < threshold:
-                self._interpolation_cache.append(current)
-                last = current
+                interpolated.extend((lat, lng))
+                last_lat, last_lng = lat, lng
                 continue
             # geodesic interpolation
-            line = geod.InverseLine(
-                last.lat().degrees,
-                last.lng().degrees,
-                current.lat().degrees,
-                current.lng().degrees,
+            line = Geodesic.WGS84.InverseLine(
+                math.degrees(last_lat),
+                math.degrees(last_lng),
+                math.degrees(lat),
+                math.degrees(lng),
             )
             n = 2 + math.ceil(line.a13)
-            for i in range(1, n + 1):
-                a = (i * line.a13) / n
-                g = line.ArcPosition(a, Geodesic.LATITUDE | Geodesic.LONGITUDE | Geodesic.LONG_UNROLL)
-                self._interpolation_cache.append(create_latlng(g["lat2"], g["lon2"]))
-            last = current
-        return self._interpolation_cache
+            for j in range(1, n + 1):
+                g = line.ArcPosition((j * line.a13) / n, Geodesic.LATITUDE | Geodesic.LONGITUDE | Geodesic.LONG_UNROLL)
+                interpolated.extend((math.radians(g["lat2"]), math.radians(g["lon2"])))
+            last_lat, last_lng = lat, lng
+        self._interpolation_radians = interpolated
+        return interpolated
+
+    def pixel_coordinates(self, trans: Transformer, tolerance: float = 0.0) -> typing.List[typing.Tuple[float, float]]:
+        """Return the pixel coordinates of the interpolated line
+
+        If a tolerance is given, the coordinates are simplified such that no removed point is farther than 'tolerance'
+        pixels away from the drawn line; the simplified coordinates are cached per zoom level.
+
+        :param trans: transformer
+        :type trans: Transformer
+        :param tolerance: simplification tolerance in pixels (0 = no simplification)
+        :type tolerance: float
+        :return: pixel coordinates
+        :rtype: typing.List[typing.Tuple[float, float]]
+        """
+        if tolerance <= 0:
+            return trans.ll2pixels(self.interpolate_radians(), radians=True)
+        return self._simplified_pixel_coordinates(trans, tolerance)
+
+    def renderer_pixel_coordinates(self, renderer: Renderer) -> typing.List[PointT]:
+        """Return the pixel coordinates of the interpolated line for a renderer
+
+        The coordinates are kept by the renderer (see Renderer.projections) while it renders, so drawing several world
+        copies or rendering the same layout with several renderers projects the line only once.
+
+        :param renderer: renderer
+        :type renderer: Renderer
+        :return: pixel coordinates
+        :rtype: typing.List[PointT]
+        """
+        projections = renderer.projections()
+        xys = projections.get(id(self))
+        if xys is None:
+            xys = self.pixel_coordinates(renderer.transformer(), renderer.simplification_tolerance())
+            projections[id(self)] = xys
+        return xys
+
+    def _simplified_pixel_coordinates(self, trans: Transformer, tolerance: float) -> typing.List[PointT]:
+        key = (trans.zoom(), trans.tile_size(), tolerance)
+        offset_x, offset_y = trans.world_pixel_offset()
+        world_xys = self._simplification_cache.get(key)
+        if world_xys is None:
+            xys = simplify_polyline(trans.ll2pixels(self.interpolate_radians(), radians=True), tolerance)
+            world_xys = [(x - offset_x, y - offset_y) for (x, y) in xys]
+            self._simplification_cache[key] = world_xys
+            return xys
+        return [(x + offset_x, y + offset_y) for (x, y) in world_xys]
 
     def render_pillow(self, renderer: PillowRenderer) -> None:
         """Render line using PILLOW
@@ -111,10 +198,7 @@ class Line(Object):
         """
         if self.width() == 0:
             return
-        xys = [
-            (x + renderer.offset_x(), y)
-            for (x, y) in [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
-        ]
+        xys = [(x + renderer.offset_x(), y) for (x, y) in self.renderer_pixel_coordinates(renderer)]
         renderer.draw().line(xys, self.color().int_rgba(), self.width())
 
     def render_svg(self, renderer: SvgRenderer) -> None:
@@ -125,7 +209,7 @@ class Line(Object):
         """
         if self.width() == 0:
             return
-        xys = [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
+        xys = self.renderer_pixel_coordinates(renderer)
         polyline = renderer.drawing().polyline(
             xys,
             fill="none",
@@ -143,7 +227,7 @@ class Line(Object):
         """
         if self.width() == 0:
             return
-        xys = [renderer.transformer().ll2pixel(latlng) for latlng in self.interpolate()]
+        xys = self.renderer_pixel_coordinates(renderer)
         renderer.context().set_source_rgba(*self.color().float_rgba())
         renderer.context().set_line_width(self.width())
         renderer.context().new_path()
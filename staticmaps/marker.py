@@ -2,6 +2,7 @@
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
 import math
+import typing
 
 import s2sphere  # type: ignore
 
@@ -10,6 +11,7 @@ from .object import Object, PixelBoundsT
 from .cairo_renderer import CairoRenderer
 from .pillow_renderer import PillowRenderer
 from .svg_renderer import SvgRenderer
+from .transformer import Transformer
 
 
 class Marker(Object):
@@ -59,6 +61,35 @@ class Marker(Object):
         """
         return self._size, self._size, self._size, 0
 
+    def content_key(self) -> typing.Optional[typing.Tuple[typing.Any, ...]]:
+        """Return everything that determines how the marker is drawn
+
+        :return: content key, None for subclasses that do not provide their own key
+        :rtype: typing.Optional[typing.Tuple[typing.Any, ...]]
+        """
+        if self.__class__ is not Marker:
+            return None
+        return (
+            "Marker",
+            self._latlng.lat().radians,
+            self._latlng.lng().radians,
+            self._color.int_rgba(),
+            self._size,
+        )
+
+    def render_pixel_rect(self, trans: Transformer) -> typing.Tuple[float, float, float, float]:
+        """Return the pixel rect (left, top, right, bottom) of the drawn marker
+
+        :param trans:
+        :type trans: Transformer
+        :return: pixel rectangle of drawn marker
+        :rtype: typing.Tuple[float, float, float, float]
+        """
+        x, y = trans.ll2pixel(self._latlng)
+        r = self._size
+        # include one extra pixel for the marker's outline
+        return x - r - 1, y - 3 * r - 1, x + r + 1, y + 1
+
     def render_pillow(self, renderer: PillowRenderer) -> None:
         """Render marker using PILLOW
 
@@ -0,0 +1,267 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import typing
+
+from .tile_cache import TileCache, TileDataT, TileIndexT, TileMetadata, sanitized_name
+from .tile_provider import TileProvider
+
+
+class MBTilesCache(TileCache):
+    """A tile cache storing the tiles of each provider in a single SQLite file <cache_dir>/<provider>.mbtiles
+
+    The files follow the MBTiles specification (tile rows are stored in TMS order, i.e. flipped vertically), so they can
+    be used by other MBTiles tools. All tiles of a map are read with a single query per zoom level (see get_many).
+    Freshness information and access times of the tiles are kept in the additional table 'tile_info'; access times are
+    buffered in memory and written in batches. Each thread uses its own connections, so reads run concurrently (the
+    files use SQLite's write-ahead log).
+
+    :param cache_dir: directory of the MBTiles files
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self._cache_dir = cache_dir
+        # connections of the current thread by file name; all connections are also kept with their thread in
+        # _all_connections, so close (and the threads opening connections after a thread ended) can close them, and
+        # the generation tells threads that their connections were closed
+        self._local = threading.local()
+        self._all_connections: typing.List[typing.Tuple[threading.Thread, sqlite3.Connection]] = []
+        self._generation = 0
+        self._prepared: typing.Set[str] = set()
+        self._accessed: typing.Dict[str, typing.Dict[typing.Tuple[int, int, int], float]] = {}
+        self._lock = threading.Lock()
+
+    def cache_dir(self) -> str:
+        """Return the directory of the MBTiles files
+
+        :return: cache directory
+        :rtype: str
+        """
+        return self._cache_dir
+
+    def file_name(self, provider: TileProvider) -> str:
+        """Return the name of the MBTiles file of a tile provider
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :return: file name
+        :rtype: str
+        """
+        return os.path.join(self._cache_dir, f"{sanitized_name(provider.name())}.mbtiles")
+
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        row = (zoom, x, (1 << zoom) - 1 - y)
+        result = (
+            self._connection(provider)
+            .execute("SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", row)
+            .fetchone()
+        )
+        if result is not None:
+            self._touch(self.file_name(provider), [row])
+        return None if result is None else bytes(result[0])
+
+    def put(
+        self,
+        provider: TileProvider,
+        zoom: int,
+        x: int,
+        y: int,
+        data: bytes,
+        *,
+        metadata: typing.Optional[TileMetadata] = None,
+    ) -> None:
+        row = (zoom, x, (1 << zoom) - 1 - y)
+        connection = self._connection(provider)
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO tiles (zoom_level, tile_column, tile_row, tile_data) VALUES (?, ?, ?, ?)",
+                (*row, sqlite3.Binary(data)),
+            )
+            self._put_info(connection, row, metadata if metadata is not None else TileMetadata(time.time()))
+
+    def metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        result = (
+            self._connection(provider)
+            .execute(
+                "SELECT COALESCE(i.fetched, 0), i.etag, i.last_modified, i.max_age"
+                " FROM tiles t LEFT JOIN tile_info i USING (zoom_level, tile_column, tile_row)"
+                " WHERE t.zoom_level = ? AND t.tile_column = ? AND t.tile_row = ?",
+                (zoom, x, (1 << zoom) - 1 - y),
+            )
+            .fetchone()
+        )
+        # tiles without freshness information (e.g. written by other MBTiles tools) count as fetched at time 0
+        return None if result is None else TileMetadata(*result)
+
+    def set_metadata(self, provider: TileProvider, zoom: int, x: int, y: int, metadata: TileMetadata) -> None:
+        connection = self._connection(provider)
+        with connection:
+            self._put_info(connection, (zoom, x, (1 << zoom) - 1 - y), metadata)
+
+    def get_many(
+        self, provider: TileProvider, tiles: typing.Iterable[TileIndexT]
+    ) -> typing.Dict[TileIndexT, TileDataT]:
+        wanted: typing.Dict[int, typing.Set[typing.Tuple[int, int]]] = {}
+        for zoom, x, y in tiles:
+            wanted.setdefault(zoom, set()).add((x, (1 << zoom) - 1 - y))
+        result: typing.Dict[TileIndexT, TileDataT] = {}
+        connection = self._connection(provider)
+        found = []
+        for zoom, cells in wanted.items():
+            # query the bounding box of the requested tiles, which is the tile grid of the map
+            rows = [row for _, row in cells]
+            for columns in _column_ranges(zoom, [x for x, _ in cells]):
+                for x, row, data in connection.execute(
+                    "SELECT tile_column, tile_row, tile_data FROM tiles"
+                    " WHERE zoom_level = ? AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+                    (zoom, *columns, min(rows), max(rows)),
+                ):
+                    if (x, row) in cells:
+                        result[(zoom, x, (1 << zoom) - 1 - row)] = bytes(data)
+                        found.append((zoom, x, row))
+        self._touch(self.file_name(provider), found)
+        return result
+
+    def cleanup(self, max_bytes: int) -> int:
+        tiles = []
+        total = 0
+        file_names = sorted(
+            os.path.join(self._cache_dir, name)
+            for name in (os.listdir(self._cache_dir) if os.path.isdir(self._cache_dir) else [])
+            if name.endswith(".mbtiles")
+        )
+        for file_name in file_names:
+            connection = self._open(file_name, None)
+            self._flush(file_name)
+            for zoom, x, row, size, accessed in connection.execute(
+                "SELECT t.zoom_level, t.tile_column, t.tile_row, LENGTH(t.tile_data), COALESCE(i.accessed, 0)"
+                " FROM tiles t LEFT JOIN tile_info i USING (zoom_level, tile_column, tile_row)"
+            ):
+                tiles.append((accessed, size, file_name, (zoom, x, row)))
+                total += size
+        removed: typing.Dict[str, typing.List[typing.Tuple[int, int, int]]] = {}
+        for _, size, file_name, row in sorted(tiles):
+            if total <= max_bytes:
+                break
+            removed.setdefault(file_name, []).append(row)
+            total -= size
+        for file_name, rows in removed.items():
+            connection = self._open(file_name, None)
+            with connection:
+                for table in ("tiles", "tile_info"):
+                    connection.executemany(
+                        f"DELETE FROM {table} WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?", rows
+                    )
+            connection.execute("PRAGMA incremental_vacuum")
+        return sum(len(rows) for rows in removed.values())
+
+    def close(self) -> None:
+        with self._lock:
+            file_names = list(self._accessed)
+        for file_name in file_names:
+            self._flush(file_name)
+        with self._lock:
+            for _, connection in self._all_connections:
+                connection.close()
+            self._all_connections.clear()
+            self._generation += 1
+
+    def _connection(self, provider: TileProvider) -> sqlite3.Connection:
+        return self._open(self.file_name(provider), provider.name())
+
+    def _open(self, file_name: str, name: typing.Optional[str]) -> sqlite3.Connection:
+        if getattr(self._local, "generation", None) != self._generation:
+            self._local.generation = self._generation
+            self._local.connections = {}
+        connection = self._local.connections.get(file_name)
+        if connection is None:
+            pathlib.Path(self._cache_dir).mkdir(parents=True, exist_ok=True)
+            # connections are closed by other threads, see close
+            connection = sqlite3.connect(file_name, timeout=30, check_same_thread=False)
+            with self._lock:
+                alive = [(threading.current_thread(), connection)]
+                for thread, other in self._all_connections:
+                    if thread.is_alive():
+                        alive.append((thread, other))
+                    else:
+                        other.close()
+                self._all_connections = alive
+                if file_name not in self._prepared:
+                    self._prepare(connection, name)
+                    self._prepared.add(file_name)
+            self._local.connections[file_name] = connection
+        return connection
+
+    @staticmethod
+    def _prepare(connection: sqlite3.Connection, name: typing.Optional[str]) -> None:
+        # only effective for new files: lets cleanup return the space of removed tiles to the file system
+        connection.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        with connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT)")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tiles"
+                " (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB)"
+            )
+            connection.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row)"
+            )
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS tile_info (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,"
+                " fetched REAL, etag TEXT, last_modified TEXT, accessed REAL, max_age REAL,"
+                " PRIMARY KEY (zoom_level, tile_column, tile_row))"
+            )
+            if "max_age" not in [row[1] for row in connection.execute("PRAGMA table_info(tile_info)")]:
+                connection.execute("ALTER TABLE tile_info ADD COLUMN max_age REAL")
+            if name is not None and connection.execute("SELECT COUNT(*) FROM metadata").fetchone()[0] == 0:
+                connection.executemany(
+                    "INSERT INTO metadata (name, value) VALUES (?, ?)",
+                    [("name", name), ("type", "baselayer"), ("version", "1.1")],
+                )
+
+    @staticmethod
+    def _put_info(connection: sqlite3.Connection, row: typing.Tuple[int, int, int], metadata: TileMetadata) -> None:
+        connection.execute(
+            "INSERT OR REPLACE INTO tile_info"
+            " (zoom_level, tile_column, tile_row, fetched, etag, last_modified, max_age, accessed)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (*row, metadata.fetched(), metadata.etag(), metadata.last_modified(), metadata.max_age(), time.time()),
+        )
+
+    def _touch(self, file_name: str, rows: typing.Iterable[typing.Tuple[int, int, int]]) -> None:
+        now = time.time()
+        with self._lock:
+            accessed = self._accessed.setdefault(file_name, {})
+            for row in rows:
+                accessed[row] = now
+            if len(accessed) < 1024:
+                return
+        self._flush(file_name)
+
+    def _flush(self, file_name: str) -> None:
+        with self._lock:
+            accessed = self._accessed.pop(file_name, None)
+        if not accessed:
+            return
+        connection = self._open(file_name, None)
+        with connection:
+            connection.executemany(
+                "UPDATE tile_info SET accessed = ? WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                [(t, *row) for row, t in accessed.items()],
+            )
+
+
+def _column_ranges(zoom: int, xs: typing.Iterable[int]) -> typing.List[typing.Tuple[int, int]]:
+    # the tile columns of a map crossing the antimeridian wrap around (e.g. 6, 7, 0, 1 at zoom 3); querying their
+    # bounding box would scan the whole zoom level, so they are split at the largest gap between the columns
+    columns = sorted(set(xs))
+    if len(columns) > 1:
+        gap, index = max((columns[i + 1] - columns[i], i) for i in range(len(columns) - 1))
+        if gap > (1 << zoom) - columns[-1] + columns[0]:
+            return [(columns[0], columns[index]), (columns[index + 1], columns[-1])]
+    return [(columns[0], columns[-1])]
@@ -0,0 +1,126 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import collections
+import threading
+import typing
+
+KeyT = typing.TypeVar("KeyT")
+ValueT = typing.TypeVar("ValueT")
+
+
+class MemoryCache(typing.Generic[KeyT, ValueT]):
+    """A thread-safe in-memory cache with a size limit in bytes and least-recently-used eviction
+
+    :param max_bytes: maximum total size of the cached values in bytes
+    :param size: function returning the size of a value in bytes
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, max_bytes: int, size: typing.Callable[[ValueT], int]) -> None:
+        if max_bytes < 0:
+            raise ValueError(f"'max_bytes' must be >= 0: {max_bytes}")
+        self._max_bytes = max_bytes
+        self._size = size
+        self._items: "collections.OrderedDict[KeyT, typing.Tuple[ValueT, int]]" = collections.OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: KeyT) -> typing.Optional[ValueT]:
+        """Return the cached value for the given key and mark it as recently used
+
+        :param key: cache key
+        :type key: KeyT
+        :return: cached value, None if the key is not cached
+        :rtype: typing.Optional[ValueT]
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self._misses += 1
+                return None
+            self._items.move_to_end(key)
+            self._hits += 1
+            return item[0]
+
+    def put(self, key: KeyT, value: ValueT) -> None:
+        """Store a value, evicting the least recently used values if the size limit is exceeded
+
+        Values larger than the size limit are not cached.
+
+        :param key: cache key
+        :type key: KeyT
+        :param value: value to cache
+        :type value: ValueT
+        """
+        size = self._size(value)
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self._max_bytes:
+                return
+            self._items[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self._max_bytes:
+                _, (_, evicted_size) = self._items.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self) -> None:
+        """Remove all values from the cache"""
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, key: KeyT) -> bool:
+        # does not count as a hit or miss and does not mark the value as recently used
+        with self._lock:
+            return key in self._items
+
+    def max_bytes(self) -> int:
+        """Return the size limit of the cache
+
+        :return: size limit in bytes
+        :rtype: int
+        """
+        return self._max_bytes
+
+    def size_bytes(self) -> int:
+        """Return the total size of the cached values
+
+        :return: size in bytes
+        :rtype: int
+        """
+        return self._bytes
+
+    def hits(self) -> int:
+        """Return the number of cache hits
+
+        :return: number of cache hits
+        :rtype: int
+        """
+        return self._hits
+
+    def misses(self) -> int:
+        """Return the number of cache misses
+
+        :return: number of cache misses
+        :rtype: int
+        """
+        return self._misses
+
+    def evictions(self) -> int:
+        """Return the number of values evicted because of the size limit
+
+        :return: number of evictions
+        :rtype: int
+        """
+        return self._evictions
@@ -37,6 +37,19 @@ class Object(ABC):
         """
         return s2sphere.LatLngRect()
 
+    def content_key(self) -> typing.Optional[typing.Tuple[typing.Any, ...]]:
+        """Return everything that determines how the object is drawn, see Context.content_hash
+
+        The key is a tuple of None, bool, int, float, str and bytes values (or tuples of them), starting with the
+        class name. Objects that do not provide a key (the default) disable result caching of maps containing them.
+        The keys of the built-in objects only apply to exactly their class; subclasses must override content_key to
+        opt in, since they may draw differently.
+
+        :return: content key, None if the object cannot be cached
+        :rtype: typing.Optional[typing.Tuple[typing.Any, ...]]
+        """
+        return None
+
     def render_pillow(self, renderer: PillowRenderer) -> None:
         """Render object using PILLOW
 
@@ -89,3 +102,14 @@ class Object(ABC):
         nw_x, nw_y = trans.ll2pixel(bounds.get_vertex(3))
         l, t, r, b = self.extra_pixel_bounds()
         return nw_x - l, nw_y - t, se_x + r, se_y + b
+
+    def render_pixel_rect(self, trans: Transformer) -> typing.Tuple[float, float, float, float]:
+        """Return the pixel rect (left, top, right, bottom) containing everything the object draws when using the
+        supplied Transformer; the renderers skip objects whose rect does not touch the image.
+
+        :param trans:
+        :type trans: Transformer
+        :return: pixel rectangle of drawn object
+        :rtype: typing.Tuple[float, float, float, float]
+        """
+        return self.pixel_rect(trans)
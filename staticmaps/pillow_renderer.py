@@ -9,7 +9,9 @@ from PIL import Image as PIL_Image  # type: ignore
 from PIL import ImageDraw as PIL_ImageDraw  # type: ignore
 
 from .color import Color
-from .renderer import Renderer
+from .memory_cache import MemoryCache
+from .renderer import MosaicKeyT, Renderer, image_key
+from .tile_cache import TileDataT
 from .transformer import Transformer
 
 if typing.TYPE_CHECKING:
@@ -20,6 +22,12 @@ if typing.TYPE_CHECKING:
 class PillowRenderer(Renderer):
     """An image renderer using pillow that extends a generic renderer class"""
 
+    _image_cache: typing.Optional[MemoryCache[bytes, PIL_Image.Image]] = MemoryCache(
+        32 * 1024 * 1024, lambda image: 4 * image.width * image.height
+    )
+    _mosaic_cache: typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, PIL_Image.Image]]] = None
+    _mosaic_max_age = 3600.0
+
     def __init__(self, transformer: Transformer) -> None:
         Renderer.__init__(self, transformer)
         self._image = PIL_Image.new("RGBA", (self._trans.image_width(), self._trans.image_height()))
@@ -35,10 +43,44 @@ class PillowRenderer(Renderer):
     def offset_x(self) -> int:
         return self._offset_x
 
-    def alpha_compose(self, image: PIL_Image.Image) -> None:
-        assert image.size == self._image.size
-        self._image = PIL_Image.alpha_composite(self._image, image)
-        self._draw = PIL_ImageDraw.Draw(self._image)
+    def alpha_compose(self, image: PIL_Image.Image, position: typing.Tuple[int, int] = (0, 0)) -> None:
+        """Alpha-compose an RGBA image (e.g. a transparent overlay) onto the map image
+
+        Only the area covered by the image is composited, so overlays should be clipped to the drawn area.
+
+        :param image: RGBA image
+        :type image: PIL.Image
+        :param position: pixel position of the image's top-left corner on the map image (may be outside of the map)
+        :type position: typing.Tuple[int, int]
+        """
+        x, y = position
+        left = max(0, x)
+        top = max(0, y)
+        right = min(self._image.width, x + image.width)
+        bottom = min(self._image.height, y + image.height)
+        if left >= right or top >= bottom:
+            return
+        self._image.alpha_composite(image, dest=(left, top), source=(left - x, top - y, right - x, bottom - y))
+
+    def clipped_pixel_rect(
+        self, xys: typing.Sequence[typing.Tuple[float, float]], margin: int = 1
+    ) -> typing.Optional[typing.Tuple[int, int, int, int]]:
+        """Return the bounding box of pixel coordinates, clipped to the map image
+
+        :param xys: pixel coordinates
+        :type xys: typing.Sequence[typing.Tuple[float, float]]
+        :param margin: extra margin around the coordinates
+        :type margin: int
+        :return: integer pixel rectangle (left, top, right, bottom), None if it does not intersect the map image
+        :rtype: typing.Optional[typing.Tuple[int, int, int, int]]
+        """
+        left = max(0, math.floor(min(x for x, _ in xys)) - margin)
+        top = max(0, math.floor(min(y for _, y in xys)) - margin)
+        right = min(self._image.width, math.ceil(max(x for x, _ in xys)) + margin + 1)
+        bottom = min(self._image.height, math.ceil(max(y for _, y in xys)) + margin + 1)
+        if left >= right or top >= bottom:
+            return None
+        return left, top, right, bottom
 
     def render_objects(self, objects: typing.List["Object"]) -> None:
         """Render all objects of static map
@@ -46,11 +88,11 @@ class PillowRenderer(Renderer):
         :param objects: objects of static map
         :type objects: typing.List["Object"]
         """
-        x_count = math.ceil(self._trans.image_width() / (2 * self._trans.world_width()))
         for obj in objects:
-            for p in range(-x_count, x_count + 1):
-                self._offset_x = p * self._trans.world_width()
+            for offset_x in self.visible_world_offsets(obj):
+                self._offset_x = offset_x
                 obj.render_pillow(self)
+        self._offset_x = 0
 
     def render_background(self, color: typing.Optional[Color]) -> None:
         """Render background of static map
@@ -62,31 +104,86 @@ class PillowRenderer(Renderer):
             return
         self.draw().rectangle([(0, 0), self.image().size], fill=color.int_rgba())
 
-    def render_tiles(self, download: typing.Callable[[int, int, int], typing.Optional[bytes]]) -> None:
+    def render_tiles(self, download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]) -> bool:
         """Render background of static map
 
         :param download: url of tiles provider
-        :type download: typing.Callable[[int, int, int], typing.Optional[bytes]]
+        :type download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]
+        :return: True if no tile failed to download
+        :rtype: bool
         """
-        for yy in range(0, self._trans.tiles_y()):
-            y = self._trans.first_tile_y() + yy
-            if y < 0 or y >= self._trans.number_of_tiles():
-                continue
-            for xx in range(0, self._trans.tiles_x()):
-                x = (self._trans.first_tile_x() + xx) % self._trans.number_of_tiles()
-                try:
-                    tile_img = self.fetch_tile(download, x, y)
-                    if tile_img is None:
-                        continue
-                    self._image.paste(
-                        tile_img,
-                        (
-                            int(xx * self._trans.tile_size() + self._trans.tile_offset_x()),
-                            int(yy * self._trans.tile_size() + self._trans.tile_offset_y()),
-                        ),
-                    )
-                except RuntimeError:
-                    pass
+        complete = True
+        for xx, yy, x, y in self._trans.tiles():
+            try:
+                tile_img = self.fetch_tile(download, x, y)
+                if tile_img is None:
+                    continue
+                self._image.paste(
+                    tile_img,
+                    (
+                        int(xx * self._trans.tile_size() + self._trans.tile_offset_x()),
+                        int(yy * self._trans.tile_size() + self._trans.tile_offset_y()),
+                    ),
+                )
+            except RuntimeError:
+                complete = False
+        return complete
+
+    @classmethod
+    def set_mosaic_cache(
+        cls,
+        cache: typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, PIL_Image.Image]]],
+        max_age: float = 3600.0,
+    ) -> None:
+        """Set the cache of stitched basemaps shared by all pillow renderers (see Renderer.render_basemap)
+
+        Maps that only differ in their objects then share the tile work, e.g.
+        PillowRenderer.set_mosaic_cache(MemoryCache(64 * 1024 * 1024, lambda e: 4 * e[1].width * e[1].height))
+
+        The cache holds pairs of the creation time and the basemap (see Renderer.cached_mosaic). Cached basemaps do not
+        follow the cache ttl and Cache-Control max-age of the tiles; each one is stitched again max_age seconds after it
+        was cached, so updated tiles show up after at most max_age seconds (plus the tile ttl).
+
+        :param cache: cache of basemaps, None to disable caching (default)
+        :type cache: typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, PIL_Image.Image]]]
+        :param max_age: maximum age of cached basemaps in seconds, math.inf to keep them until they are evicted
+        :type max_age: float
+        :raises ValueError: raises value error for a non-positive max age
+        """
+        if max_age <= 0:
+            raise ValueError(f"Bad mosaic max age: {max_age}")
+        cls._mosaic_cache = cache
+        cls._mosaic_max_age = max_age
+
+    @classmethod
+    def mosaic_cache(cls) -> typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, PIL_Image.Image]]]:
+        return cls._mosaic_cache
+
+    @classmethod
+    def mosaic_max_age(cls) -> float:
+        return cls._mosaic_max_age
+
+    def load_mosaic(self, mosaic: PIL_Image.Image) -> None:
+        self._image = mosaic.copy()
+        self._draw = PIL_ImageDraw.Draw(self._image)
+
+    def save_mosaic(self) -> PIL_Image.Image:
+        return self._image.copy()
+
+    def result(self) -> PIL_Image.Image:
+        return self._image
+
+    @staticmethod
+    def encode_result(result: PIL_Image.Image) -> bytes:
+        buffer = io.BytesIO()
+        result.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    @staticmethod
+    def decode_result(data: bytes) -> PIL_Image.Image:
+        image = PIL_Image.open(io.BytesIO(data))
+        image.load()
+        return image
 
     def render_attribution(self, attribution: typing.Optional[str]) -> None:
         """Render attribution from given tiles provider
@@ -101,21 +198,22 @@ class PillowRenderer(Renderer):
         h = self._trans.image_height()
         _, top, _, bottom = self.draw().textbbox((margin, h - margin), attribution)
         th = bottom - top
-        overlay = PIL_Image.new("RGBA", self._image.size, (255, 255, 255, 0))
+        overlay_top = max(0, math.floor(h - th - 2 * margin))
+        overlay = PIL_Image.new("RGBA", (w, h - overlay_top), (255, 255, 255, 0))
         draw = PIL_ImageDraw.Draw(overlay)
-        draw.rectangle([(0, h - th - 2 * margin), (w, h)], fill=(255, 255, 255, 204))
-        self.alpha_compose(overlay)
+        draw.rectangle([(0, h - th - 2 * margin - overlay_top), (w, h - overlay_top)], fill=(255, 255, 255, 204))
+        self.alpha_compose(overlay, (0, overlay_top))
         self.draw().text((margin, h - th - margin), attribution, fill=(0, 0, 0, 255))
 
     def fetch_tile(
-        self, download: typing.Callable[[int, int, int], typing.Optional[bytes]], x: int, y: int
+        self, download: typing.Callable[[int, int, int], typing.Optional[TileDataT]], x: int, y: int
     ) -> typing.Optional[PIL_Image.Image]:
         """Fetch tiles from given tiles provider
 
         :param download: callable
         :param x: width
         :param y: height
-        :type download: typing.Callable[[int, int, int], typing.Optional[bytes]]
+        :type download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]
         :type x: int
         :type y: int
 
@@ -125,16 +223,45 @@ class PillowRenderer(Renderer):
         image_data = download(self._trans.zoom(), x, y)
         if image_data is None:
             return None
-        return PIL_Image.open(io.BytesIO(image_data))
+        return self.create_image(image_data)
 
-    @staticmethod
-    def create_image(image_data: bytes) -> PIL_Image.Image:
+    @classmethod
+    def set_image_cache(cls, cache: typing.Optional[MemoryCache[bytes, PIL_Image.Image]]) -> None:
+        """Set the cache of decoded images (tiles, image markers) shared by all pillow renderers
+
+        The cache is keyed by a digest of the encoded image data (see image_key); cached images must not be
+        modified.
+
+        :param cache: cache of decoded images, None to disable caching
+        :type cache: typing.Optional[MemoryCache[bytes, PIL_Image.Image]]
+        """
+        cls._image_cache = cache
+
+    @classmethod
+    def image_cache(cls) -> typing.Optional[MemoryCache[bytes, PIL_Image.Image]]:
+        """Return the cache of decoded images
+
+        :return: cache of decoded images
+        :rtype: typing.Optional[MemoryCache[bytes, PIL_Image.Image]]
+        """
+        return cls._image_cache
+
+    @classmethod
+    def create_image(cls, image_data: TileDataT) -> PIL_Image.Image:
         """Create a pillow image
 
         :param image_data: Image data
-        :type image_data: bytes
+        :type image_data: bytes, memoryview
 
-        :return: pillow image
+        :return: pillow image (RGBA)
         :rtype: PIL.Image
         """
-        return PIL_Image.open(io.BytesIO(image_data)).convert("RGBA")
+        cache = cls._image_cache
+        if cache is None:
+            return PIL_Image.open(io.BytesIO(image_data)).convert("RGBA")
+        key = image_key(image_data)
+        image = cache.get(key)
+        if image is None:
+            image = PIL_Image.open(io.BytesIO(image_data)).convert("RGBA")
+            cache.put(key, image)
+        return image
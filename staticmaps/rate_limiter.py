@@ -0,0 +1,68 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import threading
+import time
+
+
+class RateLimiter:
+    """A thread-safe token bucket limiting the rate of requests
+
+    :param rate: number of requests per second
+    :param burst: maximum number of requests that may be issued at once (default: 1)
+    :raises ValueError: raises value error for a non-positive rate or burst size
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        if rate <= 0:
+            raise ValueError(f"Bad rate: {rate}")
+        if burst < 1:
+            raise ValueError(f"Bad burst size: {burst}")
+        self._rate = rate
+        self._burst = burst
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._waited = 0.0
+
+    def rate(self) -> float:
+        """Return the number of requests per second
+
+        :return: rate
+        :rtype: float
+        """
+        return self._rate
+
+    def burst(self) -> int:
+        """Return the maximum number of requests that may be issued at once
+
+        :return: burst size
+        :rtype: int
+        """
+        return self._burst
+
+    def acquire(self) -> float:
+        """Wait until a request may be issued
+
+        :return: time in seconds spent waiting
+        :rtype: float
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(float(self._burst), self._tokens + (now - self._last) * self._rate)
+            self._last = now
+            # reserve a token; a negative balance is the time the caller has to wait for it
+            self._tokens -= 1.0
+            wait = 0.0 if self._tokens >= 0 else -self._tokens / self._rate
+            self._waited += wait
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def waited(self) -> float:
+        """Return the total time all callers of acquire spent waiting
+
+        :return: time in seconds
+        :rtype: float
+        """
+        return self._waited
@@ -0,0 +1,254 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import hashlib
+import os
+import pathlib
+import struct
+import threading
+import time
+import typing
+
+import s2sphere  # type: ignore
+
+from .atomic_file import atomic_open
+from .memory_cache import MemoryCache
+from .renderer import Renderer
+from .tile_cache import ACCESS_TIME_RESOLUTION
+from .tile_provider import TileProvider
+
+# nested tuples of None, bool, int, float, str and bytes values, see stable_hash
+ContentKeyT = typing.Tuple[typing.Any, ...]
+
+
+def stable_hash(value: typing.Any) -> str:
+    """Return a hash of a (nested) tuple of None, bool, int, float, str and bytes values
+
+    Unlike Python's hash(), the result is the same in every process and for every Python version.
+
+    :param value: value to hash
+    :type value: typing.Any
+    :return: hex digest
+    :rtype: str
+    :raises ValueError: raises value error for values of other types
+    """
+    h = hashlib.sha256()
+    _update(h, value)
+    return h.hexdigest()
+
+
+def _update(h: typing.Any, value: typing.Any) -> None:
+    # every value is tagged with its type and length, so different values never have the same encoding
+    if value is None:
+        h.update(b"N")
+    elif isinstance(value, bool):
+        h.update(b"T" if value else b"F")
+    elif isinstance(value, int):
+        h.update(f"I{value};".encode("ascii"))
+    elif isinstance(value, float):
+        h.update(b"D" + struct.pack("<d", value))
+    elif isinstance(value, str):
+        _update_bytes(h, b"S", value.encode("utf-8"))
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        _update_bytes(h, b"B", bytes(value))
+    elif isinstance(value, (tuple, list)):
+        h.update(f"({len(value)};".encode("ascii"))
+        for item in value:
+            _update(h, item)
+    else:
+        raise ValueError(f"Cannot hash value of type {type(value).__name__}")
+
+
+def _update_bytes(h: typing.Any, tag: bytes, data: bytes) -> None:
+    h.update(tag + f"{len(data)};".encode("ascii"))
+    h.update(data)
+
+
+class RenderCache:
+    """A cache of rendered maps (encoded images) keyed by the content hash of the map, see Context.content_hash
+
+    Results are kept in memory, and optionally in files <cache_dir>/<key[:2]>/<key>; both tiers are bounded in size,
+    evicting the least recently used results first.
+
+    :param max_bytes: maximum size of the results kept in memory in bytes
+    :param cache_dir: directory of the result files, None to keep results in memory only
+    :param max_disk_bytes: maximum size of the result files in bytes
+    :raises ValueError: raises value error for negative sizes
+    """
+
+    def __init__(
+        self, max_bytes: int, cache_dir: typing.Optional[str] = None, max_disk_bytes: int = 1024 * 1024 * 1024
+    ) -> None:
+        if max_disk_bytes < 0:
+            raise ValueError(f"'max_disk_bytes' must be >= 0: {max_disk_bytes}")
+        self._memory: MemoryCache[str, bytes] = MemoryCache(max_bytes, len)
+        self._cache_dir = cache_dir
+        self._max_disk_bytes = max_disk_bytes
+        self._written = 0
+        self._lock = threading.Lock()
+
+    def memory_cache(self) -> MemoryCache[str, bytes]:
+        """Return the in-memory tier of the cache
+
+        :return: memory cache
+        :rtype: MemoryCache[str, bytes]
+        """
+        return self._memory
+
+    def cache_dir(self) -> typing.Optional[str]:
+        """Return the directory of the result files
+
+        :return: cache directory, None if results are kept in memory only
+        :rtype: typing.Optional[str]
+        """
+        return self._cache_dir
+
+    def file_name(self, key: str) -> str:
+        """Return the name of the file of a cached result
+
+        :param key: cache key
+        :type key: str
+        :return: file name
+        :rtype: str
+        :raises RuntimeError: raises runtime error if results are kept in memory only
+        """
+        if self._cache_dir is None:
+            raise RuntimeError("Render cache has no cache directory")
+        return os.path.join(self._cache_dir, key[:2], key)
+
+    def get(self, key: str) -> typing.Optional[bytes]:
+        """Return a cached result
+
+        :param key: cache key
+        :type key: str
+        :return: encoded image, None if the result is not cached
+        :rtype: typing.Optional[bytes]
+        """
+        data = self._memory.get(key)
+        if data is not None or self._cache_dir is None:
+            return data
+        file_name = self.file_name(key)
+        try:
+            with open(file_name, "rb") as f:
+                data = f.read()
+                stat = os.fstat(f.fileno())
+        except FileNotFoundError:
+            return None
+        now = time.time()
+        if now - stat.st_atime > ACCESS_TIME_RESOLUTION:
+            try:
+                os.utime(file_name, (now, stat.st_mtime))
+            except OSError:
+                pass
+        self._memory.put(key, data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store a result
+
+        :param key: cache key
+        :type key: str
+        :param data: encoded image
+        :type data: bytes
+        """
+        self._memory.put(key, data)
+        if self._cache_dir is None:
+            return
+        file_name = self.file_name(key)
+        pathlib.Path(os.path.dirname(file_name)).mkdir(parents=True, exist_ok=True)
+        with atomic_open(file_name) as f:
+            f.write(data)
+        with self._lock:
+            # clean up after writing a tenth of the limit, like TileDownloader
+            self._written += len(data)
+            if self._written < self._max_disk_bytes // 10:
+                return
+            self._written = 0
+        self.cleanup()
+
+    def lookup(self, key: str, renderer: typing.Type[Renderer]) -> typing.Any:
+        """Return a cached rendered map
+
+        :param key: cache key
+        :type key: str
+        :param renderer: renderer class that produced the map, decodes the cached data
+        :type renderer: typing.Type[Renderer]
+        :return: rendered map, None if the map is not cached
+        :rtype: typing.Any
+        """
+        data = self.get(key)
+        return None if data is None else renderer.decode_result(data)
+
+    def store(self, key: str, renderer: Renderer, result: typing.Any) -> None:
+        """Store a rendered map
+
+        :param key: cache key
+        :type key: str
+        :param renderer: renderer that produced the map, encodes it
+        :type renderer: Renderer
+        :param result: rendered map
+        :type result: typing.Any
+        """
+        self.put(key, renderer.encode_result(result))
+
+    def cleanup(self) -> int:
+        """Remove the least recently used result files until they use at most max_disk_bytes
+
+        :return: number of removed files
+        :rtype: int
+        """
+        if self._cache_dir is None:
+            return 0
+        files = []
+        total = 0
+        for root, _, names in os.walk(self._cache_dir):
+            for name in names:
+                if name.startswith("."):
+                    continue
+                file_name = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_name)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_atime, stat.st_size, file_name))
+                total += stat.st_size
+        removed = 0
+        for _, size, file_name in sorted(files):
+            if total <= self._max_disk_bytes:
+                break
+            try:
+                os.remove(file_name)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        return removed
+
+
+def provider_key(provider: TileProvider) -> ContentKeyT:
+    """Return everything about a tile provider that determines the tiles it serves, see Context.content_hash
+
+    :param provider: tile provider
+    :type provider: TileProvider
+    :return: content key of the tile provider
+    :rtype: ContentKeyT
+    """
+    return (
+        provider.name(),
+        provider.url_pattern(),
+        provider.api_key(),
+        provider.attribution(),
+        provider.tile_size(),
+        provider.max_zoom(),
+    )
+
+
+def rect_key(rect: s2sphere.LatLngRect) -> ContentKeyT:
+    """Return the content key of a rectangle, see Context.content_hash
+
+    :param rect: rectangle
+    :type rect: s2sphere.LatLngRect
+    :return: corners of the rectangle in radians
+    :rtype: ContentKeyT
+    """
+    return rect.lat_lo().radians, rect.lng_lo().radians, rect.lat_hi().radians, rect.lng_hi().radians
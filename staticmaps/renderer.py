@@ -2,9 +2,15 @@
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
 from abc import ABC, abstractmethod
+import hashlib
+import math
+import time
 import typing
 
 from .color import Color
+from .memory_cache import MemoryCache
+from .tile_cache import TileDataT
+from .tile_provider import TileProvider
 from .transformer import Transformer
 
 
@@ -16,12 +22,65 @@ if typing.TYPE_CHECKING:
     from .marker import Marker  # pylint: disable=cyclic-import
     from .object import Object  # pylint: disable=cyclic-import
 
+MosaicKeyT = typing.Tuple[typing.Any, ...]
+
+
+def image_key(image_data: TileDataT) -> bytes:
+    """Return the key of encoded image data in an image cache (see PillowRenderer.set_image_cache)
+
+    The key is a digest of the data: keying by the data itself would keep the encoded images alive, and their size is
+    not counted against the limit of the cache.
+
+    :param image_data: encoded image data
+    :type image_data: bytes, memoryview
+    :return: image key
+    :rtype: bytes
+    """
+    return hashlib.blake2b(image_data, digest_size=16).digest()
+
+
+def mosaic_key(trans: Transformer, provider: TileProvider, color: typing.Optional[Color]) -> MosaicKeyT:
+    """Return the key of the stitched basemap (background and tiles) of a map in a mosaic cache
+
+    Maps with the same key have identical basemaps, whatever objects are drawn on top of them.
+
+    :param trans: transformer of the map
+    :type trans: Transformer
+    :param provider: tile provider
+    :type provider: TileProvider
+    :param color: background color
+    :type color: typing.Optional[Color]
+    :return: mosaic key
+    :rtype: MosaicKeyT
+    """
+    return (
+        provider.name(),
+        provider.url_pattern(),
+        provider.api_key(),
+        trans.zoom(),
+        trans.first_tile_x(),
+        trans.first_tile_y(),
+        trans.tiles_x(),
+        trans.tiles_y(),
+        trans.tile_offset_x(),
+        trans.tile_offset_y(),
+        trans.tile_size(),
+        trans.image_size(),
+        None if color is None else color.int_rgba(),
+    )
+
 
 class Renderer(ABC):
     """A generic renderer class"""
 
+    # pylint: disable=too-many-public-methods
+
     def __init__(self, transformer: Transformer) -> None:
         self._trans = transformer
+        self._culled_objects = 0
+        self._culled_world_copies = 0
+        self._simplification_tolerance = 0.0
+        self._projections: typing.Dict[int, typing.Any] = {}
 
     def transformer(self) -> Transformer:
         """Return transformer object
@@ -31,6 +90,85 @@ class Renderer(ABC):
         """
         return self._trans
 
+    def simplification_tolerance(self) -> float:
+        """Return the tolerance for simplifying lines and areas
+
+        :return: tolerance in pixels (0 = no simplification)
+        :rtype: float
+        """
+        return self._simplification_tolerance
+
+    def set_simplification_tolerance(self, tolerance: float) -> None:
+        """Set the tolerance for simplifying lines and areas
+
+        :param tolerance: tolerance in pixels (0 = no simplification)
+        :type tolerance: float
+        :raises ValueError: raises a value error for a negative tolerance
+        """
+        if tolerance < 0:
+            raise ValueError(f"Bad simplification tolerance: {tolerance}")
+        self._simplification_tolerance = tolerance
+
+    def projections(self) -> typing.Dict[int, typing.Any]:
+        """Return the projected geometry (e.g. pixel coordinates of lines) of the rendered objects by id(object)
+
+        Objects drawn several times (e.g. once per visible world copy) are projected only once.
+
+        :return: projected geometry by object id
+        :rtype: typing.Dict[int, typing.Any]
+        """
+        return self._projections
+
+    def set_projections(self, projections: typing.Dict[int, typing.Any]) -> None:
+        """Share the projected geometry with other renderers of the same layout, see Context.render_many
+
+        :param projections: projected geometry by object id
+        :type projections: typing.Dict[int, typing.Any]
+        """
+        self._projections = projections
+
+    def culled_objects(self) -> int:
+        """Return the number of objects that were skipped, because they do not touch the image
+
+        :return: number of skipped objects
+        :rtype: int
+        """
+        return self._culled_objects
+
+    def culled_world_copies(self) -> int:
+        """Return the number of (horizontal) world copies of objects that were skipped, because they do not touch the
+        image
+
+        :return: number of skipped world copies
+        :rtype: int
+        """
+        return self._culled_world_copies
+
+    def visible_world_offsets(self, obj: "Object") -> typing.List[int]:
+        """Return the horizontal pixel offsets of the world copies of an object that may touch the image
+
+        :param obj: map object
+        :type obj: Object
+        :return: horizontal pixel offsets
+        :rtype: typing.List[int]
+        """
+        width, height = self._trans.image_size()
+        world_width = self._trans.world_width()
+        x_count = math.ceil(width / (2 * world_width))
+        offsets = [p * world_width for p in range(-x_count, x_count + 1)]
+        left, top, right, bottom = obj.render_pixel_rect(self._trans)
+        if right < left:
+            # the object crosses the antimeridian => don't cull horizontally
+            visible = offsets
+        elif bottom < 0 or top > height:
+            visible = []
+        else:
+            visible = [offset for offset in offsets if left + offset <= width and right + offset >= 0]
+        if not visible:
+            self._culled_objects += 1
+        self._culled_world_copies += len(offsets) - len(visible)
+        return visible
+
     @abstractmethod
     def render_objects(self, objects: typing.List["Object"]) -> None:
         """Render all objects of static map
@@ -48,12 +186,144 @@ class Renderer(ABC):
         """
 
     @abstractmethod
-    def render_tiles(self, download: typing.Callable[[int, int, int], typing.Optional[bytes]]) -> None:
+    def render_tiles(self, download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]) -> bool:
         """Render background of static map
 
         :param download: url of tiles provider
-        :type download: typing.Callable[[int, int, int], typing.Optional[bytes]]
+        :type download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]
+        :return: True if no tile failed to download
+        :rtype: bool
+        """
+
+    @classmethod
+    def mosaic_cache(cls) -> typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, typing.Any]]]:
+        """Return the cache of stitched basemaps used by render_basemap
+
+        The cached values are pairs of the creation time (seconds since the epoch) and the basemap.
+
+        :return: mosaic cache, None for renderers that do not cache basemaps
+        :rtype: typing.Optional[MemoryCache[MosaicKeyT, typing.Tuple[float, typing.Any]]]
+        """
+        return None
+
+    @classmethod
+    def mosaic_max_age(cls) -> float:
+        """Return the maximum age of cached basemaps
+
+        :return: maximum age of cached basemaps in seconds
+        :rtype: float
+        """
+        return math.inf
+
+    @classmethod
+    def cached_mosaic(cls, key: MosaicKeyT) -> typing.Optional[typing.Any]:
+        """Return a cached basemap that is younger than mosaic_max_age
+
+        Cached basemaps are not revalidated like tiles (see TileProvider.set_cache_ttl); instead each basemap is only
+        used for mosaic_max_age seconds after it was stitched, and then stitched from the (revalidated) tiles again.
+
+        :param key: mosaic key (see mosaic_key)
+        :type key: MosaicKeyT
+        :return: cached basemap, None if there is no cached basemap or it is too old
+        :rtype: typing.Optional[typing.Any]
+        """
+        cache = cls.mosaic_cache()
+        if cache is None:
+            return None
+        entry = cache.get(key)
+        if entry is None:
+            return None
+        created, mosaic = entry
+        if time.time() - created >= cls.mosaic_max_age():
+            return None
+        return mosaic
+
+    def render_basemap(
+        self,
+        color: typing.Optional[Color],
+        download: typing.Callable[[int, int, int], typing.Optional[TileDataT]],
+        provider: TileProvider,
+    ) -> bool:
+        """Render background and tiles of static map
+
+        Renderers with a mosaic cache start from a copy of the cached basemap of an identical viewport (see
+        mosaic_key and cached_mosaic) instead of drawing the tiles again; basemaps are only cached if no tile failed to
+        download.
+
+        :param color: background color
+        :type color: typing.Optional[Color]
+        :param download: url of tiles provider
+        :type download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]
+        :param provider: tile provider
+        :type provider: TileProvider
+        :return: True if no tile failed to download
+        :rtype: bool
+        """
+        cache = self.mosaic_cache()
+        if cache is None:
+            self.render_background(color)
+            return self.render_tiles(download)
+        key = mosaic_key(self._trans, provider, color)
+        mosaic = self.cached_mosaic(key)
+        if mosaic is not None:
+            self.load_mosaic(mosaic)
+            return True
+        self.render_background(color)
+        if not self.render_tiles(download):
+            return False
+        cache.put(key, (time.time(), self.save_mosaic()))
+        return True
+
+    def load_mosaic(self, mosaic: typing.Any) -> None:
+        """Replace the map image by a copy of a cached basemap
+
+        :param mosaic: cached basemap
+        :type mosaic: typing.Any
+        :raises RuntimeError: raises runtime error if the renderer does not cache basemaps
+        """
+        raise RuntimeError(f"{type(self).__name__} does not support mosaic caching")
+
+    def save_mosaic(self) -> typing.Any:
+        """Return a copy of the map image (background and tiles) to be stored in the mosaic cache
+
+        :return: basemap
+        :rtype: typing.Any
+        :raises RuntimeError: raises runtime error if the renderer does not cache basemaps
+        """
+        raise RuntimeError(f"{type(self).__name__} does not support mosaic caching")
+
+    @abstractmethod
+    def result(self) -> typing.Any:
+        """Return the rendered map (pillow image, cairo image surface or svg drawing)
+
+        :return: rendered map
+        :rtype: typing.Any
+        """
+
+    @staticmethod
+    def encode_result(result: typing.Any) -> bytes:
+        """Encode a rendered map (as returned by Context.render_*) for a RenderCache
+
+        :param result: rendered map
+        :type result: typing.Any
+        :return: encoded map
+        :rtype: bytes
+        :raises RuntimeError: raises runtime error if the renderer does not support result caching
+        """
+        raise RuntimeError(f"Cannot encode {type(result).__name__}")
+
+    @staticmethod
+    def decode_result(data: bytes) -> typing.Any:
+        """Decode a rendered map encoded by encode_result
+
+        :param data: encoded map
+        :type data: bytes
+        :return: rendered map
+        :rtype: typing.Any
+        :raises RuntimeError: raises runtime error if the renderer does not support result caching
         """
+        # pylint: disable=unused-argument
+        raise RuntimeError("Cannot decode rendered map")
 
     def render_marker_object(self, marker: "Marker") -> None:
         """Render marker object of static map
@@ -0,0 +1,58 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import typing
+
+PointT = typing.Tuple[float, float]
+
+
+def simplify_polyline(points: typing.Sequence[PointT], tolerance: float) -> typing.List[PointT]:
+    """Simplify a polyline using the Douglas-Peucker algorithm
+
+    The first and the last point are always kept, so closed polylines (polygon rings) stay closed.
+
+    :param points: points of the polyline
+    :type points: typing.Sequence[PointT]
+    :param tolerance: maximum distance of removed points to the simplified polyline
+    :type tolerance: float
+    :return: simplified polyline
+    :rtype: typing.List[PointT]
+    """
+    n = len(points)
+    if n < 3 or tolerance <= 0:
+        return list(points)
+
+    keep = [False] * n
+    keep[0] = True
+    keep[n - 1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        index, distance2 = _farthest_point(points, first, last)
+        if distance2 > tolerance * tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+
+def _farthest_point(points: typing.Sequence[PointT], first: int, last: int) -> typing.Tuple[int, float]:
+    """Return the index and squared distance of the point between 'first' and 'last' that is farthest from the segment
+    connecting 'first' and 'last' (the distance to the segment instead of the line through it keeps spikes)"""
+    x1, y1 = points[first]
+    dx = points[last][0] - x1
+    dy = points[last][1] - y1
+    length2 = dx * dx + dy * dy
+    max_distance2 = -1.0
+    max_index = first
+    for i in range(first + 1, last):
+        px = points[i][0] - x1
+        py = points[i][1] - y1
+        t = 0.0 if length2 == 0 else min(1.0, max(0.0, (px * dx + py * dy) / length2))
+        distance2 = (px - t * dx) ** 2 + (py - t * dy) ** 2
+        if distance2 > max_distance2:
+            max_distance2 = distance2
+            max_index = i
+    return max_index, max_distance2
@@ -0,0 +1,70 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import threading
+import typing
+
+KeyT = typing.TypeVar("KeyT")
+ValueT = typing.TypeVar("ValueT")
+
+
+class _Call(typing.Generic[ValueT]):
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: typing.Optional[ValueT] = None
+        self.error: typing.Optional[BaseException] = None
+
+
+class SingleFlight(typing.Generic[KeyT, ValueT]):
+    """Coalesce concurrent calls for the same key: the first caller does the work, all others wait for its result
+
+    Used to download a tile only once if several threads request it at the same time.
+    """
+
+    def __init__(self) -> None:
+        self._calls: typing.Dict[KeyT, _Call[ValueT]] = {}
+        self._lock = threading.Lock()
+        self._shared = 0
+
+    def do(self, key: KeyT, function: typing.Callable[[], ValueT]) -> ValueT:
+        """Call function, unless a call for the same key is in flight; then wait for and return that call's result
+
+        :param key: key of the call
+        :type key: KeyT
+        :param function: function computing the result
+        :type function: typing.Callable[[], ValueT]
+        :return: result of the function (its exceptions are re-raised in all waiting threads)
+        :rtype: ValueT
+        """
+        with self._lock:
+            existing = self._calls.get(key)
+            if existing is None:
+                call: _Call[ValueT] = _Call()
+                self._calls[key] = call
+            else:
+                self._shared += 1
+        if existing is not None:
+            existing.done.wait()
+            if existing.error is not None:
+                raise existing.error
+            return typing.cast(ValueT, existing.result)
+
+        try:
+            result = function()
+            call.result = result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return result
+
+    def shared(self) -> int:
+        """Return the number of calls that were served by the result of another call in flight
+
+        :return: number of calls
+        :rtype: int
+        """
+        return self._shared
@@ -2,13 +2,14 @@
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
 import base64
-import math
 import typing
+import xml.etree.ElementTree as ET
 
 import svgwrite  # type: ignore
 
 from .color import Color, BLACK, WHITE
 from .renderer import Renderer
+from .tile_cache import TileDataT
 from .transformer import Transformer
 
 if typing.TYPE_CHECKING:
@@ -16,6 +17,23 @@ if typing.TYPE_CHECKING:
     from .object import Object  # pylint: disable=cyclic-import
 
 
+class CachedDrawing(svgwrite.Drawing):
+    """An svg drawing restored from a RenderCache
+
+    The drawing is read-only: its markup (as returned by tostring, write, save and saveas) is the cached markup,
+    elements added to the drawing are ignored.
+
+    :param markup: svg markup
+    """
+
+    def __init__(self, markup: str) -> None:
+        super().__init__()
+        self._markup = markup
+
+    def tostring(self) -> str:
+        return self._markup
+
+
 class SvgRenderer(Renderer):
     """An svg image renderer class that extends a generic renderer class"""
 
@@ -52,14 +70,11 @@ class SvgRenderer(Renderer):
         :param objects: objects of static map
         :type objects: typing.List["Object"]
         """
-        x_count = math.ceil(self._trans.image_width() / (2 * self._trans.world_width()))
         for obj in objects:
-            for p in range(-x_count, x_count + 1):
-                self._group = self._draw.g(
-                    clip_path="url(#page)", transform=f"translate({p * self._trans.world_width()}, 0)"
-                )
+            for offset_x in self.visible_world_offsets(obj):
+                self._group = self._draw.g(clip_path="url(#page)", transform=f"translate({offset_x}, 0)")
                 obj.render_svg(self)
-                self._draw.add(self._group)
+                self._add(self._group)
                 self._group = None
 
     def render_background(self, color: typing.Optional[Color]) -> None:
@@ -72,38 +87,55 @@ class SvgRenderer(Renderer):
             return
         group = self._draw.g(clip_path="url(#page)")
         group.add(self._draw.rect(insert=(0, 0), size=self._trans.image_size(), rx=None, ry=None, fill=color.hex_rgb()))
-        self._draw.add(group)
+        self._add(group)
 
-    def render_tiles(self, download: typing.Callable[[int, int, int], typing.Optional[bytes]]) -> None:
+    def render_tiles(self, download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]) -> bool:
         """Render background of static map
 
         :param download: url of tiles provider
-        :type download: typing.Callable[[int, int, int], typing.Optional[bytes]]
+        :type download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]
+        :return: True if no tile failed to download
+        :rtype: bool
         """
+        complete = True
         group = self._draw.g(clip_path="url(#page)")
-        for yy in range(0, self._trans.tiles_y()):
-            y = self._trans.first_tile_y() + yy
-            if y < 0 or y >= self._trans.number_of_tiles():
-                continue
-            for xx in range(0, self._trans.tiles_x()):
-                x = (self._trans.first_tile_x() + xx) % self._trans.number_of_tiles()
-                try:
-                    tile_img = self.fetch_tile(download, x, y)
-                    if tile_img is None:
-                        continue
-                    group.add(
-                        self._draw.image(
-                            tile_img,
-                            insert=(
-                                xx * self._trans.tile_size() + self._trans.tile_offset_x(),
-                                yy * self._trans.tile_size() + self._trans.tile_offset_y(),
-                            ),
-                            size=(self._trans.tile_size(), self._trans.tile_size()),
-                        )
-                    )
-                except RuntimeError:
-                    pass
-        self._draw.add(group)
+        for xx, yy, x, y in self._trans.tiles():
+            try:
+                tile_img = self.fetch_tile(download, x, y)
+                if tile_img is None:
+                    continue
+                self._add_tile(
+                    group,
+                    self._draw.image(
+                        tile_img,
+                        insert=(
+                            xx * self._trans.tile_size() + self._trans.tile_offset_x(),
+                            yy * self._trans.tile_size() + self._trans.tile_offset_y(),
+                        ),
+                        size=(self._trans.tile_size(), self._trans.tile_size()),
+                    ),
+                )
+            except RuntimeError:
+                complete = False
+        self._add(group)
+        return complete
+
+    def _add(self, element: svgwrite.base.BaseElement) -> None:
+        self._draw.add(element)
+
+    def _add_tile(self, group: svgwrite.container.Group, image: svgwrite.image.Image) -> None:
+        group.add(image)
+
+    def result(self) -> svgwrite.Drawing:
+        return self._draw
+
+    @staticmethod
+    def encode_result(result: svgwrite.Drawing) -> bytes:
+        return result.tostring().encode("utf-8")
+
+    @staticmethod
+    def decode_result(data: bytes) -> svgwrite.Drawing:
+        return CachedDrawing(data.decode("utf-8"))
 
     def render_attribution(self, attribution: typing.Optional[str]) -> None:
         """Render attribution from given tiles provider
@@ -133,17 +165,17 @@ class SvgRenderer(Renderer):
                 fill=BLACK.hex_rgb(),
             )
         )
-        self._draw.add(group)
+        self._add(group)
 
     def fetch_tile(
-        self, download: typing.Callable[[int, int, int], typing.Optional[bytes]], x: int, y: int
+        self, download: typing.Callable[[int, int, int], typing.Optional[TileDataT]], x: int, y: int
     ) -> typing.Optional[str]:
         """Fetch tiles from given tiles provider
 
         :param download: callable
         :param x: width
         :param y: height
-        :type download: typing.Callable[[int, int, int], typing.Optional[bytes]]
+        :type download: typing.Callable[[int, int, int], typing.Optional[TileDataT]]
         :type x: int
         :type y: int
 
@@ -156,11 +188,11 @@ class SvgRenderer(Renderer):
         return SvgRenderer.create_inline_image(image_data)
 
     @staticmethod
-    def guess_image_mime_type(data: bytes) -> str:
+    def guess_image_mime_type(data: TileDataT) -> str:
         """Guess mime type from image data
 
         :param data: image data
-        :type data: bytes
+        :type data: bytes, memoryview
         :return: mime type
         :rtype: str
         """
@@ -171,14 +203,58 @@ class SvgRenderer(Renderer):
         return "image/png"
 
     @staticmethod
-    def create_inline_image(image_data: bytes) -> str:
+    def create_inline_image(image_data: TileDataT) -> str:
         """Create an svg inline image
 
         :param image_data: Image data
-        :type image_data: bytes
+        :type image_data: bytes, memoryview
 
         :return: svg inline image
         :rtype: str
         """
         image_type = SvgRenderer.guess_image_mime_type(image_data)
         return f"data:{image_type};base64,{base64.b64encode(image_data).decode('utf-8')}"
+
+
+class StreamingSvgRenderer(SvgRenderer):
+    """An svg renderer writing the elements of the image to a file-like object as soon as they are rendered
+
+    The output is the same as writing the drawing of an SvgRenderer (see svgwrite.Drawing.write), but the document is
+    never held in memory: tiles are written one by one, and the elements of each object are written (and released) as
+    soon as the object is rendered. Call finish after rendering to close the document.
+
+    :param transformer: transformer of the map
+    :param fileobj: text file-like object receiving the svg document
+    """
+
+    def __init__(self, transformer: Transformer, fileobj: typing.IO[str]) -> None:
+        SvgRenderer.__init__(self, transformer)
+        self._fileobj = fileobj
+        self._started = False
+        self._open_group: typing.Optional[svgwrite.container.Group] = None
+
+    def finish(self) -> None:
+        """Write the end of the svg document"""
+        self._write("</svg>")
+
+    def _write(self, markup: str) -> None:
+        if not self._started:
+            self._started = True
+            # the drawing itself only holds the definitions, its markup is the start of the document
+            self._fileobj.write('<?xml version="1.0" encoding="utf-8" ?>\n')
+            self._fileobj.write(self._draw.tostring()[: -len("</svg>")])
+        self._fileobj.write(markup)
+
+    def _add(self, element: svgwrite.base.BaseElement) -> None:
+        if element is self._open_group:
+            self._open_group = None
+            self._write("</g>")
+        else:
+            self._write(element.tostring())
+
+    def _add_tile(self, group: svgwrite.container.Group, image: svgwrite.image.Image) -> None:
+        if group is not self._open_group:
+            self._open_group = group
+            start = ET.tostring(group.get_xml(), encoding="unicode", short_empty_elements=False)
+            self._write(start[: -len("</g>")])
+        self._write(image.tostring())
@@ -0,0 +1,381 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+from abc import ABC, abstractmethod
+import json
+import os
+import pathlib
+import time
+import typing
+
+import slugify  # type: ignore
+
+from .atomic_file import atomic_open
+from .tile_provider import TileProvider
+
+TileIndexT = typing.Tuple[int, int, int]
+# tile data as stored in a tile cache: bytes, or a read-only memoryview for zero-copy backends (e.g. TilePack)
+TileDataT = typing.Union[bytes, memoryview]  # pylint: disable=invalid-name
+
+_sanitized_names: typing.Dict[str, str] = {}
+
+# access times of cached tiles are only updated if they are older than this (in seconds), like 'relatime'
+ACCESS_TIME_RESOLUTION = 3600.0
+
+
+def sanitized_name(name: str) -> str:
+    """Return a file system friendly version of a (tile provider) name
+
+    :param name: name to sanitize
+    :type name: str
+    :return: sanitized name
+    :rtype: str
+    """
+    sanitized = _sanitized_names.get(name)
+    if sanitized is None:
+        sanitized = slugify.slugify(name)
+        if sanitized is None:
+            sanitized = "_"
+        _sanitized_names[name] = sanitized
+    return sanitized
+
+
+class TileMetadata:
+    """Freshness information of a cached tile
+
+    :param fetched: time (seconds since the epoch) the tile was downloaded or last revalidated
+    :param etag: ETag header of the tile server's response
+    :param last_modified: Last-Modified header of the tile server's response
+    :param max_age: lifetime of the tile in seconds from the Cache-Control header of the tile server's response
+    """
+
+    def __init__(
+        self,
+        fetched: float,
+        etag: typing.Optional[str] = None,
+        last_modified: typing.Optional[str] = None,
+        max_age: typing.Optional[float] = None,
+    ) -> None:
+        self._fetched = fetched
+        self._etag = etag
+        self._last_modified = last_modified
+        self._max_age = max_age
+
+    def fetched(self) -> float:
+        """Return the time the tile was downloaded or last revalidated
+
+        :return: seconds since the epoch
+        :rtype: float
+        """
+        return self._fetched
+
+    def etag(self) -> typing.Optional[str]:
+        """Return the ETag of the tile
+
+        :return: ETag, None if the server did not send one
+        :rtype: typing.Optional[str]
+        """
+        return self._etag
+
+    def last_modified(self) -> typing.Optional[str]:
+        """Return the modification date of the tile
+
+        :return: Last-Modified header value, None if the server did not send one
+        :rtype: typing.Optional[str]
+        """
+        return self._last_modified
+
+    def max_age(self) -> typing.Optional[float]:
+        """Return the lifetime of the tile announced by the tile server
+
+        :return: max-age in seconds, None if the server did not send one
+        :rtype: typing.Optional[float]
+        """
+        return self._max_age
+
+    def age(self) -> float:
+        """Return the time since the tile was downloaded or last revalidated
+
+        :return: age in seconds
+        :rtype: float
+        """
+        return time.time() - self._fetched
+
+
+class TileCache(ABC):
+    """A persistent storage for downloaded tiles"""
+
+    @abstractmethod
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileDataT]:
+        """Return the data of a cached tile
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param zoom: zoom level of the tile
+        :type zoom: int
+        :param x: x index of the tile
+        :type x: int
+        :param y: y index of the tile
+        :type y: int
+        :return: tile data, None if the tile is not cached
+        :rtype: typing.Optional[TileDataT]
+        """
+        return None
+
+    @abstractmethod
+    def put(
+        self,
+        provider: TileProvider,
+        zoom: int,
+        x: int,
+        y: int,
+        data: bytes,
+        *,
+        metadata: typing.Optional[TileMetadata] = None,
+    ) -> None:
+        """Store the data of a tile
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param zoom: zoom level of the tile
+        :type zoom: int
+        :param x: x index of the tile
+        :type x: int
+        :param y: y index of the tile
+        :type y: int
+        :param data: tile data
+        :type data: bytes
+        :param metadata: freshness information of the tile, None if unknown
+        :type metadata: typing.Optional[TileMetadata]
+        """
+        return
+
+    def metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        """Return the freshness information of a cached tile
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param zoom: zoom level of the tile
+        :type zoom: int
+        :param x: x index of the tile
+        :type x: int
+        :param y: y index of the tile
+        :type y: int
+        :return: freshness information, None if the tile is not cached or never expires (e.g. tiles of a tile pack)
+        :rtype: typing.Optional[TileMetadata]
+        """
+        # pylint: disable=unused-argument
+        return None
+
+    def set_metadata(self, provider: TileProvider, zoom: int, x: int, y: int, metadata: TileMetadata) -> None:
+        """Update the freshness information of a cached tile, e.g. after the tile server confirmed it is unchanged
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param zoom: zoom level of the tile
+        :type zoom: int
+        :param x: x index of the tile
+        :type x: int
+        :param y: y index of the tile
+        :type y: int
+        :param metadata: freshness information
+        :type metadata: TileMetadata
+        """
+        # pylint: disable=unused-argument
+
+    def cleanup(self, max_bytes: int) -> int:
+        """Remove the least recently used tiles until the cached tiles use at most max_bytes
+
+        :param max_bytes: maximum size of all cached tiles in bytes
+        :type max_bytes: int
+        :return: number of removed tiles (0 if the backend does not support cleaning up)
+        :rtype: int
+        """
+        # pylint: disable=unused-argument
+        return 0
+
+    def contains(self, provider: TileProvider, zoom: int, x: int, y: int) -> bool:
+        """Return whether a tile is cached
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param zoom: zoom level of the tile
+        :type zoom: int
+        :param x: x index of the tile
+        :type x: int
+        :param y: y index of the tile
+        :type y: int
+        :return: True if the tile is cached
+        :rtype: bool
+        """
+        return self.get(provider, zoom, x, y) is not None
+
+    def get_many(
+        self, provider: TileProvider, tiles: typing.Iterable[TileIndexT]
+    ) -> typing.Dict[TileIndexT, TileDataT]:
+        """Return the data of all cached tiles of a list of tiles
+
+        Backends should override this method if they can read several tiles at once.
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param tiles: (zoom, x, y) indexes of the requested tiles
+        :type tiles: typing.Iterable[TileIndexT]
+        :return: tile data by (zoom, x, y); tiles that are not cached are missing
+        :rtype: typing.Dict[TileIndexT, TileDataT]
+        """
+        result = {}
+        for zoom, x, y in tiles:
+            data = self.get(provider, zoom, x, y)
+            if data is not None:
+                result[(zoom, x, y)] = data
+        return result
+
+    def close(self) -> None:
+        """Release all resources (files, connections) held by the cache"""
+
+
+class FileTileCache(TileCache):
+    """The default tile cache, storing each tile in a file <cache_dir>/<provider>/<zoom>/<x>/<y>.png
+
+    Files are written atomically (to a temporary file that is renamed), so readers never see partially written tiles.
+
+    :param cache_dir: cache directory
+    """
+
+    def __init__(self, cache_dir: str) -> None:
+        self._cache_dir = cache_dir
+
+    def cache_dir(self) -> str:
+        """Return the cache directory
+
+        :return: cache directory
+        :rtype: str
+        """
+        return self._cache_dir
+
+    def file_name(self, provider: TileProvider, zoom: int, x: int, y: int) -> str:
+        """Return the name of the file of a tile
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param zoom: zoom level of the tile
+        :type zoom: int
+        :param x: x index of the tile
+        :type x: int
+        :param y: y index of the tile
+        :type y: int
+        :return: file name
+        :rtype: str
+        """
+        return os.path.join(self._cache_dir, sanitized_name(provider.name()), str(zoom), str(x), f"{y}.png")
+
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        file_name = self.file_name(provider, zoom, x, y)
+        try:
+            with open(file_name, "rb") as f:
+                data = f.read()
+                stat = os.fstat(f.fileno())
+        except FileNotFoundError:
+            return None
+        # the access time drives cleanup; set it explicitly, as many file systems are mounted with 'noatime'
+        now = time.time()
+        if now - stat.st_atime > ACCESS_TIME_RESOLUTION:
+            try:
+                os.utime(file_name, (now, stat.st_mtime))
+            except OSError:
+                pass
+        return data
+
+    def put(
+        self,
+        provider: TileProvider,
+        zoom: int,
+        x: int,
+        y: int,
+        data: bytes,
+        *,
+        metadata: typing.Optional[TileMetadata] = None,
+    ) -> None:
+        file_name = self.file_name(provider, zoom, x, y)
+        pathlib.Path(os.path.dirname(file_name)).mkdir(parents=True, exist_ok=True)
+        with atomic_open(file_name) as f:
+            f.write(data)
+        self._write_metadata(file_name, metadata)
+
+    def contains(self, provider: TileProvider, zoom: int, x: int, y: int) -> bool:
+        return os.path.isfile(self.file_name(provider, zoom, x, y))
+
+    def metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        # the fetch time is the modification time of the tile file, validators are stored in a sidecar file
+        file_name = self.file_name(provider, zoom, x, y)
+        try:
+            fetched = os.stat(file_name).st_mtime
+        except FileNotFoundError:
+            return None
+        try:
+            with open(f"{file_name}.meta", "r", encoding="utf-8") as f:
+                validators = json.load(f)
+        except (OSError, ValueError):
+            return TileMetadata(fetched)
+        return TileMetadata(fetched, validators.get("etag"), validators.get("last_modified"), validators.get("max_age"))
+
+    def set_metadata(self, provider: TileProvider, zoom: int, x: int, y: int, metadata: TileMetadata) -> None:
+        file_name = self.file_name(provider, zoom, x, y)
+        if os.path.isfile(file_name):
+            self._write_metadata(file_name, metadata)
+
+    def cleanup(self, max_bytes: int) -> int:
+        files = []
+        total = 0
+        for root, _, names in os.walk(self._cache_dir):
+            for name in names:
+                if not name.endswith(".png"):
+                    continue
+                file_name = os.path.join(root, name)
+                try:
+                    stat = os.stat(file_name)
+                except FileNotFoundError:
+                    continue
+                # the metadata sidecar file counts towards the size of its tile
+                size = stat.st_size + self._meta_size(file_name)
+                files.append((stat.st_atime, size, file_name))
+                total += size
+        removed = 0
+        for _, size, file_name in sorted(files):
+            if total <= max_bytes:
+                break
+            for name in (file_name, f"{file_name}.meta"):
+                try:
+                    os.remove(name)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        return removed
+
+    @staticmethod
+    def _meta_size(file_name: str) -> int:
+        try:
+            return os.stat(f"{file_name}.meta").st_size
+        except FileNotFoundError:
+            return 0
+
+    @staticmethod
+    def _write_metadata(file_name: str, metadata: typing.Optional[TileMetadata]) -> None:
+        meta_file_name = f"{file_name}.meta"
+        if metadata is None or (
+            metadata.etag() is None and metadata.last_modified() is None and metadata.max_age() is None
+        ):
+            try:
+                os.remove(meta_file_name)
+            except FileNotFoundError:
+                pass
+        else:
+            with atomic_open(meta_file_name, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"etag": metadata.etag(), "last_modified": metadata.last_modified(), "max_age": metadata.max_age()},
+                    f,
+                )
+        if metadata is not None:
+            os.utime(file_name, (time.time(), metadata.fetched()))
@@ -1,33 +1,236 @@
 # py-staticmaps
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
+import math
 import os
-import pathlib
+import threading
+import time
 import typing
 
-import requests
-import slugify  # type: ignore
+import appdirs  # type: ignore
 
-from .meta import GITHUB_URL, LIB_NAME, VERSION
+from .memory_cache import MemoryCache
+from .meta import LIB_NAME
+from .single_flight import SingleFlight
+from .tile_cache import FileTileCache, TileCache, TileDataT, TileIndexT, TileMetadata, sanitized_name
+from .tile_failures import FailureCache
+from .tile_fetcher import TileFetcher, TileStatusError
 from .tile_provider import TileProvider
 
+TileKeyT = typing.Tuple[str, int, int, int]
 
-class TileDownloader:
+
+def default_cache_dir() -> str:
+    """Return the default directory for cached tiles
+
+    :return: cache directory
+    :rtype: str
+    """
+    return os.path.join(appdirs.user_cache_dir(LIB_NAME), "tiles")
+
+
+class TileDownloader(TileFetcher):
     """A tile downloader class"""
 
+    # pylint: disable=too-many-instance-attributes
+
     def __init__(self) -> None:
-        self._user_agent = f"Mozilla/5.0+(compatible; {LIB_NAME}/{VERSION}; {GITHUB_URL})"
-        self._sanitized_name_cache: typing.Dict[str, str] = {}
+        super().__init__()
+        self._memory_cache: typing.Optional[MemoryCache[TileKeyT, TileDataT]] = None
+        # times (seconds since the epoch) the tiles of the memory cache expire, for providers with a cache ttl
+        self._memory_deadlines: typing.Dict[TileKeyT, float] = {}
+        self._memory_deadlines_lock = threading.Lock()
+        self._cache: typing.Optional[TileCache] = None
+        self._file_caches: typing.Dict[str, FileTileCache] = {}
+        self._max_cache_size: typing.Optional[int] = None
+        self._written = 0
+        self._written_lock = threading.Lock()
+        # cleanup of the persistent cache, running in the background while tiles are written, see _count_written
+        self._cleanup_thread: typing.Optional[threading.Thread] = None
+        self._cleanup_target: typing.Optional[TileCache] = None
+        self._failure_cache: typing.Optional[FailureCache[TileKeyT]] = None
+        self._flights: SingleFlight[typing.Tuple[str, TileKeyT], typing.Optional[TileDataT]] = SingleFlight()
+
+    def set_memory_cache(self, cache: typing.Optional[MemoryCache[TileKeyT, TileDataT]]) -> None:
+        """Set an in-memory tile cache that is consulted before the file cache
+
+        The cache is keyed by (provider name, zoom, x, y) and may be shared by several downloaders, e.g. as one
+        process-wide cache: MemoryCache(64 * 1024 * 1024, len)
+
+        :param cache: memory cache for tile data, None to disable the memory cache
+        :type cache: typing.Optional[MemoryCache[TileKeyT, TileDataT]]
+        """
+        self._memory_cache = cache
+
+    def memory_cache(self) -> typing.Optional[MemoryCache[TileKeyT, TileDataT]]:
+        """Return the in-memory tile cache
+
+        :return: memory cache for tile data
+        :rtype: typing.Optional[MemoryCache[TileKeyT, TileDataT]]
+        """
+        return self._memory_cache
+
+    def set_cache(self, cache: typing.Optional[TileCache]) -> None:
+        """Set the persistent tile cache backend
+
+        If no cache backend is set, tiles are stored as files in the cache directory passed to get (FileTileCache).
+
+        :param cache: tile cache backend, None to use the default file cache
+        :type cache: typing.Optional[TileCache]
+        """
+        self._cache = cache
+
+    def cache(self, cache_dir: typing.Optional[str]) -> typing.Optional[TileCache]:
+        """Return the persistent tile cache backend used for the given cache directory
+
+        :param cache_dir: cache directory for tiles
+        :type cache_dir: typing.Optional[str]
+        :return: the configured cache backend, a FileTileCache for the cache directory or None if there is neither
+        :rtype: typing.Optional[TileCache]
+        """
+        if self._cache is not None:
+            return self._cache
+        if cache_dir is None:
+            return None
+        cache = self._file_caches.get(cache_dir)
+        if cache is None:
+            cache = FileTileCache(cache_dir)
+            self._file_caches[cache_dir] = cache
+        return cache
+
+    def set_max_cache_size(self, max_bytes: typing.Optional[int]) -> None:
+        """Limit the size of the persistent tile cache
+
+        Whenever a tenth of the limit has been written to the cache, the least recently used tiles are removed until
+        the cache fits the limit again (see TileCache.cleanup). The cleanup runs in a background thread, so it does not
+        delay the tile requests; see wait_for_cleanup.
+
+        :param max_bytes: maximum size of the cached tiles in bytes, None for no limit
+        :type max_bytes: typing.Optional[int]
+        :raises ValueError: raises a value error for a non-positive size
+        """
+        if max_bytes is not None and max_bytes <= 0:
+            raise ValueError(f"Bad maximum cache size: {max_bytes}")
+        self._max_cache_size = max_bytes
 
-    def set_user_agent(self, user_agent: str) -> None:
-        """Set the user agent for the downloader
+    def max_cache_size(self) -> typing.Optional[int]:
+        """Return the size limit of the persistent tile cache
 
-        :param user_agent: user agent
-        :type user_agent: str
+        :return: maximum size of the cached tiles in bytes, None if there is no limit
+        :rtype: typing.Optional[int]
         """
-        self._user_agent = user_agent
+        return self._max_cache_size
+
+    def cleanup_cache(self, cache_dir: str) -> int:
+        """Remove the least recently used tiles until the persistent tile cache fits the maximum cache size
+
+        :param cache_dir: cache directory for tiles
+        :type cache_dir: str
+        :return: number of removed tiles
+        :rtype: int
+        """
+        cache = self.cache(cache_dir)
+        if cache is None or self._max_cache_size is None:
+            return 0
+        with self._written_lock:
+            self._written = 0
+        return cache.cleanup(self._max_cache_size)
+
+    def wait_for_cleanup(self, timeout: typing.Optional[float] = None) -> bool:
+        """Wait until the background cleanup of the persistent tile cache has finished
+
+        :param timeout: maximum time to wait in seconds, None to wait without limit
+        :type timeout: typing.Optional[float]
+        :return: whether no cleanup is running anymore
+        :rtype: bool
+        """
+        with self._written_lock:
+            thread = self._cleanup_thread
+        if thread is not None:
+            thread.join(timeout)
+            return not thread.is_alive()
+        return True
+
+    def set_failure_cache(self, cache: typing.Optional[FailureCache[TileKeyT]]) -> None:
+        """Set the negative cache remembering failed tile downloads, e.g. FailureCache(30.0) (default: None)
+
+        Negative caching is disabled by default, so every request for a missing tile reaches the tile server. Only
+        answers of the tile server rejecting a tile (4xx status codes except 429, e.g. 404 for ocean tiles) are
+        remembered; while a failure is remembered, getting the tile fails immediately without contacting the server.
+        Transport errors, server errors and requests rejected by a circuit breaker are never remembered.
+
+        :param cache: failure cache keyed by (provider name, zoom, x, y), None to disable negative caching (default)
+        :type cache: typing.Optional[FailureCache[TileKeyT]]
+        """
+        self._failure_cache = cache
+
+    def failure_cache(self) -> typing.Optional[FailureCache[TileKeyT]]:
+        """Return the negative cache remembering failed tile downloads
 
-    def get(self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int) -> typing.Optional[bytes]:
+        :return: failure cache, None if failed downloads are not remembered
+        :rtype: typing.Optional[FailureCache[TileKeyT]]
+        """
+        return self._failure_cache
+
+    def is_cached(self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int) -> bool:
+        """Return whether a tile is available without downloading it
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param cache_dir: cache directory for tiles
+        :type cache_dir: str
+        :param zoom: zoom level of the tile
+        :type zoom: int
+        :param x: x index of the tile
+        :type x: int
+        :param y: y index of the tile
+        :type y: int
+        :return: True if the tile is a fresh tile of the memory cache or the persistent cache
+        :rtype: bool
+        """
+        if self._from_memory(provider, (provider.name(), zoom, x, y)) is not None:
+            return True
+        cache = self.cache(cache_dir)
+        if cache is None or not cache.contains(provider, zoom, x, y):
+            return False
+        return not self._stale(provider, self._metadata(cache, provider, zoom, x, y))
+
+    def get_cached(
+        self, provider: TileProvider, cache_dir: str, tiles: typing.Iterable[TileIndexT]
+    ) -> typing.Dict[TileIndexT, TileDataT]:
+        """Return all tiles of a list of tiles that are available without downloading them
+
+        The persistent cache is queried for all tiles that are not in the memory cache at once; tiles that have to be
+        revalidated (see TileProvider.set_cache_ttl) are missing from the result.
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param cache_dir: cache directory for tiles
+        :type cache_dir: str
+        :param tiles: (zoom, x, y) indexes of the requested tiles
+        :type tiles: typing.Iterable[TileIndexT]
+        :return: tile data by (zoom, x, y); tiles that are not cached are missing
+        :rtype: typing.Dict[TileIndexT, TileDataT]
+        """
+        result: typing.Dict[TileIndexT, TileDataT] = {}
+        missing = []
+        for zoom, x, y in tiles:
+            data = self._from_memory(provider, (provider.name(), zoom, x, y))
+            if data is None:
+                missing.append((zoom, x, y))
+            else:
+                result[(zoom, x, y)] = data
+        cache = self.cache(cache_dir)
+        if missing and cache is not None:
+            for (zoom, x, y), data in cache.get_many(provider, missing).items():
+                metadata = self._metadata(cache, provider, zoom, x, y)
+                if self._stale(provider, metadata):
+                    continue
+                self._remember(provider, (provider.name(), zoom, x, y), data, metadata)
+                result[(zoom, x, y)] = data
+        return result
+
+    def get(self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int) -> typing.Optional[TileDataT]:
         """Get tiles
 
         :param provider: tile provider
@@ -41,30 +244,165 @@ class TileDownloader:
         :param y: y value of center for the static map
         :type y: int
         :return: tiles
-        :rtype: typing.Optional[bytes]
-        :raises RuntimeError: raises a runtime error if the the server response status is not 200
+        :rtype: typing.Optional[TileDataT]
+        :raises RuntimeError: raises a runtime error if the tile cannot be downloaded (or failed recently) and there is
+            no stale cached tile to fall back to
         """
-        file_name = None
-        if cache_dir is not None:
-            file_name = self.cache_file_name(provider, cache_dir, zoom, x, y)
-            if os.path.isfile(file_name):
-                with open(file_name, "rb") as f:
-                    return f.read()
+        key = (provider.name(), zoom, x, y)
+        data = self._from_memory(provider, key)
+        if data is not None:
+            return data
+        # concurrent requests of the same tile share one cache lookup and download
+        return self._flights.do((cache_dir, key), lambda: self._get(provider, cache_dir, key))
+
+    def coalesced(self) -> int:
+        """Return the number of tile requests that were served by a concurrent request of the same tile
+
+        :return: number of requests
+        :rtype: int
+        """
+        return self._flights.shared()
+
+    def _get(self, provider: TileProvider, cache_dir: str, key: TileKeyT) -> typing.Optional[TileDataT]:
+        _, zoom, x, y = key
+        cache = self.cache(cache_dir)
+        cached: typing.Optional[TileDataT] = None
+        metadata: typing.Optional[TileMetadata] = None
+        if cache is not None:
+            cached = cache.get(provider, zoom, x, y)
+            if cached is not None:
+                metadata = self._metadata(cache, provider, zoom, x, y)
+                if not self._stale(provider, metadata):
+                    self._remember(provider, key, cached, metadata)
+                    return cached
 
         url = provider.url(zoom, x, y)
         if url is None:
+            return cached
+        try:
+            downloaded, new_metadata = self._fetch_tile(provider, key, url, metadata)
+        except RuntimeError:
+            # serve the stale tile if the tile server is not available
+            if cached is None:
+                raise
+            return cached
+
+        if cache is not None:
+            self._store(cache, provider, (zoom, x, y), downloaded, new_metadata)
+        data = downloaded if downloaded is not None else cached
+        if data is not None:
+            self._remember(provider, key, data, new_metadata)
+        return data
+
+    def _from_memory(self, provider: TileProvider, key: TileKeyT) -> typing.Optional[TileDataT]:
+        if self._memory_cache is None:
             return None
-        res = requests.get(url, headers={"user-agent": self._user_agent}, timeout=10)
-        if res.status_code == 200:
-            data = res.content
+        data = self._memory_cache.get(key)
+        if data is None or provider.cache_ttl() is None:
+            return data
+        # tiles expire in memory like in the persistent cache
+        with self._memory_deadlines_lock:
+            deadline = self._memory_deadlines.get(key)
+        return data if deadline is not None and time.time() < deadline else None
+
+    def _remember(
+        self, provider: TileProvider, key: TileKeyT, data: TileDataT, metadata: typing.Optional[TileMetadata]
+    ) -> None:
+        if self._memory_cache is None:
+            return
+        self._memory_cache.put(key, data)
+        if provider.cache_ttl() is None:
+            return
+        deadline = self._deadline(provider, metadata)
+        with self._memory_deadlines_lock:
+            self._memory_deadlines[key] = math.inf if deadline is None else deadline
+            # forget the deadlines of tiles that were evicted from the memory cache
+            if len(self._memory_deadlines) > 2 * len(self._memory_cache) + 1024:
+                self._memory_deadlines = {k: v for k, v in self._memory_deadlines.items() if k in self._memory_cache}
+
+    def _fetch_tile(
+        self, provider: TileProvider, key: TileKeyT, url: str, metadata: typing.Optional[TileMetadata]
+    ) -> typing.Tuple[typing.Optional[bytes], TileMetadata]:
+        # fetch, guarded by the failure cache
+        if self._failure_cache is not None:
+            failure = self._failure_cache.get(key)
+            if failure is not None:
+                raise RuntimeError(f"{failure} (cached failure)")
+        try:
+            return self.fetch(provider, url, metadata)
+        except TileStatusError as e:
+            if self._failure_cache is not None and 400 <= e.status_code() < 500 and e.status_code() != 429:
+                self._failure_cache.put(key, str(e))
+            raise
+
+    def _store(
+        self,
+        cache: TileCache,
+        provider: TileProvider,
+        tile: TileIndexT,
+        data: typing.Optional[bytes],
+        metadata: TileMetadata,
+    ) -> None:
+        zoom, x, y = tile
+        if data is None:
+            cache.set_metadata(provider, zoom, x, y, metadata)
         else:
-            raise RuntimeError(f"fetch {url} yields {res.status_code}")
+            cache.put(provider, zoom, x, y, data, metadata=metadata)
+            self._count_written(cache, len(data))
 
-        if file_name is not None:
-            pathlib.Path(os.path.dirname(file_name)).mkdir(parents=True, exist_ok=True)
-            with open(file_name, "wb") as f:
-                f.write(data)
-        return data
+    @staticmethod
+    def _metadata(cache: TileCache, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        # freshness information of a cached tile, only looked up if the provider's tiles expire
+        if provider.cache_ttl() is None:
+            return None
+        return cache.metadata(provider, zoom, x, y)
+
+    @staticmethod
+    def _deadline(provider: TileProvider, metadata: typing.Optional[TileMetadata]) -> typing.Optional[float]:
+        # the time (seconds since the epoch) a cached tile has to be revalidated, None if it never expires;
+        # the max-age sent by the tile server takes precedence over the provider's ttl
+        ttl = provider.cache_ttl()
+        if ttl is None or metadata is None:
+            return None
+        max_age = metadata.max_age()
+        return metadata.fetched() + (ttl if max_age is None else max_age)
+
+    def _stale(self, provider: TileProvider, metadata: typing.Optional[TileMetadata]) -> bool:
+        deadline = self._deadline(provider, metadata)
+        return deadline is not None and time.time() >= deadline
+
+    def _count_written(self, cache: TileCache, size: int) -> None:
+        # walking the whole cache is slow, so the cleanup runs outside of the tile requests in a single background
+        # thread; tiles written while it runs are cleaned up by another pass of the same thread
+        if self._max_cache_size is None:
+            return
+        with self._written_lock:
+            self._written += size
+            if self._written < self._max_cache_size // 10:
+                return
+            self._cleanup_target = cache
+            if self._cleanup_thread is not None:
+                return
+            self._written = 0
+            self._cleanup_thread = threading.Thread(target=self._cleanup, name="staticmaps-cache-cleanup", daemon=True)
+            self._cleanup_thread.start()
+
+    def _cleanup(self) -> None:
+        while True:
+            with self._written_lock:
+                cache, max_bytes = self._cleanup_target, self._max_cache_size
+                if cache is None or max_bytes is None:
+                    self._cleanup_thread = None
+                    return
+                self._cleanup_target = None
+                self._written = 0
+            try:
+                cache.cleanup(max_bytes)
+            except BaseException:
+                # the error is reported by the thread, the next cleanup is started by later writes
+                with self._written_lock:
+                    self._cleanup_thread = None
+                raise
 
     def sanitized_name(self, name: str) -> str:
         """Return sanitized name
@@ -74,13 +412,7 @@ class TileDownloader:
         :return: sanitized name
         :rtype: str
         """
-        if name in self._sanitized_name_cache:
-            return self._sanitized_name_cache[name]
-        sanitized = slugify.slugify(name)
-        if sanitized is None:
-            sanitized = "_"
-        self._sanitized_name_cache[name] = sanitized
-        return sanitized
+        return sanitized_name(name)
 
     def cache_file_name(self, provider: TileProvider, cache_dir: str, zoom: int, x: int, y: int) -> str:
         """Return a cache file name
@@ -98,4 +430,4 @@ class TileDownloader:
         :return: cache file name
         :rtype: str
         """
-        return os.path.join(cache_dir, self.sanitized_name(provider.name()), str(zoom), str(x), f"{y}.png")
+        return FileTileCache(cache_dir).file_name(provider, zoom, x, y)
@@ -0,0 +1,181 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import threading
+import time
+import typing
+
+KeyT = typing.TypeVar("KeyT")
+
+
+class FailureCache(typing.Generic[KeyT]):
+    """A thread-safe negative cache remembering failed downloads (e.g. 404s for ocean tiles) for a while
+
+    :param ttl: time in seconds a failure is remembered
+    :param max_entries: maximum number of remembered failures; the oldest failures are forgotten first
+    :raises ValueError: raises value error for a non-positive time to live or number of entries
+    """
+
+    def __init__(self, ttl: float, max_entries: int = 100000) -> None:
+        if ttl <= 0:
+            raise ValueError(f"Bad failure ttl: {ttl}")
+        if max_entries < 1:
+            raise ValueError(f"Bad number of failure cache entries: {max_entries}")
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._entries: typing.Dict[KeyT, typing.Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+        self._hits = 0
+
+    def ttl(self) -> float:
+        """Return the time a failure is remembered
+
+        :return: time to live in seconds
+        :rtype: float
+        """
+        return self._ttl
+
+    def get(self, key: KeyT) -> typing.Optional[str]:
+        """Return the error of a recent failure
+
+        :param key: key of the failed download
+        :type key: KeyT
+        :return: error message, None if there was no failure within the time to live
+        :rtype: typing.Optional[str]
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._hits += 1
+            return entry[1]
+
+    def put(self, key: KeyT, error: str) -> None:
+        """Remember a failure
+
+        :param key: key of the failed download
+        :type key: KeyT
+        :param error: error message
+        :type error: str
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._entries.pop(key, None)
+            self._entries[key] = (now + self._ttl, error)
+            if len(self._entries) > self._max_entries:
+                self._entries = {k: v for k, v in self._entries.items() if v[0] > now}
+            while len(self._entries) > self._max_entries:
+                del self._entries[next(iter(self._entries))]
+
+    def clear(self) -> None:
+        """Forget all failures"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def hits(self) -> int:
+        """Return the number of downloads that were skipped because of a recent failure
+
+        :return: number of hits
+        :rtype: int
+        """
+        return self._hits
+
+
+class CircuitBreaker:
+    """Stop requests to a failing tile server, retrying with exponential backoff
+
+    After 'threshold' consecutive failures the circuit opens and requests are rejected for a backoff time, which
+    doubles with every further failure (starting at base_backoff, at most max_backoff). Once the backoff time has
+    passed a single trial request is allowed; if it succeeds, the circuit closes again.
+
+    :param threshold: number of consecutive failures opening the circuit
+    :param base_backoff: first backoff time in seconds
+    :param max_backoff: maximum backoff time in seconds
+    :raises ValueError: raises value error for a threshold < 1 or bad backoff times
+    """
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self, threshold: int = 5, base_backoff: float = 1.0, max_backoff: float = 300.0) -> None:
+        if threshold < 1:
+            raise ValueError(f"Bad circuit breaker threshold: {threshold}")
+        if base_backoff <= 0 or max_backoff < base_backoff:
+            raise ValueError(f"Bad circuit breaker backoff: {base_backoff}-{max_backoff}")
+        self._threshold = threshold
+        self._base_backoff = base_backoff
+        self._max_backoff = max_backoff
+        self._failures = 0
+        self._open_until = 0.0
+        self._trial = False
+        self._rejected = 0
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Return whether a request may be issued now
+
+        :return: False if the circuit is open
+        :rtype: bool
+        """
+        with self._lock:
+            if self._failures < self._threshold:
+                return True
+            if not self._trial and time.monotonic() >= self._open_until:
+                self._trial = True
+                return True
+            self._rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        """Record a successful request, closing the circuit"""
+        with self._lock:
+            self._failures = 0
+            self._trial = False
+
+    def record_failure(self) -> None:
+        """Record a failed request"""
+        with self._lock:
+            self._failures += 1
+            self._trial = False
+            if self._failures >= self._threshold:
+                backoff = self._base_backoff * 2 ** min(self._failures - self._threshold, 32)
+                self._open_until = time.monotonic() + min(self._max_backoff, backoff)
+
+    def is_open(self) -> bool:
+        """Return whether requests are currently rejected
+
+        :return: True if the circuit is open
+        :rtype: bool
+        """
+        return self._failures >= self._threshold
+
+    def retry_in(self) -> float:
+        """Return the time until the next trial request is allowed
+
+        :return: time in seconds (0 if requests are allowed)
+        :rtype: float
+        """
+        if not self.is_open():
+            return 0.0
+        return max(0.0, self._open_until - time.monotonic())
+
+    def failures(self) -> int:
+        """Return the number of consecutive failures
+
+        :return: number of failures
+        :rtype: int
+        """
+        return self._failures
+
+    def rejected(self) -> int:
+        """Return the number of rejected requests
+
+        :return: number of requests
+        :rtype: int
+        """
+        return self._rejected
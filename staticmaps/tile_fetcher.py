@@ -0,0 +1,318 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import contextlib
+import threading
+import time
+import typing
+import urllib.parse
+
+import requests
+import requests.adapters
+from urllib3.util.retry import Retry
+
+from .meta import GITHUB_URL, LIB_NAME, VERSION
+from .rate_limiter import RateLimiter
+from .tile_cache import TileMetadata
+from .tile_failures import CircuitBreaker
+from .tile_provider import TileProvider
+
+
+def parse_max_age(cache_control: typing.Optional[str]) -> typing.Optional[float]:
+    """Return the lifetime of a response from its Cache-Control header
+
+    :param cache_control: value of the Cache-Control header
+    :type cache_control: typing.Optional[str]
+    :return: max-age in seconds (0 for no-cache/no-store), None if the header does not specify a lifetime
+    :rtype: typing.Optional[float]
+    """
+    if cache_control is None:
+        return None
+    max_age = None
+    for directive in cache_control.split(","):
+        name, _, value = directive.strip().partition("=")
+        name = name.strip().lower()
+        if name in ("no-cache", "no-store"):
+            return 0.0
+        if name == "max-age":
+            try:
+                max_age = max(0.0, float(value.strip().strip('"')))
+            except ValueError:
+                pass
+    return max_age
+
+
+class TileStatusError(RuntimeError):
+    """A tile server answered a tile request with an unexpected status code (neither 200 nor 304)
+
+    :param message: error message
+    :param status_code: HTTP status code of the response
+    """
+
+    def __init__(self, message: str, status_code: int) -> None:
+        super().__init__(message)
+        self._status_code = status_code
+
+    def status_code(self) -> int:
+        """Return the status code of the response
+
+        :return: HTTP status code
+        :rtype: int
+        """
+        return self._status_code
+
+
+class TileFetcher:
+    """The HTTP side of tile downloading: persistent sessions, retries, timeouts, per-host circuit breakers, and the
+    rate limits and in-flight caps of the tile providers (see TileProvider.set_rate_limit/set_max_in_flight)"""
+
+    # pylint: disable=too-many-instance-attributes
+
+    def __init__(self) -> None:
+        self._user_agent = f"Mozilla/5.0+(compatible; {LIB_NAME}/{VERSION}; {GITHUB_URL})"
+        self._pool_size = 8
+        self._retries = 0
+        self._timeout = 10.0
+        self._sessions: typing.Dict[str, requests.Session] = {}
+        self._sessions_lock = threading.Lock()
+        self._circuit_breaker_settings: typing.Optional[typing.Tuple[int, float, float]] = (5, 1.0, 300.0)
+        self._circuit_breakers: typing.Dict[str, CircuitBreaker] = {}
+        self._rate_limiters: typing.Dict[str, RateLimiter] = {}
+        self._in_flight: typing.Dict[typing.Tuple[str, str], typing.Tuple[int, threading.BoundedSemaphore]] = {}
+        self._waited: typing.Dict[str, float] = {}
+
+    def set_user_agent(self, user_agent: str) -> None:
+        """Set the user agent for the downloader
+
+        :param user_agent: user agent
+        :type user_agent: str
+        """
+        self._user_agent = user_agent
+
+    def set_circuit_breaker(
+        self, threshold: typing.Optional[int], base_backoff: float = 1.0, max_backoff: float = 300.0
+    ) -> None:
+        """Configure the circuit breakers stopping requests to failing tile server hosts (see CircuitBreaker)
+
+        Connection errors, timeouts, 5xx and 429 responses count as failures of a host.
+
+        :param threshold: number of consecutive failures opening the circuit of a host, None to disable circuit
+            breaking (default: 5)
+        :type threshold: typing.Optional[int]
+        :param base_backoff: first backoff time in seconds (default: 1.0)
+        :type base_backoff: float
+        :param max_backoff: maximum backoff time in seconds (default: 300.0)
+        :type max_backoff: float
+        :raises ValueError: raises a value error for bad settings
+        """
+        if threshold is None:
+            self._circuit_breaker_settings = None
+        else:
+            CircuitBreaker(threshold, base_backoff, max_backoff)
+            self._circuit_breaker_settings = (threshold, base_backoff, max_backoff)
+        with self._sessions_lock:
+            self._circuit_breakers.clear()
+
+    def circuit_breaker(self, host: str) -> typing.Optional[CircuitBreaker]:
+        """Return the circuit breaker of a tile server host
+
+        :param host: host name (and port) of the tile server
+        :type host: str
+        :return: circuit breaker, None if circuit breaking is disabled
+        :rtype: typing.Optional[CircuitBreaker]
+        """
+        if self._circuit_breaker_settings is None:
+            return None
+        with self._sessions_lock:
+            breaker = self._circuit_breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(*self._circuit_breaker_settings)
+                self._circuit_breakers[host] = breaker
+            return breaker
+
+    def waited(self, provider: TileProvider) -> float:
+        """Return the total time requests to a tile provider waited for its rate limit and in-flight cap
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :return: time in seconds
+        :rtype: float
+        """
+        with self._sessions_lock:
+            return self._waited.get(provider.name(), 0.0)
+
+    def set_pool_size(self, pool_size: int) -> None:
+        """Set the maximum number of persistent connections per tile server host
+
+        :param pool_size: maximum number of connections per host
+        :type pool_size: int
+        :raises ValueError: raises a value error for a pool size < 1
+        """
+        if pool_size < 1:
+            raise ValueError(f"Bad connection pool size: {pool_size}")
+        self._pool_size = pool_size
+        self.close()
+
+    def set_retries(self, retries: int) -> None:
+        """Set the number of retries for failed tile requests
+
+        :param retries: number of retries (connection errors and 5xx server responses)
+        :type retries: int
+        :raises ValueError: raises a value error for a negative number of retries
+        """
+        if retries < 0:
+            raise ValueError(f"Bad number of retries: {retries}")
+        self._retries = retries
+        self.close()
+
+    def set_timeout(self, timeout: float) -> None:
+        """Set the timeout for tile requests
+
+        :param timeout: timeout in seconds
+        :type timeout: float
+        :raises ValueError: raises a value error for a non-positive timeout
+        """
+        if timeout <= 0:
+            raise ValueError(f"Bad timeout: {timeout}")
+        self._timeout = timeout
+
+    def close(self) -> None:
+        """Close all persistent connections of the downloader"""
+        with self._sessions_lock:
+            sessions = list(self._sessions.values())
+            self._sessions.clear()
+        for session in sessions:
+            session.close()
+
+    def session(self, provider: TileProvider) -> requests.Session:
+        """Return the HTTP session used for the tiles of the given provider
+
+        The session keeps persistent connections to each of the provider's hosts; its connection pools are sized to
+        the provider's shards and may be shared across threads.
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :return: HTTP session
+        :rtype: requests.Session
+        """
+        with self._sessions_lock:
+            session = self._sessions.get(provider.name())
+            if session is None:
+                adapter = requests.adapters.HTTPAdapter(
+                    pool_connections=max(1, len(provider.shards())),
+                    pool_maxsize=self._pool_size,
+                    max_retries=Retry(
+                        total=self._retries,
+                        backoff_factor=0.1,
+                        status_forcelist=[500, 502, 503, 504],
+                        raise_on_status=False,
+                    ),
+                )
+                session = requests.Session()
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                self._sessions[provider.name()] = session
+            return session
+
+    def fetch(
+        self, provider: TileProvider, url: str, metadata: typing.Optional[TileMetadata] = None
+    ) -> typing.Tuple[typing.Optional[bytes], TileMetadata]:
+        """Download a tile
+
+        If the metadata of a cached tile is given, the request is conditional (If-None-Match/If-Modified-Since). The
+        max-age of the Cache-Control header of the response is returned as part of the freshness information.
+
+        :param provider: tile provider
+        :type provider: TileProvider
+        :param url: url of the tile
+        :type url: str
+        :param metadata: freshness information of a cached version of the tile
+        :type metadata: typing.Optional[TileMetadata]
+        :return: tile data (None if the cached version is unchanged) and freshness information
+        :rtype: typing.Tuple[typing.Optional[bytes], TileMetadata]
+        :raises RuntimeError: raises a runtime error if the request fails or the circuit of the tile server's host is
+            open
+        :raises TileStatusError: raises a tile status error if the server response status is neither 200 nor 304
+        """
+        host = urllib.parse.urlsplit(url).netloc
+        breaker = self.circuit_breaker(host)
+        if breaker is not None and not breaker.allow():
+            raise RuntimeError(f"fetch {url} skipped: {host} is unavailable, retrying in {breaker.retry_in():.1f}s")
+        succeeded = False
+        try:
+            with self._request_slot(provider, host):
+                res = self.session(provider).get(url, headers=self._request_headers(metadata), timeout=self._timeout)
+            succeeded = res.status_code < 500 and res.status_code != 429
+        except requests.RequestException as e:
+            raise RuntimeError(f"fetch {url} fails: {e}") from e
+        finally:
+            # also on unexpected exceptions (e.g. KeyboardInterrupt), which must not leave a trial request pending
+            if breaker is not None:
+                if succeeded:
+                    breaker.record_success()
+                else:
+                    breaker.record_failure()
+        max_age = parse_max_age(res.headers.get("cache-control"))
+        if res.status_code == 304 and metadata is not None:
+            # a 304 response updates the stored headers it contains
+            return None, TileMetadata(
+                time.time(),
+                res.headers.get("etag", metadata.etag()),
+                res.headers.get("last-modified", metadata.last_modified()),
+                metadata.max_age() if max_age is None else max_age,
+            )
+        if res.status_code != 200:
+            raise TileStatusError(f"fetch {url} yields {res.status_code}", res.status_code)
+        return res.content, TileMetadata(
+            time.time(), res.headers.get("etag"), res.headers.get("last-modified"), max_age
+        )
+
+    def _request_headers(self, metadata: typing.Optional[TileMetadata]) -> typing.Dict[str, str]:
+        headers = {"user-agent": self._user_agent}
+        if metadata is not None:
+            etag, last_modified = metadata.etag(), metadata.last_modified()
+            if etag is not None:
+                headers["if-none-match"] = etag
+            if last_modified is not None:
+                headers["if-modified-since"] = last_modified
+        return headers
+
+    @contextlib.contextmanager
+    def _request_slot(self, provider: TileProvider, host: str) -> typing.Iterator[None]:
+        # wait for a free in-flight slot of the host, then for the provider's rate limit
+        start = time.monotonic()
+        semaphore, limiter = self._limits(provider, host)
+        if semaphore is not None:
+            semaphore.acquire()  # pylint: disable=consider-using-with
+        try:
+            if limiter is not None:
+                limiter.acquire()
+            waited = time.monotonic() - start
+            with self._sessions_lock:
+                self._waited[provider.name()] = self._waited.get(provider.name(), 0.0) + waited
+            yield
+        finally:
+            if semaphore is not None:
+                semaphore.release()
+
+    def _limits(
+        self, provider: TileProvider, host: str
+    ) -> typing.Tuple[typing.Optional[threading.BoundedSemaphore], typing.Optional[RateLimiter]]:
+        # the in-flight semaphore of the host and the rate limiter of the provider, following the provider's settings
+        semaphore = None
+        limiter = None
+        with self._sessions_lock:
+            max_in_flight = provider.max_in_flight()
+            if max_in_flight is not None:
+                entry = self._in_flight.get((provider.name(), host))
+                if entry is None or entry[0] != max_in_flight:
+                    entry = (max_in_flight, threading.BoundedSemaphore(max_in_flight))
+                    self._in_flight[(provider.name(), host)] = entry
+                semaphore = entry[1]
+            rate_limit = provider.rate_limit()
+            if rate_limit is not None:
+                limiter = self._rate_limiters.get(provider.name())
+                if limiter is None or (limiter.rate(), limiter.burst()) != rate_limit:
+                    limiter = RateLimiter(*rate_limit)
+                    self._rate_limiters[provider.name()] = limiter
+        return semaphore, limiter
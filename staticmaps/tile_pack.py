@@ -0,0 +1,232 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import mmap
+import os
+import struct
+import typing
+
+from .atomic_file import atomic_open
+from .tile_cache import TileCache, TileDataT, TileIndexT, TileMetadata, sanitized_name
+from .tile_provider import TileProvider
+
+# file layout: header | tile data ... | provider names (NUL separated) | index entries sorted by (provider, z, x, y)
+_MAGIC = b"STPK"
+_VERSION = 1
+_HEADER = struct.Struct("<4sIQQQI")  # magic, version, tile count, index offset, names offset, names length
+_ENTRY = struct.Struct("<IIIIQI")  # provider number, zoom, x, y, data offset, data length
+
+PackKeyT = typing.Tuple[str, int, int, int]
+
+
+def write_tile_pack(file_name: str, tiles: typing.Iterable[typing.Tuple[PackKeyT, bytes]]) -> int:
+    """Write a tile pack file
+
+    The tiles are keyed by (sanitized provider name, zoom, x, y), see tile_cache.sanitized_name.
+
+    :param file_name: name of the tile pack file
+    :type file_name: str
+    :param tiles: ((provider, zoom, x, y), data) pairs
+    :type tiles: typing.Iterable[typing.Tuple[PackKeyT, bytes]]
+    :return: number of packed tiles
+    :rtype: int
+    :raises ValueError: raises value error for duplicate tiles
+    """
+    entries: typing.Dict[PackKeyT, typing.Tuple[int, int]] = {}
+    # replace an existing pack atomically: processes that mapped it keep reading the old file
+    with atomic_open(file_name) as f:
+        f.write(b"\0" * _HEADER.size)
+        offset = _HEADER.size
+        for key, data in tiles:
+            if key in entries:
+                raise ValueError(f"Duplicate tile in tile pack: {key}")
+            f.write(data)
+            entries[key] = (offset, len(data))
+            offset += len(data)
+
+        names_length = _write_index(f, entries)
+        f.seek(0)
+        f.write(_HEADER.pack(_MAGIC, _VERSION, len(entries), offset + names_length, offset, names_length))
+    return len(entries)
+
+
+def _write_index(f: typing.IO[typing.Any], entries: typing.Dict[PackKeyT, typing.Tuple[int, int]]) -> int:
+    names = sorted({provider for provider, _, _, _ in entries})
+    numbers = {name: number for number, name in enumerate(names)}
+    names_data = b"\0".join(name.encode("utf-8") for name in names)
+    f.write(names_data)
+    for (provider, zoom, x, y), (offset, length) in sorted(entries.items()):
+        f.write(_ENTRY.pack(numbers[provider], zoom, x, y, offset, length))
+    return len(names_data)
+
+
+def file_cache_tiles(cache_dir: str) -> typing.Iterator[typing.Tuple[PackKeyT, bytes]]:
+    """Enumerate the tiles of a file tile cache (see FileTileCache), e.g. for writing them to a tile pack
+
+    :param cache_dir: cache directory
+    :type cache_dir: str
+    :return: ((provider, zoom, x, y), data) pairs
+    :rtype: typing.Iterator[typing.Tuple[PackKeyT, bytes]]
+    """
+    for provider in sorted(os.listdir(cache_dir)):
+        provider_dir = os.path.join(cache_dir, provider)
+        if not os.path.isdir(provider_dir):
+            continue
+        for root, _, files in os.walk(provider_dir):
+            parts = os.path.relpath(root, provider_dir).split(os.sep)
+            if len(parts) != 2 or not all(part.isdigit() for part in parts):
+                continue
+            zoom, x = int(parts[0]), int(parts[1])
+            for name in files:
+                y, extension = os.path.splitext(name)
+                if extension != ".png" or not y.isdigit():
+                    continue
+                with open(os.path.join(root, name), "rb") as f:
+                    yield (provider, zoom, x, int(y)), f.read()
+
+
+class TilePack:
+    """A read-only tile archive (one file with a sorted index) that is accessed via mmap
+
+    Tile data is returned as memoryview slices of the mapped file, i.e. without copying and without per-tile system
+    calls; worker processes opening the same pack share the pages of the operating system's page cache.
+
+    :param file_name: name of the tile pack file (see write_tile_pack)
+    :raises ValueError: raises value error if the file is not a tile pack
+    """
+
+    def __init__(self, file_name: str) -> None:
+        with open(file_name, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+        if len(self._view) < _HEADER.size:
+            raise ValueError(f"Not a tile pack: {file_name}")
+        magic, version, count, index_offset, names_offset, names_length = _HEADER.unpack_from(self._view, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError(f"Not a tile pack: {file_name}")
+        self._count = count
+        self._index_offset = index_offset
+        names_end = names_offset + names_length
+        names = bytes(self._view[names_offset:names_end]).decode("utf-8")
+        self._numbers = {name: number for number, name in enumerate(names.split("\0"))} if names else {}
+
+    def __len__(self) -> int:
+        return self._count
+
+    def get(self, provider: str, zoom: int, x: int, y: int) -> typing.Optional[memoryview]:
+        """Return the data of a tile
+
+        :param provider: sanitized name of the tile provider
+        :type provider: str
+        :param zoom: zoom level of the tile
+        :type zoom: int
+        :param x: x index of the tile
+        :type x: int
+        :param y: y index of the tile
+        :type y: int
+        :return: tile data (a read-only view into the tile pack), None if the tile is not in the pack
+        :rtype: typing.Optional[memoryview]
+        """
+        number = self._numbers.get(provider)
+        if number is None:
+            return None
+        key = (number, zoom, x, y)
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            entry = _ENTRY.unpack_from(self._view, self._index_offset + mid * _ENTRY.size)
+            if entry[:4] < key:
+                lo = mid + 1
+            elif entry[:4] > key:
+                hi = mid
+            else:
+                offset, length = entry[4], entry[5]
+                end = offset + length
+                return self._view[offset:end]
+        return None
+
+    def close(self) -> None:
+        """Unmap the tile pack
+
+        :raises BufferError: raises buffer error if views of tiles are still in use
+        """
+        self._view.release()
+        self._mmap.close()
+
+
+class TilePackCache(TileCache):
+    """A tile cache tier serving tiles from a tile pack, falling back to another cache (e.g. a FileTileCache)
+
+    New tiles are stored in the fallback cache; the tile pack itself is never modified, and its tiles never expire.
+
+    :param pack: tile pack
+    :param fallback: cache for tiles that are not in the pack
+    """
+
+    def __init__(self, pack: TilePack, fallback: typing.Optional[TileCache] = None) -> None:
+        self._pack = pack
+        self._fallback = fallback
+
+    def pack(self) -> TilePack:
+        """Return the tile pack
+
+        :return: tile pack
+        :rtype: TilePack
+        """
+        return self._pack
+
+    def get(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileDataT]:
+        data = self._pack.get(sanitized_name(provider.name()), zoom, x, y)
+        if data is None and self._fallback is not None:
+            return self._fallback.get(provider, zoom, x, y)
+        return data
+
+    def put(
+        self,
+        provider: TileProvider,
+        zoom: int,
+        x: int,
+        y: int,
+        data: bytes,
+        *,
+        metadata: typing.Optional[TileMetadata] = None,
+    ) -> None:
+        if self._fallback is not None:
+            self._fallback.put(provider, zoom, x, y, data, metadata=metadata)
+
+    def metadata(self, provider: TileProvider, zoom: int, x: int, y: int) -> typing.Optional[TileMetadata]:
+        if self._fallback is None or self._pack.get(sanitized_name(provider.name()), zoom, x, y) is not None:
+            return None
+        return self._fallback.metadata(provider, zoom, x, y)
+
+    def set_metadata(self, provider: TileProvider, zoom: int, x: int, y: int, metadata: TileMetadata) -> None:
+        if self._fallback is not None:
+            self._fallback.set_metadata(provider, zoom, x, y, metadata)
+
+    def cleanup(self, max_bytes: int) -> int:
+        return 0 if self._fallback is None else self._fallback.cleanup(max_bytes)
+
+    def contains(self, provider: TileProvider, zoom: int, x: int, y: int) -> bool:
+        if self._pack.get(sanitized_name(provider.name()), zoom, x, y) is not None:
+            return True
+        return self._fallback is not None and self._fallback.contains(provider, zoom, x, y)
+
+    def get_many(
+        self, provider: TileProvider, tiles: typing.Iterable[TileIndexT]
+    ) -> typing.Dict[TileIndexT, TileDataT]:
+        result: typing.Dict[TileIndexT, TileDataT] = {}
+        missing = []
+        name = sanitized_name(provider.name())
+        for zoom, x, y in tiles:
+            data = self._pack.get(name, zoom, x, y)
+            if data is None:
+                missing.append((zoom, x, y))
+            else:
+                result[(zoom, x, y)] = data
+        if missing and self._fallback is not None:
+            result.update(self._fallback.get_many(provider, missing))
+        return result
+
+    def close(self) -> None:
+        if self._fallback is not None:
+            self._fallback.close()
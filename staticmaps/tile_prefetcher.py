@@ -0,0 +1,108 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import asyncio
+import concurrent.futures
+import typing
+
+from .tile_cache import TileDataT
+from .transformer import Transformer
+
+DownloadT = typing.Callable[[int, int, int], typing.Optional[TileDataT]]
+CachedTilesT = typing.Mapping[typing.Tuple[int, int, int], TileDataT]
+AsyncDownloadT = typing.Callable[[int, int, int], typing.Awaitable[typing.Optional[TileDataT]]]
+
+
+def tile_keys(trans: Transformer) -> typing.List[typing.Tuple[int, int, int]]:
+    """Return the (zoom, x, y) keys of all tiles covering the map
+
+    :param trans: transformer of the map
+    :type trans: Transformer
+    :return: sorted list of unique tile keys
+    :rtype: typing.List[typing.Tuple[int, int, int]]
+    """
+    return sorted({(trans.zoom(), x, y) for _, _, x, y in trans.tiles()})
+
+
+def prefetch_tiles(
+    trans: Transformer, download: DownloadT, workers: int, cached: typing.Optional[CachedTilesT] = None
+) -> DownloadT:
+    """Fetch all tiles covering the map concurrently using a bounded thread pool
+
+    All downloads are finished when this function returns; the returned download function serves the prefetched
+    results (re-raising download errors) and falls back to 'download' for tiles outside of the tile grid.
+
+    :param trans: transformer of the map
+    :type trans: Transformer
+    :param download: (blocking) download function
+    :type download: DownloadT
+    :param workers: maximum number of concurrent downloads
+    :type workers: int
+    :param cached: data of tiles that are already available (these are not downloaded)
+    :type cached: typing.Optional[CachedTilesT]
+    :return: download function serving the prefetched tiles
+    :rtype: DownloadT
+    """
+    cached = cached if cached is not None else {}
+    keys = [key for key in tile_keys(trans) if key not in cached]
+    futures: typing.Dict[typing.Tuple[int, int, int], "concurrent.futures.Future[typing.Optional[TileDataT]]"] = {}
+    if keys:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(workers, len(keys))) as executor:
+            for key in keys:
+                futures[key] = executor.submit(download, *key)
+
+    def prefetched(z: int, x: int, y: int) -> typing.Optional[TileDataT]:
+        data = cached.get((z, x, y))
+        if data is not None:
+            return data
+        future = futures.get((z, x, y))
+        if future is None:
+            return download(z, x, y)
+        return future.result()
+
+    return prefetched
+
+
+async def prefetch_tiles_async(
+    trans: Transformer,
+    download_async: AsyncDownloadT,
+    download: DownloadT,
+    workers: int,
+    cached: typing.Optional[CachedTilesT] = None,
+) -> DownloadT:
+    """Fetch all tiles covering the map concurrently on the event loop
+
+    :param trans: transformer of the map
+    :type trans: Transformer
+    :param download_async: asynchronous download function
+    :type download_async: AsyncDownloadT
+    :param download: (blocking) download function for tiles outside of the tile grid
+    :type download: DownloadT
+    :param workers: maximum number of concurrent downloads
+    :type workers: int
+    :param cached: data of tiles that are already available (these are not downloaded)
+    :type cached: typing.Optional[CachedTilesT]
+    :return: download function serving the prefetched tiles
+    :rtype: DownloadT
+    """
+    semaphore = asyncio.Semaphore(workers)
+
+    async def fetch(z: int, x: int, y: int) -> typing.Optional[TileDataT]:
+        async with semaphore:
+            return await download_async(z, x, y)
+
+    cached = cached if cached is not None else {}
+    keys = [key for key in tile_keys(trans) if key not in cached]
+    results = await asyncio.gather(*[fetch(*key) for key in keys], return_exceptions=True)
+    tiles: typing.Dict[typing.Tuple[int, int, int], typing.Any] = dict(cached)
+    tiles.update(zip(keys, results))
+
+    def prefetched(z: int, x: int, y: int) -> typing.Optional[TileDataT]:
+        if (z, x, y) not in tiles:
+            return download(z, x, y)
+        result = tiles[(z, x, y)]
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+    return prefetched
@@ -8,6 +8,8 @@ import typing
 class TileProvider:
     """A tile provider class with several pre-defined tile providers"""
 
+    # pylint: disable=too-many-instance-attributes
+
     def __init__(
         self,
         name: str,
@@ -23,6 +25,9 @@ class TileProvider:
         self._api_key = api_key
         self._attribution = attribution
         self._max_zoom = max_zoom if ((max_zoom is not None) and (max_zoom <= 20)) else 20
+        self._cache_ttl: typing.Optional[float] = None
+        self._rate_limit: typing.Optional[typing.Tuple[float, int]] = None
+        self._max_in_flight: typing.Optional[int] = None
 
     def set_api_key(self, key: str) -> None:
         """Set an api key
@@ -32,6 +37,74 @@ class TileProvider:
         """
         self._api_key = key
 
+    def set_cache_ttl(self, ttl: typing.Optional[float]) -> None:
+        """Set the time after which cached tiles are revalidated with the tile server
+
+        Stale tiles are requested conditionally (If-None-Match/If-Modified-Since), so unchanged tiles are not
+        downloaded again. If the tile server sends a Cache-Control max-age, it takes precedence over the ttl; use
+        math.inf to only follow Cache-Control.
+
+        :param ttl: time to live of cached tiles without max-age in seconds, None to keep cached tiles forever (default)
+        :type ttl: typing.Optional[float]
+        :raises ValueError: raises value error for a negative time to live
+        """
+        if ttl is not None and ttl < 0:
+            raise ValueError(f"Bad cache ttl: {ttl}")
+        self._cache_ttl = ttl
+
+    def cache_ttl(self) -> typing.Optional[float]:
+        """Return the time after which cached tiles are revalidated with the tile server
+
+        :return: time to live of cached tiles in seconds, None if cached tiles are kept forever
+        :rtype: typing.Optional[float]
+        """
+        return self._cache_ttl
+
+    def set_rate_limit(self, requests_per_second: typing.Optional[float], burst: int = 1) -> None:
+        """Limit the rate of tile requests to the provider, e.g. to follow its tile usage policy
+
+        :param requests_per_second: maximum request rate, None for no limit (default)
+        :type requests_per_second: typing.Optional[float]
+        :param burst: maximum number of requests that may be issued at once
+        :type burst: int
+        :raises ValueError: raises value error for a non-positive rate or burst size
+        """
+        if requests_per_second is None:
+            self._rate_limit = None
+            return
+        if requests_per_second <= 0:
+            raise ValueError(f"Bad rate limit: {requests_per_second}")
+        if burst < 1:
+            raise ValueError(f"Bad burst size: {burst}")
+        self._rate_limit = (requests_per_second, burst)
+
+    def rate_limit(self) -> typing.Optional[typing.Tuple[float, int]]:
+        """Return the rate limit of tile requests to the provider
+
+        :return: maximum requests per second and burst size, None if there is no limit
+        :rtype: typing.Optional[typing.Tuple[float, int]]
+        """
+        return self._rate_limit
+
+    def set_max_in_flight(self, max_in_flight: typing.Optional[int]) -> None:
+        """Limit the number of concurrent tile requests to each host (shard) of the provider
+
+        :param max_in_flight: maximum number of requests in flight per host, None for no limit (default)
+        :type max_in_flight: typing.Optional[int]
+        :raises ValueError: raises value error for a limit < 1
+        """
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError(f"Bad number of requests in flight: {max_in_flight}")
+        self._max_in_flight = max_in_flight
+
+    def max_in_flight(self) -> typing.Optional[int]:
+        """Return the maximum number of concurrent tile requests to each host (shard) of the provider
+
+        :return: maximum number of requests in flight per host, None if there is no limit
+        :rtype: typing.Optional[int]
+        """
+        return self._max_in_flight
+
     def name(self) -> str:
         """Return the name of the tile provider
 
@@ -40,6 +113,30 @@ class TileProvider:
         """
         return self._name
 
+    def url_pattern(self) -> str:
+        """Return the url pattern of the tile provider
+
+        :return: url pattern of tile provider
+        :rtype: str
+        """
+        return self._url_pattern.template
+
+    def api_key(self) -> typing.Optional[str]:
+        """Return the api key of the tile provider
+
+        :return: api key if available
+        :rtype: typing.Optional[str]
+        """
+        return self._api_key
+
+    def shards(self) -> typing.List[str]:
+        """Return the shards of the tile provider
+
+        :return: shards of tile provider (empty if the provider is not sharded)
+        :rtype: typing.List[str]
+        """
+        return self._shards if self._shards is not None else []
+
     def attribution(self) -> typing.Optional[str]:
         """Return the attribution of the tile provider
 
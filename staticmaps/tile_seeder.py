@@ -0,0 +1,296 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import concurrent.futures
+import math
+import time
+import typing
+
+import s2sphere  # type: ignore
+
+from .rate_limiter import RateLimiter
+from .tile_downloader import TileDownloader
+from .tile_provider import TileProvider
+from .transformer import Transformer
+
+# latitude limit of the web mercator projection
+MAX_LATITUDE = math.degrees(math.atan(math.sinh(math.pi)))
+
+
+def seed_tile_ranges(
+    bounds: s2sphere.LatLngRect, zoom: int
+) -> typing.Tuple[typing.List[typing.Tuple[int, int]], typing.Tuple[int, int]]:
+    """Return the tile index ranges covering the bounds at the given zoom level
+
+    :param bounds: area to cover
+    :type bounds: s2sphere.LatLngRect
+    :param zoom: zoom level
+    :type zoom: int
+    :return: list of inclusive x ranges (two ranges if the bounds cross the antimeridian), inclusive y range
+    :rtype: typing.Tuple[typing.List[typing.Tuple[int, int]], typing.Tuple[int, int]]
+    """
+    n = 2**zoom
+    lat_lo = max(-MAX_LATITUDE, bounds.lat_lo().degrees)
+    lat_hi = min(MAX_LATITUDE, bounds.lat_hi().degrees)
+    x_lo, y_lo = Transformer.mercator(s2sphere.LatLng.from_degrees(lat_hi, bounds.lng_lo().degrees))
+    x_hi, y_hi = Transformer.mercator(s2sphere.LatLng.from_degrees(lat_lo, bounds.lng_hi().degrees))
+
+    def index(v: float) -> int:
+        return min(n - 1, max(0, int(math.floor(v * n))))
+
+    y_range = (index(y_lo), index(y_hi))
+    if bounds.lng().is_full():
+        return [(0, n - 1)], y_range
+    if bounds.lng().is_inverted():
+        return [(index(x_lo), n - 1), (0, index(x_hi))], y_range
+    return [(index(x_lo), index(x_hi))], y_range
+
+
+def seed_tile_keys(
+    bounds: s2sphere.LatLngRect, min_zoom: int, max_zoom: int
+) -> typing.Iterator[typing.Tuple[int, int, int]]:
+    """Enumerate the (zoom, x, y) keys of all tiles covering the bounds in the zoom range
+
+    :param bounds: area to cover
+    :type bounds: s2sphere.LatLngRect
+    :param min_zoom: minimum zoom level
+    :type min_zoom: int
+    :param max_zoom: maximum zoom level (inclusive)
+    :type max_zoom: int
+    :return: tile keys
+    :rtype: typing.Iterator[typing.Tuple[int, int, int]]
+    """
+    for zoom in range(min_zoom, max_zoom + 1):
+        x_ranges, (y_lo, y_hi) = seed_tile_ranges(bounds, zoom)
+        for x_lo, x_hi in x_ranges:
+            for x in range(x_lo, x_hi + 1):
+                for y in range(y_lo, y_hi + 1):
+                    yield zoom, x, y
+
+
+def count_seed_tiles(bounds: s2sphere.LatLngRect, min_zoom: int, max_zoom: int) -> int:
+    """Return the number of tiles covering the bounds in the zoom range
+
+    :param bounds: area to cover
+    :type bounds: s2sphere.LatLngRect
+    :param min_zoom: minimum zoom level
+    :type min_zoom: int
+    :param max_zoom: maximum zoom level (inclusive)
+    :type max_zoom: int
+    :return: number of tiles
+    :rtype: int
+    """
+    count = 0
+    for zoom in range(min_zoom, max_zoom + 1):
+        x_ranges, (y_lo, y_hi) = seed_tile_ranges(bounds, zoom)
+        count += sum(x_hi - x_lo + 1 for x_lo, x_hi in x_ranges) * (y_hi - y_lo + 1)
+    return count
+
+
+class SeedStats:
+    """Progress of a seeding run
+
+    :param total: number of tiles to process
+    """
+
+    def __init__(self, total: int) -> None:
+        self._total = total
+        self._cached = 0
+        self._downloaded = 0
+        self._failed = 0
+        self._bytes = 0
+        self._start = time.monotonic()
+        self._end: typing.Optional[float] = None
+
+    def total(self) -> int:
+        """Return the number of tiles to process
+
+        :return: number of tiles
+        :rtype: int
+        """
+        return self._total
+
+    def cached(self) -> int:
+        """Return the number of tiles that were already cached
+
+        :return: number of tiles
+        :rtype: int
+        """
+        return self._cached
+
+    def downloaded(self) -> int:
+        """Return the number of downloaded tiles
+
+        :return: number of tiles
+        :rtype: int
+        """
+        return self._downloaded
+
+    def failed(self) -> int:
+        """Return the number of tiles that could not be downloaded
+
+        :return: number of tiles
+        :rtype: int
+        """
+        return self._failed
+
+    def downloaded_bytes(self) -> int:
+        """Return the number of downloaded bytes
+
+        :return: number of bytes
+        :rtype: int
+        """
+        return self._bytes
+
+    def count_cached(self) -> None:
+        """Count a tile that was already cached"""
+        self._cached += 1
+
+    def count_downloaded(self, size: int) -> None:
+        """Count a downloaded tile
+
+        :param size: size of the tile data in bytes
+        :type size: int
+        """
+        self._downloaded += 1
+        self._bytes += size
+
+    def count_failed(self) -> None:
+        """Count a tile that could not be downloaded"""
+        self._failed += 1
+
+    def processed(self) -> int:
+        """Return the number of processed tiles
+
+        :return: number of cached, downloaded and failed tiles
+        :rtype: int
+        """
+        return self._cached + self._downloaded + self._failed
+
+    def elapsed(self) -> float:
+        """Return the duration of the seeding run
+
+        :return: time in seconds
+        :rtype: float
+        """
+        end = self._end if self._end is not None else time.monotonic()
+        return end - self._start
+
+    def tiles_per_second(self) -> float:
+        """Return the number of processed tiles per second
+
+        :return: throughput in tiles per second
+        :rtype: float
+        """
+        elapsed = self.elapsed()
+        return self.processed() / elapsed if elapsed > 0 else 0.0
+
+    def bytes_per_second(self) -> float:
+        """Return the number of downloaded bytes per second
+
+        :return: throughput in bytes per second
+        :rtype: float
+        """
+        elapsed = self.elapsed()
+        return self._bytes / elapsed if elapsed > 0 else 0.0
+
+    def finish(self) -> None:
+        """Stop the clock of the seeding run"""
+        self._end = time.monotonic()
+
+
+class TileSeeder:
+    """Fill the tile cache for an area and a zoom range, e.g. before rendering a large batch of maps
+
+    Tiles that are already cached are skipped; all other tiles are downloaded concurrently.
+
+    :param downloader: tile downloader
+    :param provider: tile provider
+    :param cache_dir: cache directory for tiles
+    """
+
+    def __init__(self, downloader: TileDownloader, provider: TileProvider, cache_dir: str) -> None:
+        self._downloader = downloader
+        self._provider = provider
+        self._cache_dir = cache_dir
+        self._workers = 8
+        self._rate_limiter: typing.Optional[RateLimiter] = None
+        self._progress: typing.Optional[typing.Callable[[SeedStats], None]] = None
+
+    def set_workers(self, workers: int) -> None:
+        """Set the maximum number of concurrent downloads
+
+        :param workers: number of worker threads
+        :type workers: int
+        :raises ValueError: raises value error for a worker count < 1
+        """
+        if workers < 1:
+            raise ValueError(f"Bad number of seed workers: {workers}")
+        self._workers = workers
+
+    def set_rate_limit(self, tiles_per_second: typing.Optional[float]) -> None:
+        """Limit the number of downloads per second
+
+        :param tiles_per_second: maximum download rate, None for no limit
+        :type tiles_per_second: typing.Optional[float]
+        :raises ValueError: raises value error for a non-positive rate
+        """
+        self._rate_limiter = None if tiles_per_second is None else RateLimiter(tiles_per_second)
+
+    def set_progress_callback(self, callback: typing.Optional[typing.Callable[[SeedStats], None]]) -> None:
+        """Set a function that is called with the current statistics after each processed tile
+
+        :param callback: progress callback
+        :type callback: typing.Optional[typing.Callable[[SeedStats], None]]
+        """
+        self._progress = callback
+
+    def seed(self, bounds: s2sphere.LatLngRect, min_zoom: int, max_zoom: int) -> SeedStats:
+        """Make sure all tiles covering the bounds in the zoom range are cached
+
+        :param bounds: area to cover
+        :type bounds: s2sphere.LatLngRect
+        :param min_zoom: minimum zoom level
+        :type min_zoom: int
+        :param max_zoom: maximum zoom level (inclusive)
+        :type max_zoom: int
+        :return: statistics of the seeding run
+        :rtype: SeedStats
+        :raises ValueError: raises value error for a bad zoom range
+        """
+        if min_zoom < 0 or max_zoom > self._provider.max_zoom() or min_zoom > max_zoom:
+            raise ValueError(f"Bad zoom range: {min_zoom}-{max_zoom}")
+
+        stats = SeedStats(count_seed_tiles(bounds, min_zoom, max_zoom))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self._workers) as executor:
+            pending: typing.Set[concurrent.futures.Future] = set()
+            for zoom, x, y in seed_tile_keys(bounds, min_zoom, max_zoom):
+                pending.add(executor.submit(self._seed_tile, zoom, x, y))
+                if len(pending) >= 4 * self._workers:
+                    done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    self._update(stats, done)
+            self._update(stats, concurrent.futures.wait(pending).done)
+        stats.finish()
+        return stats
+
+    def _seed_tile(self, zoom: int, x: int, y: int) -> typing.Optional[int]:
+        if self._downloader.is_cached(self._provider, self._cache_dir, zoom, x, y):
+            return None
+        if self._rate_limiter is not None:
+            self._rate_limiter.acquire()
+        data = self._downloader.get(self._provider, self._cache_dir, zoom, x, y)
+        return 0 if data is None else len(data)
+
+    def _update(self, stats: SeedStats, done: typing.Iterable[concurrent.futures.Future]) -> None:
+        for future in done:
+            try:
+                size = future.result()
+            except (RuntimeError, OSError):
+                stats.count_failed()
+            else:
+                if size is None:
+                    stats.count_cached()
+                else:
+                    stats.count_downloaded(size)
+            if self._progress is not None:
+                self._progress(stats)
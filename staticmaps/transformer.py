@@ -142,6 +142,20 @@ class Transformer:
         """
         return self._tile_size
 
+    def tiles(self) -> typing.Iterator[typing.Tuple[int, int, int, int]]:
+        """Return all tiles covering the image
+
+        :return: tuples (xx, yy, x, y) of the position within the tile grid and the (wrapped) tile index
+        :rtype: typing.Iterator[typing.Tuple[int, int, int, int]]
+        """
+        for yy in range(0, self._tiles_y):
+            y = self._first_tile_y + yy
+            if y < 0 or y >= self._number_of_tiles:
+                continue
+            for xx in range(0, self._tiles_x):
+                x = (self._first_tile_x + xx) % self._number_of_tiles
+                yield xx, yy, x, y
+
     @staticmethod
     def mercator(latlng: s2sphere.LatLng) -> typing.Tuple[float, float]:
         """Mercator projection
@@ -208,6 +222,55 @@ class Transformer:
         y = self._height / 2 + (y - self._tile_center_y) * s
         return x, y
 
+    def world_pixel_offset(self) -> typing.Tuple[float, float]:
+        """Return the offset of image pixel values relative to world pixel values (tile values * tile size)
+
+        :return: offset in pixels
+        :rtype: tuple
+        """
+        s = self._tile_size
+        return self._width / 2 - self._tile_center_x * s, self._height / 2 - self._tile_center_y * s
+
+    def ll2pixels(
+        self, latlngs: typing.Sequence[float], radians: bool = False
+    ) -> typing.List[typing.Tuple[float, float]]:
+        """Transform a flat sequence of latitude/longitude values (lat0, lng0, lat1, lng1, ...) into pixel values
+
+        This is equivalent to (but much faster than) calling ll2pixel for each coordinate pair.
+
+        :param latlngs: flat sequence of latitude/longitude values, e.g. an array('d')
+        :type latlngs: typing.Sequence[float]
+        :param radians: whether the values are given in radians (instead of degrees)
+        :type radians: bool
+        :return: pixel values of the given coordinates
+        :rtype: typing.List[typing.Tuple[float, float]]
+        :raises ValueError: raises value error if the values are not a flat sequence of pairs (e.g. a Nx2 array)
+        """
+        # pairing consecutive values would silently mix up the coordinates of nested sequences
+        if getattr(latlngs, "ndim", 1) != 1 or (len(latlngs) != 0 and hasattr(latlngs[0], "__len__")):
+            raise ValueError("Coordinates must be a flat sequence of latitude/longitude values")
+        if len(latlngs) % 2 != 0:
+            raise ValueError(f"Odd number of latitude/longitude values: {len(latlngs)}")
+        n = self._number_of_tiles
+        s = self._tile_size
+        cx = self._tile_center_x
+        cy = self._tile_center_y
+        w2 = self._width / 2
+        h2 = self._height / 2
+        pi = math.pi
+        two_pi = 2 * math.pi
+        tan = math.tan
+        cos = math.cos
+        log = math.log
+        values = iter(latlngs) if radians else map(math.radians, latlngs)
+        return [
+            (
+                w2 + (n * (lng / two_pi + 0.5) - cx) * s,
+                h2 + (n * ((1 - log(tan(lat) + (1 / cos(lat))) / pi) / 2) - cy) * s,
+            )
+            for lat, lng in zip(values, values)
+        ]
+
     def pixel2ll(self, x: float, y: float) -> s2sphere.LatLng:
         """Transform pixel values into LatLng values
 
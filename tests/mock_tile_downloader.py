@@ -17,3 +17,22 @@ class MockTileDownloader(staticmaps.TileDownloader):
         self, provider: staticmaps.TileProvider, cache_dir: str, zoom: int, x: int, y: int
     ) -> typing.Optional[bytes]:
         return self._dummy_image_data
+
+    def get_cached(
+        self, provider: staticmaps.TileProvider, cache_dir: str, tiles: typing.Iterable[typing.Tuple[int, int, int]]
+    ) -> typing.Dict[typing.Tuple[int, int, int], staticmaps.TileDataT]:
+        return {}
+
+
+class AsyncMockTileDownloader(staticmaps.AsyncTileDownloader):
+    def __init__(self) -> None:
+        super().__init__(MockTileDownloader())
+        self._dummy_image_data: typing.Optional[bytes] = None
+
+    def set_user_agent(self, user_agent: str) -> None:
+        pass
+
+    async def get(
+        self, provider: staticmaps.TileProvider, cache_dir: str, zoom: int, x: int, y: int
+    ) -> typing.Optional[bytes]:
+        return self._dummy_image_data
@@ -0,0 +1,59 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import os
+import pathlib
+
+import pytest  # type: ignore
+
+import staticmaps
+
+from .mock_tile_downloader import MockTileDownloader
+
+
+def test_read_jobs() -> None:
+    jobs = list(staticmaps.read_jobs(['{"width": 100}', "", '{"height": 50}']))
+    assert jobs == [{"width": 100}, {"height": 50}]
+    with pytest.raises(ValueError):
+        list(staticmaps.read_jobs(["[1, 2]"]))
+    with pytest.raises(ValueError):
+        list(staticmaps.read_jobs(["{"]))
+
+
+def test_context_from_spec() -> None:
+    context = staticmaps.context_from_spec(
+        {"marker": ["48,8", "47,7"], "line": [[48, 8, 47, 7]], "area": "48,8 47,7 47,8", "background": "white"}
+    )
+    bounds = context.object_bounds()
+    assert bounds is not None
+    assert bounds.lat_lo().degrees == pytest.approx(47)
+    assert bounds.lat_hi().degrees == pytest.approx(48)
+
+    with pytest.raises(ValueError):
+        staticmaps.context_from_spec({"markers": ["48,8"]})
+    with pytest.raises(ValueError):
+        staticmaps.context_from_spec({"tiles": "unknown"})
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_batch_renderer(tmp_path: pathlib.Path, workers: int) -> None:
+    specs = [
+        {"width": 100, "height": 50, "filename": str(tmp_path / f"map{i}.png"), "marker": [f"48,{7 + i / 10}"]}
+        for i in range(6)
+    ]
+    specs.insert(2, {"width": 100, "height": 50, "filename": str(tmp_path / "bad.png")})
+    specs.append({"width": 100, "height": 50, "filename": str(tmp_path / "map.svg"), "line": "48,8 47,7"})
+
+    renderer = staticmaps.BatchRenderer(workers, MockTileDownloader)
+    results = list(renderer.render(specs))
+    assert [r.index() for r in results] == list(range(len(specs)))
+    assert [r.ok() for r in results] == [i != 2 for i in range(len(specs))]
+    assert results[2].error() is not None
+    for r in results:
+        assert os.path.exists(r.file_name()) == r.ok()
+
+    unordered = list(renderer.render(specs, ordered=False))
+    assert sorted(r.index() for r in unordered) == list(range(len(specs)))
+
+    with pytest.raises(ValueError):
+        staticmaps.BatchRenderer(0)
@@ -1,12 +1,19 @@
 # py-staticmaps
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
+import asyncio
+import io
+import threading
+import time
+import typing
+
+from PIL import Image as PIL_Image  # type: ignore
 import pytest  # type: ignore
 import s2sphere  # type: ignore
 
 import staticmaps
 
-from .mock_tile_downloader import MockTileDownloader
+from .mock_tile_downloader import AsyncMockTileDownloader, MockTileDownloader
 
 
 def test_bounds() -> None:
@@ -55,3 +62,291 @@ def test_render_center_zoom() -> None:
     context.set_center(staticmaps.create_latlng(48, 8))
     context.set_zoom(15)
     context.render_svg(200, 100)
+
+
+def test_layout_cache() -> None:
+    context = staticmaps.Context()
+    context.add_object(staticmaps.Marker(staticmaps.create_latlng(48, 8)))
+    context.add_object(staticmaps.Marker(staticmaps.create_latlng(47, 7)))
+    trans = context.transformer(200, 100)
+    assert context.transformer(200, 100) is trans
+    assert context.transformer(400, 200) is not trans
+
+    context.set_background_color(staticmaps.WHITE)
+    assert context.transformer(200, 100) is trans
+
+    context.add_object(staticmaps.Marker(staticmaps.create_latlng(46, 6)))
+    trans2 = context.transformer(200, 100)
+    assert trans2 is not trans
+    assert trans2.zoom() < trans.zoom()
+
+    context.set_zoom(3)
+    assert context.transformer(200, 100).zoom() == 3
+
+
+def test_prefetch_tiles() -> None:
+    class RecordingTileDownloader(MockTileDownloader):
+        def __init__(self) -> None:
+            super().__init__()
+            self.requested: typing.List[typing.Tuple[int, int, int]] = []
+            self._lock = threading.Lock()
+
+        def get(
+            self, provider: staticmaps.TileProvider, cache_dir: str, zoom: int, x: int, y: int
+        ) -> typing.Optional[bytes]:
+            with self._lock:
+                self.requested.append((zoom, x, y))
+            return super().get(provider, cache_dir, zoom, x, y)
+
+    downloader = RecordingTileDownloader()
+    context = staticmaps.Context()
+    context.set_tile_downloader(downloader)
+    context.set_tile_fetch_workers(4)
+    context.set_center(staticmaps.create_latlng(48, 8))
+    context.set_zoom(15)
+    context.render_svg(800, 600)
+
+    trans = staticmaps.Transformer(800, 600, 15, staticmaps.create_latlng(48, 8), 256)
+    expected = sorted({(15, x, y) for _, _, x, y in trans.tiles()})
+    assert sorted(downloader.requested) == expected
+
+    with pytest.raises(ValueError):
+        context.set_tile_fetch_workers(0)
+
+
+def test_render_async() -> None:
+    context = staticmaps.Context()
+    context.set_async_tile_downloader(AsyncMockTileDownloader())
+    context.set_center(staticmaps.create_latlng(48, 8))
+    context.set_zoom(15)
+    context.add_object(staticmaps.Marker(staticmaps.create_latlng(48, 8)))
+    image = asyncio.run(context.render_pillow_async(200, 100))
+    assert image.size == (200, 100)
+    asyncio.run(context.render_svg_async(200, 100))
+
+    context = staticmaps.Context()
+    with pytest.raises(RuntimeError):
+        asyncio.run(context.render_svg_async(200, 100))
+
+
+def test_render_many(monkeypatch: typing.Any) -> None:
+    context = staticmaps.Context()
+    context.set_tile_downloader(MockTileDownloader())
+    line = staticmaps.Line([staticmaps.create_latlng(48, 8), staticmaps.create_latlng(47, 7)])
+    context.add_object(line)
+
+    images = context.render_many(200, 100, ["pillow", "svg"])
+    assert set(images.keys()) == {"pillow", "svg"}
+    assert images["pillow"].tobytes() == context.render_pillow(200, 100).tobytes()
+    assert images["svg"].tostring() == context.render_svg(200, 100).tostring()
+
+    projected = []
+    pixel_coordinates = staticmaps.Line.pixel_coordinates
+
+    def recording_pixel_coordinates(
+        self: staticmaps.Line, trans: staticmaps.Transformer, tolerance: float = 0.0
+    ) -> typing.List[typing.Tuple[float, float]]:
+        projected.append(self)
+        return pixel_coordinates(self, trans, tolerance)
+
+    # the renderers of one call share the projection of the line, which is not kept afterwards
+    monkeypatch.setattr(staticmaps.Line, "pixel_coordinates", recording_pixel_coordinates)
+    context.render_many(200, 100, ["pillow", "svg"])
+    assert projected == [line]
+    context.render_many(200, 100, ["pillow", "svg"])
+    assert projected == [line, line]
+
+    with pytest.raises(ValueError):
+        context.render_many(200, 100, ["pillow", "jpeg"])
+
+
+def test_mosaic_cache(monkeypatch: typing.Any) -> None:
+    class RecordingTileDownloader(MockTileDownloader):
+        def __init__(self) -> None:
+            super().__init__()
+            image = io.BytesIO()
+            PIL_Image.new("RGBA", (256, 256), (10, 20, 30, 255)).save(image, format="png")
+            self._dummy_image_data = image.getvalue()
+            self.requested = 0
+
+        def get(
+            self, provider: staticmaps.TileProvider, cache_dir: str, zoom: int, x: int, y: int
+        ) -> typing.Optional[bytes]:
+            self.requested += 1
+            return super().get(provider, cache_dir, zoom, x, y)
+
+    def render(color: staticmaps.Color) -> typing.Tuple[bytes, int]:
+        downloader = RecordingTileDownloader()
+        context = staticmaps.Context()
+        context.set_tile_downloader(downloader)
+        context.set_center(staticmaps.create_latlng(48, 8))
+        context.set_zoom(15)
+        context.add_object(staticmaps.Marker(staticmaps.create_latlng(48, 8), color=color))
+        return context.render_pillow(200, 100).tobytes(), downloader.requested
+
+    uncached, requested = render(staticmaps.RED)
+    assert requested > 0
+    tiles = requested
+
+    cache: staticmaps.MemoryCache[typing.Any, typing.Any] = staticmaps.MemoryCache(1024 * 1024, lambda _: 1)
+    monkeypatch.setattr(staticmaps.PillowRenderer, "_mosaic_cache", cache)
+    assert render(staticmaps.RED) == (uncached, requested)
+    assert len(cache) == 1
+    # same viewport, different objects: the basemap is reused and no tiles are fetched
+    image, requested = render(staticmaps.BLUE)
+    assert requested == 0
+    assert image != uncached
+    assert render(staticmaps.RED) == (uncached, 0)
+
+    # each cached basemap is stitched from the tiles again after its max age
+    now = time.time()
+    monkeypatch.setattr(staticmaps.renderer.time, "time", lambda: now)
+    monkeypatch.setattr(staticmaps.PillowRenderer, "_mosaic_max_age", 60.0)
+    now += 30
+    assert render(staticmaps.RED) == (uncached, 0)
+    now += 30
+    assert render(staticmaps.RED) == (uncached, tiles)
+    now += 59
+    assert render(staticmaps.BLUE)[1] == 0
+    now += 1
+    assert render(staticmaps.RED) == (uncached, tiles)
+
+    # providers serving different tiles under the same name do not share basemaps
+    trans = staticmaps.Transformer(200, 100, 15, staticmaps.create_latlng(48, 8), 256)
+    key = staticmaps.renderer.mosaic_key(trans, staticmaps.tile_provider_OSM, None)
+    other = staticmaps.TileProvider("osm", url_pattern="http://other/$z/$x/$y.png")
+    assert staticmaps.renderer.mosaic_key(trans, other, None) != key
+    keyed = staticmaps.TileProvider("osm", url_pattern=staticmaps.tile_provider_OSM.url_pattern(), api_key="secret")
+    assert staticmaps.renderer.mosaic_key(trans, keyed, None) != key
+
+
+def test_content_hash() -> None:
+    def context(color: staticmaps.Color) -> staticmaps.Context:
+        c = staticmaps.Context()
+        c.set_center(staticmaps.create_latlng(48, 8))
+        c.set_zoom(15)
+        c.add_object(staticmaps.Marker(staticmaps.create_latlng(48, 8), color=color))
+        c.add_object(staticmaps.Area([staticmaps.create_latlng(48, 8), staticmaps.create_latlng(48, 9)] * 2))
+        return c
+
+    content_hash = context(staticmaps.RED).content_hash(200, 100)
+    assert content_hash is not None
+    assert context(staticmaps.RED).content_hash(200, 100) == content_hash
+    assert context(staticmaps.BLUE).content_hash(200, 100) != content_hash
+    assert context(staticmaps.RED).content_hash(200, 101) != content_hash
+
+    c = context(staticmaps.RED)
+    c.add_object(staticmaps.Circle(staticmaps.create_latlng(48, 8), 1.5))
+    circle_hash = c.content_hash(200, 100)
+    assert circle_hash is not None and circle_hash != content_hash
+    c = context(staticmaps.RED)
+    c.add_object(staticmaps.Circle(staticmaps.create_latlng(48, 8), 2.0))
+    assert c.content_hash(200, 100) not in (None, circle_hash)
+
+    c = context(staticmaps.RED)
+    c.set_background_color(staticmaps.WHITE)
+    assert c.content_hash(200, 100) != content_hash
+
+    # providers that only differ in their url (e.g. the map style) render different maps
+    c = context(staticmaps.RED)
+    c.set_tile_provider(staticmaps.TileProvider("osm", "https://example.com/dark/$z/$x/$y.png"))
+    other = context(staticmaps.RED)
+    other.set_tile_provider(staticmaps.TileProvider("osm", "https://example.com/light/$z/$x/$y.png"))
+    assert c.content_hash(200, 100) != other.content_hash(200, 100)
+
+    # subclasses of the built-in objects may draw differently, so they do not inherit the content key
+    class CustomMarker(staticmaps.Marker):
+        pass
+
+    c = context(staticmaps.RED)
+    c.add_object(CustomMarker(staticmaps.create_latlng(48, 8)))
+    assert c.content_hash(200, 100) is None
+
+    class CustomObject(staticmaps.Object):
+        def extra_pixel_bounds(self) -> staticmaps.PixelBoundsT:
+            return 0, 0, 0, 0
+
+        def bounds(self) -> s2sphere.LatLngRect:
+            return s2sphere.LatLngRect.from_point(staticmaps.create_latlng(48, 8))
+
+    c.add_object(CustomObject())
+    assert c.content_hash(200, 100) is None
+
+
+def test_render_cache() -> None:
+    class CountingTileDownloader(MockTileDownloader):
+        def __init__(self) -> None:
+            super().__init__()
+            self.requested = 0
+
+        def get(
+            self, provider: staticmaps.TileProvider, cache_dir: str, zoom: int, x: int, y: int
+        ) -> typing.Optional[bytes]:
+            self.requested += 1
+            return super().get(provider, cache_dir, zoom, x, y)
+
+    downloader = CountingTileDownloader()
+    context = staticmaps.Context()
+    context.set_tile_downloader(downloader)
+    context.set_render_cache(staticmaps.RenderCache(1024 * 1024))
+    context.set_center(staticmaps.create_latlng(48, 8))
+    context.set_zoom(15)
+    context.add_object(staticmaps.Marker(staticmaps.create_latlng(48, 8)))
+
+    image = context.render_pillow(200, 100)
+    requested = downloader.requested
+    assert requested > 0
+    cached = context.render_pillow(200, 100)
+    assert cached is not image
+    assert cached.mode == image.mode
+    assert cached.tobytes() == image.tobytes()
+
+    svg = context.render_svg(200, 100).tostring()
+    cached_svg = context.render_svg(200, 100)
+    assert isinstance(cached_svg, staticmaps.CachedDrawing)
+    assert cached_svg.tostring() == svg
+    assert downloader.requested == 2 * requested
+
+    # render_many and the async variants use the same cache
+    results = context.render_many(200, 100, ["pillow", "svg"])
+    assert results["pillow"].tobytes() == image.tobytes()
+    assert results["svg"].tostring() == svg
+    assert asyncio.run(context.render_pillow_async(200, 100)).tobytes() == image.tobytes()
+    assert downloader.requested == 2 * requested
+    context.render_many(300, 100, ["pillow"])
+    requested = downloader.requested
+    assert asyncio.run(context.render_pillow_async(300, 100)).size == (300, 100)
+    assert downloader.requested == requested
+
+    # maps with circles are cached, too
+    context.add_object(staticmaps.Circle(staticmaps.create_latlng(48, 8), 0.1))
+    requested = downloader.requested
+    image = context.render_pillow(200, 100)
+    assert downloader.requested > requested
+    requested = downloader.requested
+    assert context.render_pillow(200, 100).tobytes() == image.tobytes()
+    assert downloader.requested == requested
+
+
+def test_write_svg() -> None:
+    def check(context: staticmaps.Context) -> None:
+        expected = io.StringIO()
+        context.render_svg(300, 200).write(expected)
+        streamed = io.StringIO()
+        context.write_svg(300, 200, streamed)
+        assert streamed.getvalue() == expected.getvalue()
+
+    downloader = MockTileDownloader()
+    context = staticmaps.Context()
+    context.set_tile_downloader(downloader)
+    context.set_background_color(staticmaps.WHITE)
+    context.set_zoom(1)
+    context.add_object(staticmaps.Marker(staticmaps.create_latlng(48, 179)))
+    context.add_object(staticmaps.Line([staticmaps.create_latlng(48, 8), staticmaps.create_latlng(47, 7)]))
+    context.add_object(staticmaps.Circle(staticmaps.create_latlng(-10, 20), 500))
+    check(context)
+
+    image = io.BytesIO()
+    PIL_Image.new("RGBA", (256, 256), (10, 20, 30, 255)).save(image, format="png")
+    downloader._dummy_image_data = image.getvalue()  # pylint: disable=protected-access
+    check(context)
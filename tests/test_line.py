@@ -1,7 +1,11 @@
 # py-staticmaps
 # Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
 
+from array import array
+import math
+
 import pytest
+import s2sphere  # type: ignore
 
 import staticmaps
 
@@ -30,3 +34,78 @@ def test_bounds() -> None:
         color=staticmaps.YELLOW,
     )
     assert not line.bounds().is_point()
+
+
+def test_simplify_polyline() -> None:
+    straight = [(float(i), 0.0) for i in range(100)]
+    assert staticmaps.simplify_polyline(straight, 0.5) == [(0.0, 0.0), (99.0, 0.0)]
+    spike = [(0.0, 0.0), (5.0, 0.0), (-3.0, 0.1), (10.0, 0.0)]
+    assert staticmaps.simplify_polyline(spike, 0.5) == spike
+    ring = [(0.0, 0.0), (10.0, 0.0), (10.0, 10.0), (0.0, 0.0)]
+    assert staticmaps.simplify_polyline(ring, 0.5) == ring
+    assert staticmaps.simplify_polyline(straight, 0) == straight
+
+
+def test_pixel_coordinates() -> None:
+    line = staticmaps.Line([staticmaps.create_latlng(48, 8 + i / 10000) for i in range(1000)])
+    trans = staticmaps.Transformer(200, 100, 10, staticmaps.create_latlng(48, 8.05), 256)
+    full = line.pixel_coordinates(trans)
+    simplified = line.pixel_coordinates(trans, 0.5)
+    assert len(full) == 1000
+    assert len(simplified) == 2
+    for a, b in zip(simplified, [full[0], full[-1]]):
+        assert a == pytest.approx(b)
+
+
+def test_flat_coordinates() -> None:
+    latlngs = [staticmaps.create_latlng(48, 8), staticmaps.create_latlng(49, 9), staticmaps.create_latlng(50, 8)]
+    flat = array("d", [48, 8, 49, 9, 50, 8])
+    line = staticmaps.Line(flat)
+    assert line.number_of_points() == 3
+    assert line.interpolate() == staticmaps.Line(latlngs).interpolate()
+    assert line.bounds() == staticmaps.Line(latlngs).bounds()
+
+    with pytest.raises(ValueError):
+        staticmaps.Line([48.0, 8.0, 49.0])
+    with pytest.raises(ValueError):
+        staticmaps.Line([48.0, 8.0])
+    with pytest.raises(ValueError):
+        staticmaps.Area([48.0, 8.0, 49.0, 9.0])
+    staticmaps.Area([48.0, 8.0, 49.0, 9.0, 50.0, 8.0])
+
+
+def test_bounds_antimeridian() -> None:
+    def union_bounds(line: staticmaps.Line) -> s2sphere.LatLngRect:
+        b = s2sphere.LatLngRect()
+        for latlng in line.interpolate():
+            b = b.union(s2sphere.LatLngRect.from_point(latlng.normalized()))
+        return b
+
+    lines = [
+        staticmaps.Line([staticmaps.create_latlng(48, 8), staticmaps.create_latlng(49, 9)]),
+        staticmaps.Line([staticmaps.create_latlng(10, 170), staticmaps.create_latlng(20, -170)]),
+        staticmaps.Line([staticmaps.create_latlng(10, -170), staticmaps.create_latlng(20, 170)]),
+        staticmaps.Line([staticmaps.create_latlng(-10, 200), staticmaps.create_latlng(20, 210)]),
+        staticmaps.Line(
+            [staticmaps.create_latlng(0, -90), staticmaps.create_latlng(1, 0), staticmaps.create_latlng(0, 90)]
+        ),
+    ]
+    for line in lines:
+        expected = union_bounds(line)
+        actual = line.bounds()
+        assert actual.lo().lat().degrees == pytest.approx(expected.lo().lat().degrees)
+        assert actual.lo().lng().degrees == pytest.approx(expected.lo().lng().degrees)
+        assert actual.hi().lat().degrees == pytest.approx(expected.hi().lat().degrees)
+        assert actual.hi().lng().degrees == pytest.approx(expected.hi().lng().degrees)
+        assert line.bounds() is actual
+
+    # the smallest interval may cross the antimeridian even if the points are spread around 0 and 180
+    coords = [math.radians(v) for v in [0, -160, 0, -20, 0, 30, 0, 150]]
+    bounds = staticmaps.latlngrect_from_radians(coords)
+    assert bounds.lng_lo().degrees == pytest.approx(-20)
+    assert bounds.lng_hi().degrees == pytest.approx(-160)
+
+    crossing = lines[1].bounds()
+    assert crossing.lng().is_inverted()
+    assert crossing.contains(staticmaps.create_latlng(15, 180))
+    assert not crossing.contains(staticmaps.create_latlng(15, 0))
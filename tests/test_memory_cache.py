@@ -0,0 +1,39 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import pytest  # type: ignore
+
+import staticmaps
+
+
+def test_lru_eviction() -> None:
+    cache: staticmaps.MemoryCache[str, bytes] = staticmaps.MemoryCache(10, len)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"
+    cache.put("c", b"1234")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"1234"
+    assert cache.get("c") == b"1234"
+    assert len(cache) == 2
+    assert cache.size_bytes() == 8
+    assert cache.hits() == 3
+    assert cache.misses() == 1
+    assert cache.evictions() == 1
+
+    cache.put("d", b"12345678901")
+    assert cache.get("d") is None
+    assert cache.size_bytes() == 8
+
+    cache.put("a", b"1234567")
+    assert cache.get("c") is None
+    assert cache.size_bytes() == 7
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.size_bytes() == 0
+
+
+def test_bad_creation() -> None:
+    with pytest.raises(ValueError):
+        staticmaps.MemoryCache(-1, len)
@@ -0,0 +1,64 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import io
+
+from PIL import Image as PIL_Image  # type: ignore
+
+import staticmaps
+
+
+def create_png(color: str, size: int = 4) -> bytes:
+    data = io.BytesIO()
+    PIL_Image.new("P", (size, size), color).save(data, format="PNG")
+    return data.getvalue()
+
+
+def test_image_cache() -> None:
+    old_cache = staticmaps.PillowRenderer.image_cache()
+    try:
+        cache: staticmaps.MemoryCache[bytes, PIL_Image.Image] = staticmaps.MemoryCache(
+            1024, lambda image: 4 * image.width * image.height
+        )
+        staticmaps.PillowRenderer.set_image_cache(cache)
+        red = create_png("red")
+        image = staticmaps.PillowRenderer.create_image(red)
+        assert image.mode == "RGBA"
+        assert image.getpixel((0, 0)) == (255, 0, 0, 255)
+        assert staticmaps.PillowRenderer.create_image(memoryview(bytes(red))) is image
+        assert staticmaps.PillowRenderer.create_image(create_png("blue")) is not image
+        assert cache.hits() == 1
+        assert cache.misses() == 2
+        # the cache is keyed by digests, so it does not keep the encoded images alive
+        assert red not in cache
+        assert staticmaps.renderer.image_key(red) in cache
+
+        staticmaps.PillowRenderer.set_image_cache(None)
+        assert staticmaps.PillowRenderer.create_image(red) is not image
+    finally:
+        staticmaps.PillowRenderer.set_image_cache(old_cache)
+
+
+def test_alpha_compose() -> None:
+    trans = staticmaps.Transformer(20, 10, 1, staticmaps.create_latlng(0, 0), 256)
+    renderer = staticmaps.PillowRenderer(trans)
+    renderer.render_background(staticmaps.WHITE)
+    overlay = PIL_Image.new("RGBA", (4, 4), (0, 0, 0, 255))
+    renderer.alpha_compose(overlay, (-2, 8))
+    renderer.alpha_compose(overlay, (30, 0))
+    image = renderer.image()
+    assert image.getpixel((0, 8)) == (0, 0, 0, 255)
+    assert image.getpixel((1, 9)) == (0, 0, 0, 255)
+    assert image.getpixel((2, 9)) == (255, 255, 255, 255)
+    assert image.getpixel((0, 7)) == (255, 255, 255, 255)
+
+
+def test_culling() -> None:
+    trans = staticmaps.Transformer(200, 100, 10, staticmaps.create_latlng(48, 8), 256)
+    renderer = staticmaps.PillowRenderer(trans)
+    visible = staticmaps.Marker(staticmaps.create_latlng(48, 8))
+    outside = staticmaps.Marker(staticmaps.create_latlng(40, 8))
+    renderer.render_objects([visible, outside])
+    assert renderer.culled_objects() == 1
+    assert renderer.culled_world_copies() == 5
+    assert renderer.visible_world_offsets(visible) == [0]
@@ -0,0 +1,56 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import os
+import typing
+
+import pytest  # type: ignore
+
+import staticmaps
+
+
+def test_stable_hash() -> None:
+    value = (1, 2.5, "a", b"\0", None, True, (3, ()))
+    assert staticmaps.stable_hash(value) == staticmaps.stable_hash(value)
+    assert staticmaps.stable_hash(("ab", "c")) != staticmaps.stable_hash(("a", "bc"))
+    assert staticmaps.stable_hash((1,)) != staticmaps.stable_hash((1.0,))
+    assert staticmaps.stable_hash((True,)) != staticmaps.stable_hash((1,))
+    assert staticmaps.stable_hash(("a",)) != staticmaps.stable_hash((b"a",))
+    assert staticmaps.stable_hash(((1, 2), 3)) != staticmaps.stable_hash((1, (2, 3)))
+    with pytest.raises(ValueError):
+        staticmaps.stable_hash((object(),))
+
+
+def test_render_cache_memory() -> None:
+    cache = staticmaps.RenderCache(10)
+    assert cache.get("a") is None
+    cache.put("a", b"12345")
+    cache.put("b", b"12345")
+    assert cache.get("a") == b"12345"
+    cache.put("c", b"12345")
+    assert cache.get("b") is None
+    assert cache.cleanup() == 0
+    with pytest.raises(RuntimeError):
+        cache.file_name("a")
+
+
+def test_render_cache_disk(tmp_path: typing.Any) -> None:
+    cache_dir = str(tmp_path)
+    cache = staticmaps.RenderCache(0, cache_dir, max_disk_bytes=1000)
+    cache.put("abcd", b"x" * 400)
+    assert os.path.isfile(os.path.join(cache_dir, "ab", "abcd"))
+    # a new cache (e.g. in another process) reads the files
+    cache = staticmaps.RenderCache(1000, cache_dir, max_disk_bytes=1000)
+    assert cache.get("abcd") == b"x" * 400
+    assert cache.memory_cache().size_bytes() == 400
+
+    cache.put("efgh", b"y" * 400)
+    os.utime(cache.file_name("abcd"), (1000, 1000))
+    # exceeding the limit removes the least recently used file
+    cache.put("ijkl", b"z" * 400)
+    assert not os.path.exists(cache.file_name("abcd"))
+    assert os.path.isfile(cache.file_name("efgh"))
+    assert os.path.isfile(cache.file_name("ijkl"))
+
+    with pytest.raises(ValueError):
+        staticmaps.RenderCache(0, cache_dir, max_disk_bytes=-1)
@@ -0,0 +1,43 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import concurrent.futures
+import threading
+import typing
+
+import pytest  # type: ignore
+
+import staticmaps
+
+
+def test_single_flight() -> None:
+    flights: staticmaps.SingleFlight[str, int] = staticmaps.SingleFlight()
+    release = threading.Event()
+    calls: typing.List[str] = []
+
+    def work() -> int:
+        calls.append("work")
+        release.wait(5)
+        return 42
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(flights.do, "key", work) for _ in range(4)]
+        while flights.shared() < 3:
+            threading.Event().wait(0.001)
+        release.set()
+        assert [future.result() for future in futures] == [42] * 4
+    assert calls == ["work"]
+
+    # later calls do the work again
+    assert flights.do("key", lambda: 7) == 7
+
+
+def test_single_flight_error() -> None:
+    flights: staticmaps.SingleFlight[str, int] = staticmaps.SingleFlight()
+
+    def fail() -> int:
+        raise RuntimeError("failed")
+
+    with pytest.raises(RuntimeError):
+        flights.do("key", fail)
+    assert flights.do("key", lambda: 1) == 1
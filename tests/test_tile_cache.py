@@ -0,0 +1,271 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import concurrent.futures
+import os
+import pathlib
+import sqlite3
+import typing
+
+import pytest  # type: ignore
+import requests
+
+import staticmaps
+
+from .test_tile_downloader import FakeResponse
+
+
+@pytest.mark.parametrize("cache_class", [staticmaps.FileTileCache, staticmaps.MBTilesCache])
+def test_tile_cache(tmp_path: pathlib.Path, cache_class: typing.Type[staticmaps.TileCache]) -> None:
+    cache = cache_class(str(tmp_path))  # type: ignore
+    provider = staticmaps.TileProvider("test provider", url_pattern="http://test/$z/$x/$y.png")
+    other = staticmaps.TileProvider("other", url_pattern="http://other/$z/$x/$y.png")
+    assert cache.get(provider, 2, 1, 0) is None
+    assert not cache.contains(provider, 2, 1, 0)
+
+    cache.put(provider, 2, 1, 0, b"a")
+    cache.put(provider, 2, 2, 3, b"b")
+    cache.put(provider, 2, 2, 3, b"c")
+    cache.put(other, 2, 1, 0, b"d")
+    assert cache.get(provider, 2, 1, 0) == b"a"
+    assert cache.get(provider, 2, 2, 3) == b"c"
+    assert cache.contains(provider, 2, 1, 0)
+    assert cache.get_many(provider, [(2, 1, 0), (2, 2, 3), (2, 2, 0), (3, 1, 0)]) == {(2, 1, 0): b"a", (2, 2, 3): b"c"}
+    assert cache.get_many(other, [(2, 1, 0)]) == {(2, 1, 0): b"d"}
+    cache.close()
+
+
+def test_mbtiles_layout(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.MBTilesCache(str(tmp_path))
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    cache.put(provider, 3, 1, 2, b"tile")
+    cache.close()
+
+    file_name = cache.file_name(provider)
+    assert os.path.isfile(file_name)
+    connection = sqlite3.connect(file_name)
+    # MBTiles stores tile rows in TMS order
+    assert connection.execute("SELECT zoom_level, tile_column, tile_row FROM tiles").fetchall() == [(3, 1, 5)]
+    assert ("name", "test") in connection.execute("SELECT name, value FROM metadata").fetchall()
+    connection.close()
+
+
+def test_downloader_cache_backend(monkeypatch: typing.Any, tmp_path: pathlib.Path) -> None:
+    requested: typing.List[str] = []
+
+    def fake_get(session: requests.Session, url: str, **kwargs: typing.Any) -> FakeResponse:
+        # pylint: disable=unused-argument
+        requested.append(url)
+        return FakeResponse(200, url.encode())
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    downloader = staticmaps.TileDownloader()
+    downloader.set_cache(staticmaps.MBTilesCache(str(tmp_path)))
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+
+    assert downloader.get(provider, "unused", 1, 0, 1) == b"http://test/1/0/1.png"
+    assert downloader.get(provider, "unused", 1, 0, 1) == b"http://test/1/0/1.png"
+    assert requested == ["http://test/1/0/1.png"]
+    assert downloader.is_cached(provider, "unused", 1, 0, 1)
+    assert downloader.get_cached(provider, "unused", [(1, 0, 1), (1, 1, 1)]) == {(1, 0, 1): b"http://test/1/0/1.png"}
+    assert "test.mbtiles" in os.listdir(tmp_path)
+
+
+@pytest.mark.parametrize("cache_class", [staticmaps.FileTileCache, staticmaps.MBTilesCache])
+def test_tile_cache_metadata(tmp_path: pathlib.Path, cache_class: typing.Type[staticmaps.TileCache]) -> None:
+    cache = cache_class(str(tmp_path))  # type: ignore
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    assert cache.metadata(provider, 2, 1, 0) is None
+
+    cache.put(provider, 2, 1, 0, b"a", metadata=staticmaps.TileMetadata(1000.0, '"v1"', None))
+    metadata = cache.metadata(provider, 2, 1, 0)
+    assert metadata is not None
+    assert metadata.fetched() == pytest.approx(1000.0)
+    assert metadata.etag() == '"v1"'
+    assert metadata.last_modified() is None
+
+    cache.set_metadata(provider, 2, 1, 0, staticmaps.TileMetadata(2000.0, None, "Tue, 01 Jun 2021 00:00:00 GMT"))
+    metadata = cache.metadata(provider, 2, 1, 0)
+    assert metadata is not None
+    assert metadata.fetched() == pytest.approx(2000.0)
+    assert metadata.etag() is None
+    assert metadata.last_modified() == "Tue, 01 Jun 2021 00:00:00 GMT"
+    assert metadata.max_age() is None
+    assert cache.get(provider, 2, 1, 0) == b"a"
+
+    cache.set_metadata(provider, 2, 1, 0, staticmaps.TileMetadata(3000.0, max_age=60.0))
+    metadata = cache.metadata(provider, 2, 1, 0)
+    assert metadata is not None and metadata.max_age() == 60.0
+    cache.close()
+
+
+def test_mbtiles_without_tile_info(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.MBTilesCache(str(tmp_path))
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    cache.put(provider, 2, 1, 0, b"a")
+    cache.close()
+    # e.g. tiles written by other MBTiles tools: their age is unknown, so they are revalidated
+    with sqlite3.connect(cache.file_name(provider)) as connection:
+        connection.execute("DELETE FROM tile_info")
+    cache = staticmaps.MBTilesCache(str(tmp_path))
+    metadata = cache.metadata(provider, 2, 1, 0)
+    assert metadata is not None and metadata.fetched() == 0
+    cache.close()
+
+
+def test_mbtiles_threads(tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.MBTilesCache(str(tmp_path))
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    for x in range(8):
+        cache.put(provider, 3, x, 0, bytes([x]))
+
+    def read(x: int) -> typing.Dict[typing.Tuple[int, int, int], typing.Any]:
+        # the tiles of a map crossing the antimeridian
+        return cache.get_many(provider, [(3, x, 0), (3, (x + 1) % 8, 0)])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(executor.map(read, range(8)))
+    for x, result in enumerate(results):
+        assert result == {(3, x, 0): bytes([x]), (3, (x + 1) % 8, 0): bytes([(x + 1) % 8])}
+    cache.close()
+    # connections are reopened after closing the cache
+    assert cache.get(provider, 3, 7, 0) == bytes([7])
+    cache.close()
+
+
+@pytest.mark.parametrize("cache_class", [staticmaps.FileTileCache, staticmaps.MBTilesCache])
+def test_tile_cache_cleanup(
+    monkeypatch: typing.Any, tmp_path: pathlib.Path, cache_class: typing.Type[staticmaps.TileCache]
+) -> None:
+    monkeypatch.setattr(staticmaps.tile_cache, "ACCESS_TIME_RESOLUTION", -1.0)
+    cache = cache_class(str(tmp_path))  # type: ignore
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    for x in range(4):
+        cache.put(provider, 2, x, 0, b"0123456789")
+    assert cache.get(provider, 2, 0, 0) is not None
+    assert cache.get(provider, 2, 2, 0) is not None
+
+    assert cache.cleanup(25) == 2
+    assert sorted(cache.get_many(provider, [(2, x, 0) for x in range(4)])) == [(2, 0, 0), (2, 2, 0)]
+    assert cache.cleanup(25) == 0
+    cache.close()
+
+
+def test_tile_cache_cleanup_metadata(monkeypatch: typing.Any, tmp_path: pathlib.Path) -> None:
+    monkeypatch.setattr(staticmaps.tile_cache, "ACCESS_TIME_RESOLUTION", -1.0)
+    cache = staticmaps.FileTileCache(str(tmp_path))
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    for x in range(2):
+        cache.put(provider, 2, x, 0, b"0123456789", metadata=staticmaps.TileMetadata(0.0, etag='"v1"'))
+    meta_size = os.path.getsize(f"{cache.file_name(provider, 2, 0, 0)}.meta")
+
+    # the metadata sidecar files count towards the size of the cache
+    assert cache.cleanup(20 + 2 * meta_size) == 0
+    assert cache.cleanup(20 + meta_size) == 1
+    assert not os.path.exists(f"{cache.file_name(provider, 2, 0, 0)}.meta")
+
+
+def test_downloader_revalidation(monkeypatch: typing.Any, tmp_path: pathlib.Path) -> None:
+    requests_headers: typing.List[typing.Dict[str, str]] = []
+    responses = [
+        FakeResponse(200, b"v1", {"ETag": '"v1"'}),
+        FakeResponse(304, b"", {"ETag": '"v1"'}),
+        FakeResponse(503),
+    ]
+
+    def fake_get(session: requests.Session, url: str, **kwargs: typing.Any) -> FakeResponse:
+        # pylint: disable=unused-argument
+        requests_headers.append(kwargs["headers"])
+        return responses.pop(0)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    downloader = staticmaps.TileDownloader()
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+
+    assert downloader.get(provider, str(tmp_path), 1, 0, 1) == b"v1"
+    assert downloader.get(provider, str(tmp_path), 1, 0, 1) == b"v1"
+    assert len(requests_headers) == 1
+    assert downloader.is_cached(provider, str(tmp_path), 1, 0, 1)
+
+    # every cached tile is stale: revalidate it, and serve it while the server fails
+    provider.set_cache_ttl(0)
+    assert not downloader.is_cached(provider, str(tmp_path), 1, 0, 1)
+    assert not downloader.get_cached(provider, str(tmp_path), [(1, 0, 1)])
+    assert downloader.get(provider, str(tmp_path), 1, 0, 1) == b"v1"
+    assert requests_headers[1]["if-none-match"] == '"v1"'
+    assert downloader.get(provider, str(tmp_path), 1, 0, 1) == b"v1"
+    assert len(requests_headers) == 3
+    with pytest.raises(ValueError):
+        provider.set_cache_ttl(-1)
+
+
+def test_downloader_cache_control(monkeypatch: typing.Any, tmp_path: pathlib.Path) -> None:
+    responses = [
+        FakeResponse(200, b"v1", {"ETag": '"v1"', "Cache-Control": "public, max-age=0"}),
+        FakeResponse(304, b"", {"Cache-Control": "max-age=3600"}),
+    ]
+    requested: typing.List[str] = []
+
+    def fake_get(session: requests.Session, url: str, **kwargs: typing.Any) -> FakeResponse:
+        # pylint: disable=unused-argument
+        requested.append(url)
+        return responses.pop(0)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    downloader = staticmaps.TileDownloader()
+    downloader.set_memory_cache(staticmaps.MemoryCache(1024, len))
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    provider.set_cache_ttl(3600)
+
+    # the max-age of the response takes precedence over the provider's ttl, also for the memory cache
+    assert downloader.get(provider, str(tmp_path), 1, 0, 1) == b"v1"
+    assert not downloader.is_cached(provider, str(tmp_path), 1, 0, 1)
+    assert downloader.get(provider, str(tmp_path), 1, 0, 1) == b"v1"
+    assert downloader.get(provider, str(tmp_path), 1, 0, 1) == b"v1"
+    assert len(requested) == 2
+    assert downloader.is_cached(provider, str(tmp_path), 1, 0, 1)
+
+
+def test_parse_max_age() -> None:
+    assert staticmaps.tile_fetcher.parse_max_age(None) is None
+    assert staticmaps.tile_fetcher.parse_max_age("public") is None
+    assert staticmaps.tile_fetcher.parse_max_age("public, Max-Age=600") == 600
+    assert staticmaps.tile_fetcher.parse_max_age('max-age="60"') == 60
+    assert staticmaps.tile_fetcher.parse_max_age("max-age=600, no-cache") == 0
+    assert staticmaps.tile_fetcher.parse_max_age("max-age=soon") is None
+
+
+def test_downloader_max_cache_size(monkeypatch: typing.Any, tmp_path: pathlib.Path) -> None:
+    def fake_get(session: requests.Session, url: str, **kwargs: typing.Any) -> FakeResponse:
+        # pylint: disable=unused-argument
+        return FakeResponse(200, b"0123456789")
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    downloader = staticmaps.TileDownloader()
+    downloader.set_max_cache_size(25)
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    for x in range(4):
+        downloader.get(provider, str(tmp_path), 2, x, 0)
+    assert downloader.wait_for_cleanup(10.0)
+    cached = [x for x in range(4) if downloader.is_cached(provider, str(tmp_path), 2, x, 0)]
+    assert len(cached) == 2
+
+    downloader.set_max_cache_size(5)
+    assert downloader.cleanup_cache(str(tmp_path)) == 2
+    with pytest.raises(ValueError):
+        downloader.set_max_cache_size(0)
+
+
+def test_atomic_put(monkeypatch: typing.Any, tmp_path: pathlib.Path) -> None:
+    cache = staticmaps.FileTileCache(str(tmp_path))
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    cache.put(provider, 2, 1, 0, b"old")
+
+    def failing_replace(src: str, dst: str) -> None:
+        raise OSError(f"cannot replace {dst} by {src}")
+
+    monkeypatch.setattr(os, "replace", failing_replace)
+    with pytest.raises(OSError):
+        cache.put(provider, 2, 1, 0, b"new")
+    assert cache.get(provider, 2, 1, 0) == b"old"
+    assert os.listdir(os.path.dirname(cache.file_name(provider, 2, 1, 0))) == ["0.png"]
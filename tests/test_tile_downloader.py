@@ -0,0 +1,202 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import concurrent.futures
+import os
+import threading
+import time
+import typing
+
+import pytest
+import requests
+import requests.adapters
+
+import staticmaps
+
+
+class FakeResponse:
+    def __init__(
+        self, status_code: int, content: bytes = b"", headers: typing.Optional[typing.Dict[str, str]] = None
+    ) -> None:
+        self.status_code = status_code
+        self.content = content
+        self.headers = requests.structures.CaseInsensitiveDict(headers or {})
+
+
+def http_adapter(session: requests.Session) -> requests.adapters.HTTPAdapter:
+    adapter = session.get_adapter("http://a.test")
+    assert isinstance(adapter, requests.adapters.HTTPAdapter)
+    return adapter
+
+
+def test_session_reuse(monkeypatch: typing.Any, tmp_path: typing.Any) -> None:
+    sessions: typing.List[requests.Session] = []
+
+    def fake_get(session: requests.Session, url: str, **kwargs: typing.Any) -> FakeResponse:
+        sessions.append(session)
+        assert kwargs["timeout"] == 5
+        return FakeResponse(200, url.encode())
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    downloader = staticmaps.TileDownloader()
+    downloader.set_timeout(5)
+    provider = staticmaps.TileProvider("test", url_pattern="http://$s.test/$z/$x/$y.png", shards=["a", "b"])
+    assert downloader.get(provider, str(tmp_path), 1, 0, 0) == b"http://a.test/1/0/0.png"
+    assert downloader.get(provider, str(tmp_path), 1, 1, 0) == b"http://b.test/1/1/0.png"
+    assert len(sessions) == 2
+    assert sessions[0] is sessions[1]
+    assert sessions[0] is downloader.session(provider)
+    assert http_adapter(downloader.session(provider)).max_retries.total == 0
+
+    downloader.set_retries(3)
+    assert downloader.session(provider) is not sessions[0]
+    assert http_adapter(downloader.session(provider)).max_retries.total == 3
+    downloader.close()
+
+
+def test_bad_settings() -> None:
+    downloader = staticmaps.TileDownloader()
+    with pytest.raises(ValueError):
+        downloader.set_pool_size(0)
+    with pytest.raises(ValueError):
+        downloader.set_retries(-1)
+    with pytest.raises(ValueError):
+        downloader.set_timeout(0)
+
+
+def test_memory_cache(tmp_path: typing.Any) -> None:
+    downloader = staticmaps.TileDownloader()
+    downloader.set_memory_cache(staticmaps.MemoryCache(1024, len))
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    file_name = downloader.cache_file_name(provider, str(tmp_path), 1, 0, 0)
+    os.makedirs(os.path.dirname(file_name))
+    with open(file_name, "wb") as f:
+        f.write(b"tile")
+
+    assert downloader.get(provider, str(tmp_path), 1, 0, 0) == b"tile"
+    os.remove(file_name)
+    assert downloader.get(provider, str(tmp_path), 1, 0, 0) == b"tile"
+    cache = downloader.memory_cache()
+    assert cache is not None
+    assert cache.hits() == 1
+    assert cache.misses() == 1
+
+
+def test_failures(monkeypatch: typing.Any, tmp_path: typing.Any) -> None:
+    requested: typing.List[str] = []
+
+    def fake_get(session: requests.Session, url: str, **kwargs: typing.Any) -> FakeResponse:
+        # pylint: disable=unused-argument
+        requested.append(url)
+        if "down.test" in url:
+            raise requests.ConnectionError("connection refused")
+        return FakeResponse(404)
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    downloader = staticmaps.TileDownloader()
+    assert downloader.failure_cache() is None
+    downloader.set_failure_cache(staticmaps.FailureCache(30.0))
+    downloader.set_circuit_breaker(2, base_backoff=60.0)
+    missing = staticmaps.TileProvider("missing", url_pattern="http://missing.test/$z/$x/$y.png")
+    down = staticmaps.TileProvider("down", url_pattern="http://down.test/$z/$x/$y.png")
+
+    # missing tiles are requested once, the host stays available
+    for _ in range(3):
+        with pytest.raises(RuntimeError):
+            downloader.get(missing, str(tmp_path), 1, 0, 0)
+    assert requested == ["http://missing.test/1/0/0.png"]
+    failures = downloader.failure_cache()
+    assert failures is not None and failures.hits() == 2
+    breaker = downloader.circuit_breaker("missing.test")
+    assert breaker is not None and not breaker.is_open()
+
+    # connection errors open the circuit of the host: further tiles fail without requests
+    for x in range(4):
+        with pytest.raises(RuntimeError):
+            downloader.get(down, str(tmp_path), 1, x, 0)
+    assert requested[1:] == ["http://down.test/1/0/0.png", "http://down.test/1/1/0.png"]
+    breaker = downloader.circuit_breaker("down.test")
+    assert breaker is not None and breaker.is_open() and breaker.rejected() == 2
+    # neither connection errors nor rejections by the circuit breaker are remembered
+    assert len(failures) == 1
+
+    with pytest.raises(ValueError):
+        downloader.set_circuit_breaker(0)
+
+
+def test_circuit_breaker_trial(monkeypatch: typing.Any) -> None:
+    def fake_get(session: requests.Session, url: str, **kwargs: typing.Any) -> FakeResponse:
+        # pylint: disable=unused-argument
+        raise ValueError("unexpected")
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    downloader = staticmaps.TileDownloader()
+    downloader.set_circuit_breaker(1, base_backoff=0.01)
+    provider = staticmaps.TileProvider("broken", url_pattern="http://broken.test/$z/$x/$y.png")
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            downloader.fetch(provider, "http://broken.test/1/0/0.png")
+        breaker = downloader.circuit_breaker("broken.test")
+        assert breaker is not None and breaker.is_open()
+        # the failed trial request does not block further trial requests
+        time.sleep(0.05)
+    assert breaker is not None and breaker.failures() == 2
+    assert breaker.allow()
+
+
+def test_coalescing(monkeypatch: typing.Any, tmp_path: typing.Any) -> None:
+    requested: typing.List[str] = []
+    release = threading.Event()
+
+    def fake_get(session: requests.Session, url: str, **kwargs: typing.Any) -> FakeResponse:
+        # pylint: disable=unused-argument
+        requested.append(url)
+        release.wait(5)
+        return FakeResponse(200, url.encode())
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    downloader = staticmaps.TileDownloader()
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(downloader.get, provider, str(tmp_path), 1, 0, 0) for _ in range(4)]
+        while downloader.coalesced() < 3:
+            threading.Event().wait(0.001)
+        release.set()
+        assert [future.result() for future in futures] == [b"http://test/1/0/0.png"] * 4
+    assert requested == ["http://test/1/0/0.png"]
+    assert os.listdir(os.path.dirname(downloader.cache_file_name(provider, str(tmp_path), 1, 0, 0))) == ["0.png"]
+
+
+def test_provider_limits(monkeypatch: typing.Any, tmp_path: typing.Any) -> None:
+    lock = threading.Lock()
+    in_flight = [0, 0]
+
+    def fake_get(session: requests.Session, url: str, **kwargs: typing.Any) -> FakeResponse:
+        # pylint: disable=unused-argument
+        with lock:
+            in_flight[0] += 1
+            in_flight[1] = max(in_flight)
+        threading.Event().wait(0.01)
+        with lock:
+            in_flight[0] -= 1
+        return FakeResponse(200, url.encode())
+
+    monkeypatch.setattr(requests.Session, "get", fake_get)
+    downloader = staticmaps.TileDownloader()
+    provider = staticmaps.TileProvider("test", url_pattern="http://test/$z/$x/$y.png")
+    provider.set_max_in_flight(2)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
+        list(executor.map(lambda x: downloader.get(provider, str(tmp_path), 3, x, 0), range(6)))
+    assert in_flight[1] <= 2
+
+    provider.set_max_in_flight(None)
+    provider.set_rate_limit(50.0)
+    assert provider.rate_limit() == (50.0, 1)
+    for x in range(5):
+        downloader.get(provider, str(tmp_path), 3, x, 1)
+    assert downloader.waited(provider) >= 0.07
+
+    with pytest.raises(ValueError):
+        provider.set_rate_limit(0)
+    with pytest.raises(ValueError):
+        provider.set_max_in_flight(0)
@@ -0,0 +1,67 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import time
+import typing
+
+import pytest  # type: ignore
+
+import staticmaps
+
+
+def test_failure_cache(monkeypatch: typing.Any) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    cache: staticmaps.FailureCache[str] = staticmaps.FailureCache(10.0, max_entries=2)
+    cache.put("a", "404")
+    assert cache.get("a") == "404"
+    assert cache.get("b") is None
+
+    now[0] += 5
+    cache.put("b", "500")
+    cache.put("c", "500")
+    assert len(cache) == 2
+    assert cache.get("a") is None
+    assert cache.get("c") == "500"
+    now[0] += 10
+    assert cache.get("b") is None
+    assert cache.hits() == 2
+
+    with pytest.raises(ValueError):
+        staticmaps.FailureCache(0)
+
+
+def test_circuit_breaker(monkeypatch: typing.Any) -> None:
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    breaker = staticmaps.CircuitBreaker(threshold=2, base_backoff=1.0, max_backoff=3.0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open()
+    assert not breaker.allow()
+    assert breaker.retry_in() == pytest.approx(1.0)
+
+    # a single trial request after the backoff; its failure doubles the backoff
+    now[0] += 1
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.retry_in() == pytest.approx(2.0)
+    now[0] += 2
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.retry_in() == pytest.approx(3.0)
+
+    now[0] += 3
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open()
+    assert breaker.allow()
+    assert breaker.failures() == 0
+    assert breaker.rejected() == 2
+
+    with pytest.raises(ValueError):
+        staticmaps.CircuitBreaker(threshold=0)
+    with pytest.raises(ValueError):
+        staticmaps.CircuitBreaker(base_backoff=2.0, max_backoff=1.0)
@@ -0,0 +1,73 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import io
+import pathlib
+
+from PIL import Image as PIL_Image  # type: ignore
+import pytest  # type: ignore
+
+import staticmaps
+
+
+def test_tile_pack(tmp_path: pathlib.Path) -> None:
+    file_name = str(tmp_path / "tiles.pack")
+    tiles = [(("osm", 2, x, y), f"{x}/{y}".encode()) for x in range(4) for y in range(4)]
+    tiles.append((("other", 2, 1, 1), b"other"))
+    assert staticmaps.write_tile_pack(file_name, reversed(tiles)) == 17
+
+    pack = staticmaps.TilePack(file_name)
+    assert len(pack) == 17
+    data = pack.get("osm", 2, 3, 1)
+    assert isinstance(data, memoryview)
+    assert data == b"3/1"
+    assert pack.get("other", 2, 1, 1) == b"other"
+    assert pack.get("osm", 2, 4, 0) is None
+    assert pack.get("osm", 3, 0, 0) is None
+    assert pack.get("unknown", 2, 0, 0) is None
+    del data
+    pack.close()
+
+    with pytest.raises(ValueError):
+        staticmaps.write_tile_pack(file_name, [(("osm", 0, 0, 0), b"a"), (("osm", 0, 0, 0), b"b")])
+    (tmp_path / "bad.pack").write_bytes(b"not a tile pack, but long enough for a header")
+    with pytest.raises(ValueError):
+        staticmaps.TilePack(str(tmp_path / "bad.pack"))
+
+
+def test_tile_pack_cache(tmp_path: pathlib.Path) -> None:
+    provider = staticmaps.TileProvider("Test Provider", url_pattern="http://test/$z/$x/$y.png")
+    file_cache = staticmaps.FileTileCache(str(tmp_path / "cache"))
+    file_cache.put(provider, 1, 0, 0, b"a")
+    file_cache.put(provider, 1, 1, 0, b"b")
+    pack_name = str(tmp_path / "tiles.pack")
+    assert staticmaps.write_tile_pack(pack_name, staticmaps.file_cache_tiles(file_cache.cache_dir())) == 2
+
+    cache = staticmaps.TilePackCache(staticmaps.TilePack(pack_name), file_cache)
+    file_cache.put(provider, 1, 1, 1, b"c")
+    assert isinstance(cache.get(provider, 1, 0, 0), memoryview)
+    assert cache.get(provider, 1, 1, 1) == b"c"
+    assert cache.contains(provider, 1, 1, 0)
+    assert not cache.contains(provider, 1, 0, 1)
+    assert cache.get_many(provider, [(1, 0, 0), (1, 1, 1), (1, 0, 1)]) == {(1, 0, 0): b"a", (1, 1, 1): b"c"}
+
+    cache.put(provider, 1, 0, 1, b"d")
+    assert file_cache.get(provider, 1, 0, 1) == b"d"
+
+    downloader = staticmaps.TileDownloader()
+    downloader.set_cache(cache)
+    assert downloader.get(provider, "unused", 1, 1, 0) == b"b"
+
+
+def test_render_from_tile_pack(tmp_path: pathlib.Path) -> None:
+    png = io.BytesIO()
+    PIL_Image.new("RGB", (256, 256), "red").save(png, format="PNG")
+    pack_name = str(tmp_path / "tiles.pack")
+    staticmaps.write_tile_pack(pack_name, [(("test", 0, 0, 0), png.getvalue())])
+    pack = staticmaps.TilePack(pack_name)
+    data = pack.get("test", 0, 0, 0)
+    assert data is not None
+
+    image = staticmaps.PillowRenderer.create_image(data)
+    assert image.getpixel((0, 0)) == (255, 0, 0, 255)
+    assert staticmaps.SvgRenderer.create_inline_image(data).startswith("data:image/png;base64,")
@@ -0,0 +1,83 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+import math
+import os
+import pathlib
+import threading
+import typing
+
+import pytest  # type: ignore
+import s2sphere  # type: ignore
+
+import staticmaps
+
+from .mock_tile_downloader import MockTileDownloader
+
+
+class CachingMockTileDownloader(MockTileDownloader):
+    def __init__(self) -> None:
+        super().__init__()
+        self.downloads = 0
+        self._lock = threading.Lock()
+
+    def get(
+        self, provider: staticmaps.TileProvider, cache_dir: str, zoom: int, x: int, y: int
+    ) -> typing.Optional[bytes]:
+        with self._lock:
+            self.downloads += 1
+        file_name = self.cache_file_name(provider, cache_dir, zoom, x, y)
+        os.makedirs(os.path.dirname(file_name), exist_ok=True)
+        with open(file_name, "wb") as f:
+            f.write(b"tile")
+        return b"tile"
+
+
+def test_seed_tile_keys() -> None:
+    world = s2sphere.LatLngRect.full()
+    assert list(staticmaps.seed_tile_keys(world, 0, 0)) == [(0, 0, 0)]
+    assert staticmaps.count_seed_tiles(world, 0, 3) == 1 + 4 + 16 + 64
+    assert len(list(staticmaps.seed_tile_keys(world, 0, 3))) == 1 + 4 + 16 + 64
+
+    freiburg = staticmaps.parse_latlngs2rect("47.9,7.7 48.1,7.9")
+    assert list(staticmaps.seed_tile_keys(freiburg, 10, 10)) == [
+        (10, 533, 355),
+        (10, 533, 356),
+        (10, 534, 355),
+        (10, 534, 356),
+    ]
+
+    # bounds crossing the antimeridian
+    pacific = s2sphere.LatLngRect(
+        s2sphere.LineInterval.from_point_pair(0, 0.1),
+        s2sphere.SphereInterval.from_point_pair(math.radians(170), math.radians(-170)),
+    )
+    assert pacific.lng().is_inverted()
+    keys = list(staticmaps.seed_tile_keys(pacific, 3, 3))
+    assert sorted({x for _, x, _ in keys}) == [0, 7]
+
+
+def test_tile_seeder(tmp_path: pathlib.Path) -> None:
+    downloader = CachingMockTileDownloader()
+    seeder = staticmaps.TileSeeder(downloader, staticmaps.tile_provider_OSM, str(tmp_path))
+    seeder.set_workers(4)
+    progress: typing.List[int] = []
+    seeder.set_progress_callback(lambda stats: progress.append(stats.processed()))
+    bounds = staticmaps.parse_latlngs2rect("47.9,7.7 48.1,7.9")
+
+    stats = seeder.seed(bounds, 0, 12)
+    assert stats.total() == staticmaps.count_seed_tiles(bounds, 0, 12)
+    assert stats.downloaded() == stats.total()
+    assert stats.downloaded_bytes() == 4 * stats.total()
+    assert downloader.downloads == stats.total()
+    assert progress == list(range(1, stats.total() + 1))
+
+    downloads = downloader.downloads
+    stats = seeder.seed(bounds, 0, 13)
+    assert stats.cached() == downloads
+    assert stats.downloaded() == stats.total() - stats.cached()
+
+    with pytest.raises(ValueError):
+        seeder.seed(bounds, 5, 4)
+    with pytest.raises(ValueError):
+        seeder.set_workers(0)
@@ -0,0 +1,24 @@
+# py-staticmaps
+# Copyright (c) 2020 Florian Pigorsch; see /LICENSE for licensing information
+
+from array import array
+import math
+
+import pytest  # type: ignore
+
+import staticmaps
+
+
+def test_ll2pixels() -> None:
+    trans = staticmaps.Transformer(800, 600, 12, staticmaps.create_latlng(48, 8), 256)
+    coords = [(48.0, 8.0), (47.5, 7.25), (-33.9, 151.2), (0.0, -179.9)]
+    expected = [trans.ll2pixel(staticmaps.create_latlng(lat, lng)) for lat, lng in coords]
+    flat = [v for c in coords for v in c]
+    assert trans.ll2pixels(flat) == expected
+    assert trans.ll2pixels(array("d", flat)) == expected
+    assert trans.ll2pixels([math.radians(v) for v in flat], radians=True) == expected
+    assert not trans.ll2pixels([])
+    with pytest.raises(ValueError):
+        trans.ll2pixels(flat[:-1])
+    with pytest.raises(ValueError):
+        trans.ll2pixels(coords)  # type: ignore